@@ -1,6 +1,8 @@
-from flask import Flask, render_template, jsonify, request, redirect, g
+from flask import Flask, render_template, jsonify, request, redirect, g, Response, stream_with_context
 import os
 import sys
+import functools
+import hmac
 import pandas as pd
 from dotenv import load_dotenv
 import re
@@ -13,13 +15,8 @@ print("DEBUG: app.py is being imported")
 
 
 
-# Cache for /api/orders
-order_cache = {
-    'data': None,
-    'timestamp': 0,
-    'sheet_name': None
-}
-CACHE_TTL = 10 # Seconds
+# /api/orders snapshots (see order_snapshots below)
+CACHE_TTL = 10 # Seconds before a snapshot is refreshed (stale ones are still served meanwhile)
 
 load_dotenv() # Load first!
 
@@ -33,10 +30,21 @@ from services.drive_service import DriveService
 from services.config_service import ConfigService
 from services.openai_service import OpenAIService
 from services.ai_factory import AIFactory
+from services.ai_base_service import AIBaseService
+from services.event_log import get_event_log, LEVELS
+from services.order_columns import column_renames
+from services.search_index import get_search_index
+from services.change_feed import get_change_feed, order_key
+from services.snapshot_cache import SnapshotCache
+from services.payload_cache import PayloadCache, negotiate_encoding
+from services.sheet_replica import get_sheet_replica
+from services.write_journal import get_write_journal, journal_in_use
+from services.accounting_service import accounting_summary
 from routes.bot import bot_bp
 
 # --- CONFIG & INIT ---
 app = Flask(__name__)
+events = get_event_log()
 print("DEBUG: Registering bot blueprint...")
 try:
     app.register_blueprint(bot_bp)
@@ -45,6 +53,13 @@ try:
 except Exception as e:
     print(f"❌ Error registering blueprint: {e}")
 
+# Resume extraction jobs left in the queue by a previous process (no-op with EXTRACTION_WORKER=external)
+try:
+    from routes.bot import ensure_inprocess_worker
+    ensure_inprocess_worker()
+except Exception as e:
+    print(f"❌ Error starting in-process extraction worker: {e}")
+
 # Config service remains singleton as it is read-only for most parts or file-based
 _config_service_instance = None
 
@@ -66,7 +81,7 @@ def get_services():
         
         current_sheet = sheet_service.sheet.title if sheet_service.sheet else ""
         if current_sheet != sheet_name:
-            print(f"DEBUG: App sheet mismatch. Switching from {current_sheet} to {sheet_name}")
+            events.info('sheet_switch', source='app', from_sheet=current_sheet, to_sheet=sheet_name)
             sheet_service.set_worksheet(sheet_name)
         return sheet_service, drive_service
 
@@ -80,7 +95,7 @@ def get_services():
         creds_source = auth_service.get_google_credentials()
     except Exception as e:
         g.last_error = f"Auth Error: {str(e)}"
-        print(f"❌ {g.last_error}")
+        events.error('auth_failed', error=str(e))
         return None, None
     sheet_id = os.getenv('GOOGLE_SHEET_ID')
 
@@ -92,26 +107,17 @@ def get_services():
             g.last_error = "SheetService failed to connect to any worksheet."
             return None, None
 
-        # Sync folder mapping from Google Sheets (persistent across deploys)
-        try:
-            cfg.sync_from_gsheets(g.sheet_service.client, sheet_id)
-        except Exception as sync_err:
-            print(f"DEBUG: sync_from_gsheets skipped: {sync_err}")
-
+        # _GravityConfig / _GravityShops are refreshed by config_sync_loop, not per request
         return g.sheet_service, g.drive_service
     except Exception as e:
         g.last_error = f"Service Init Failed: {str(e)}"
-        print(f"❌ {g.last_error}")
-        import traceback
-        traceback.print_exc()
+        events.exception('service_init_failed', error=str(e))
         return None, None
 
 @app.errorhandler(Exception)
 def handle_exception(e):
     """Global error handler for all unexpected exceptions."""
-    print(f"🔥 Global Error: {e}")
-    import traceback
-    traceback.print_exc()
+    events.exception('unhandled_error', path=request.path, error=str(e))
     return jsonify({
         "error": "Internal Server Error",
         "message": str(e)
@@ -144,6 +150,60 @@ def keep_alive_ping():
 if os.getenv('RENDER') or os.getenv('KEEP_ALIVE'):
     threading.Thread(target=keep_alive_ping, daemon=True).start()
 
+# --- CONFIG SYNC ---
+def config_sync_loop():
+    """
+    Background pull of _GravityConfig (folder mapping) and _GravityShops (custom shop names).
+    Config sync is versioned: an unchanged tab costs one small read per tick.
+    """
+    import services.auth_service as auth_service
+
+    interval = int(os.getenv('CONFIG_SYNC_INTERVAL', 60))
+    sheet_id = os.getenv('GOOGLE_SHEET_ID')
+    while True:
+        try:
+            client = auth_service.get_credential_manager().gspread_client()
+            get_config_service().sync_from_gsheets(client, sheet_id)
+            # Throttled inside the registry (reload_interval)
+            AIBaseService.shop_matcher_registry().sync_from_gsheets(client, sheet_id)
+        except Exception as e:
+            events.warning('config_sync_failed', error=str(e))
+        time.sleep(interval)
+
+if os.getenv('GOOGLE_SHEET_ID') and os.getenv('CONFIG_SYNC_INTERVAL', '60') != '0':
+    threading.Thread(target=config_sync_loop, daemon=True).start()
+
+def analytics_refresh(force=False):
+    """Pulls changed month tabs into the local analytics store (see services/analytics_store.py)."""
+    import services.auth_service as auth_service
+    from services.analytics_store import get_analytics_store
+    client = auth_service.get_credential_manager().gspread_client()
+    return get_analytics_store().refresh(client, os.getenv('GOOGLE_SHEET_ID'), force=force)
+
+def analytics_sync_loop():
+    """Background refresh of the analytics store; a tick with no spreadsheet change costs one Drive metadata call."""
+    interval = int(os.getenv('ANALYTICS_SYNC_INTERVAL', 900))
+    time.sleep(60)  # Let startup traffic go first
+    while True:
+        try:
+            analytics_refresh()
+        except Exception as e:
+            events.warning('analytics_sync_failed', error=str(e))
+        time.sleep(interval)
+
+if os.getenv('GOOGLE_SHEET_ID') and os.getenv('ANALYTICS_SYNC_INTERVAL', '900') != '0':
+    threading.Thread(target=analytics_sync_loop, daemon=True).start()
+
+def write_journal_client():
+    """gspread client for the write-behind flusher (same credentials as the order loader)."""
+    import services.auth_service as auth_service
+    return SheetService(auth_service.get_google_credentials(), os.getenv('GOOGLE_SHEET_ID'))._get_client()
+
+# Flush writes journaled before a restart without waiting for the next sheet mutation
+# (also when write-behind has been switched off since: those writes still have to reach the sheet)
+if os.getenv('GOOGLE_SHEET_ID') and journal_in_use():
+    get_write_journal().start(write_journal_client)
+
 # ...
 
 # --- ROUTES ---
@@ -175,24 +235,32 @@ def process_drive_image(link):
 
 @app.route('/api/proxy_image/<file_id>')
 def proxy_image(file_id):
-    _, drive_service = get_services()
-    if not drive_service: return jsonify({'error': 'Service unavailable'}), 500
-    
+    # Only Drive is needed here: skip get_services(), which also opens the spreadsheet
+    import services.auth_service as auth_service
     try:
-        content = drive_service.get_file_content(file_id)
-        if content:
-            from flask import send_file
-            from io import BytesIO
-            return send_file(BytesIO(content), mimetype='image/jpeg') # Assume JPEG for now
-        else:
-             return "Image not found", 404
+        drive_service = DriveService(auth_service.get_google_credentials())
     except Exception as e:
-        print(f"Proxy Error: {e}")
+        events.error('auth_failed', error=str(e))
+        return jsonify({'error': 'Service unavailable'}), 500
+
+    try:
+        # Piped through in STREAM_CHUNK_SIZE pieces: first bytes reach the browser at once, memory stays flat
+        opened = drive_service.open_media_stream(file_id, request.headers)
+        if opened is None:
+            return "Image not found", 404
+        status, headers, chunks = opened
+        headers.setdefault('Content-Type', 'application/octet-stream')
+        headers['Accept-Ranges'] = 'bytes'
+        # Re-uploads get a new file id, so a file id's content never changes
+        headers['Cache-Control'] = 'private, max-age=86400'
+        return Response(stream_with_context(chunks), status=status, headers=headers)
+    except Exception as e:
+        events.error('proxy_image_failed', file_id=file_id, error=str(e))
         return str(e), 500
 
 @app.route('/')
 def index():
-    print("DEBUG: Index request received")
+    events.debug('index_request')
     return render_template('index_v2.html')
 
 @app.route('/login')
@@ -312,6 +380,78 @@ def oauth2callback():
 def health():
     return "OK", 200
 
+@app.route('/metrics')
+def metrics():
+    # Prometheus scrape endpoint: per-stage latency / payload histograms of the bot pipeline
+    from flask import Response
+    from services.metrics_service import get_metrics
+    return Response(get_metrics().render_prometheus(), mimetype='text/plain; version=0.0.4')
+
+def debug_token_required(view):
+    """Guards debug endpoints with DEBUG_TOKEN (X-Debug-Token header or ?token=). Unset -> always 403."""
+    @functools.wraps(view)
+    def wrapper(*args, **kwargs):
+        expected = os.getenv('DEBUG_TOKEN', '').strip()
+        given = request.headers.get('X-Debug-Token') or request.args.get('token', '')
+        if not expected or not hmac.compare_digest(given.encode('utf-8'), expected.encode('utf-8')):
+            return jsonify({'error': 'Forbidden'}), 403
+        return view(*args, **kwargs)
+    return wrapper
+
+def int_arg(name, default=None, minimum=None):
+    """Integer query parameter; ValueError (-> 400) instead of a 500 on bad input."""
+    raw = request.args.get(name)
+    if raw in (None, ''):
+        return default
+    try:
+        value = int(raw)
+    except ValueError:
+        raise ValueError(f"'{name}' must be an integer")
+    if minimum is not None and value < minimum:
+        raise ValueError(f"'{name}' must be >= {minimum}")
+    return value
+
+@app.route('/debug/events')
+@debug_token_required
+def debug_events():
+    # Recent structured events from this worker's ring buffer (needs DEBUG_TOKEN)
+    # ?level=warning&event=orders&limit=100&since=<seq>  (POST {"level": "debug"} changes the log level)
+    try:
+        limit = min(int_arg('limit', 200, minimum=1), events.buffer.maxlen)
+        since = int_arg('since')
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    return jsonify({
+        'level': events.level_name,
+        'dropped_by_sampling': events.dropped,
+        'events': events.recent(
+            limit=limit,
+            level=request.args.get('level'),
+            event=request.args.get('event'),
+            since=since
+        )
+    })
+
+@app.route('/debug/events', methods=['POST'])
+@debug_token_required
+def set_event_level():
+    level = (request.get_json(silent=True) or {}).get('level', '')
+    if level not in LEVELS:
+        return jsonify({'error': f"level must be one of {list(LEVELS)}"}), 400
+    events.set_level(level)
+    return jsonify({'success': True, 'level': level})
+
+@app.route('/debug/snapshots')
+@debug_token_required
+def debug_snapshots():
+    # Cached order snapshots per sheet (LRU order), estimated sizes, in-flight loads, encoded payload sizes,
+    # replica copies and write-behind journal backlog (needs DEBUG_TOKEN: sheet names are listed)
+    stats = order_snapshots.stats()
+    stats['payloads'] = order_payloads.stats()
+    stats['replica'] = get_sheet_replica().stats()
+    stats['writes'] = get_write_journal().stats() if journal_in_use() else None
+    return jsonify(stats)
+
 @app.route('/debug/auth')
 def auth_debug():
     cid = os.getenv('GOOGLE_CLIENT_ID', '').strip()
@@ -366,6 +506,18 @@ def auth_debug():
         }
     }
     
+    # In-memory credential manager (background refresh state)
+    import services.auth_service as auth_service
+    manager = auth_service.get_credential_manager()
+    managed = manager._creds
+    res["google_auth"]["manager"] = {
+        "loaded": managed is not None,
+        "expiry": str(managed.expiry) if managed is not None else None,
+        "refresh_in_seconds": round(manager.seconds_until_refresh()) if managed is not None else None,
+        "last_refresh": manager.last_refresh,
+        "last_error": manager.last_error
+    }
+
     # Secret way to see full token for copying to Render
     if request.args.get('reveal') == '1':
         res["GOOGLE_TOKEN_JSON_VALUE"] = token_content
@@ -393,97 +545,294 @@ def index_v2():
 
 @app.route('/api/orders')
 def get_orders():
-    global order_cache
-    
     cfg = get_config_service()
     current_sheet = cfg.get('ACTIVE_SHEET_NAME', os.getenv('GOOGLE_SHEET_NAME'))
-    
-    import time
-    now = time.time()
-    
-    # Force reload if data is empty (likely initial load or error)
-    should_refresh = (
-        order_cache['data'] is None or 
-        len(order_cache['data']) == 0 or
-        order_cache['sheet_name'] != current_sheet or 
-        (now - order_cache['timestamp']) > CACHE_TTL
-    )
-
-    if not should_refresh:
-        print(f"DEBUG: Returning cached orders for {current_sheet} ({len(order_cache['data'])} records)")
-        return jsonify(order_cache['data'])
 
-    sheet_service, _ = get_services()
-    if not sheet_service:
-        error_detail = getattr(g, 'last_error', 'Unknown Initialization Error')
-        return jsonify({'error': 'Services not initialized', 'detail': error_detail}), 500
+    try:
+        # Fresh or slightly stale snapshot at once; concurrent misses share one sheet read
+        snapshot = order_snapshots.get(current_sheet)
+        return snapshot_response(snapshot)
+    except Exception as e:
+        events.exception('api_orders_failed', error=str(e))
+        return jsonify({'error': 'Failed to load orders', 'detail': str(e)}), 500
+
+def snapshot_response(snapshot):
+    """Pre-serialized (and pre-compressed) JSON of a snapshot version; 304 if the client has it."""
+    payload = order_payloads.get(snapshot.sheet, snapshot.version, lambda: snapshot.records)
+    headers = {'ETag': payload.etag, 'Vary': 'Accept-Encoding', 'Cache-Control': 'no-cache'}
+    if request.if_none_match.contains_weak(payload.digest):
+        return Response(status=304, headers=headers)
+
+    encoding = negotiate_encoding(request.accept_encodings)
+    if encoding != 'identity':
+        headers['Content-Encoding'] = encoding
+    return Response(payload.body(encoding), mimetype='application/json', headers=headers)
+
+def load_order_records(sheet_name):
+    """order_snapshots loader: reads one worksheet into dashboard records (no request context needed)."""
+    import services.auth_service as auth_service
+    sheet_service = SheetService(auth_service.get_google_credentials(), os.getenv('GOOGLE_SHEET_ID'), sheet_name)
+    if order_snapshots.peek(sheet_name) is None:
+        # Cold worker: answer from the local replica at any age; the snapshot TTL re-reads the sheet soon after
+        sheet_service.replica_max_age = float('inf')
+    else:
+        # Refresh: a replica copy another worker stored within the snapshot TTL is as fresh as a re-read
+        sheet_service.replica_max_age = CACHE_TTL
+    records = build_order_records(sheet_service)
+    if not records and not sheet_service.sheet:
+        raise Exception(sheet_service.last_error or f"Worksheet '{sheet_name}' unavailable")
+    return records
+
+def build_order_records(sheet_service):
+    """Sheet rows -> dashboard records (canonical columns, image links resolved)."""
+    data = sheet_service.get_all_data()
+    events.debug('orders_fetched', sheet=sheet_service.sheet_name, records=len(data) if data else 0,
+                 source='replica' if sheet_service.from_replica else 'sheet')
+    if not data:
+        return []
+
+    # Extended Logic: Fetch Formulas for Image Links
+    image_formulas = sheet_service.get_image_links()
+
+    for i, record in enumerate(data):
+        formula_idx = i + 1
+        if formula_idx < len(image_formulas):
+            raw_formula = str(image_formulas[formula_idx])
+            match_url = re.search(r'["\'](https?://[^"\']+)["\']', raw_formula)
+            if match_url:
+                record['Image Link'] = match_url.group(1)
+
+    df = pd.DataFrame(data)
+
+    # Normalize Columns (shared header aliases, see services/order_columns.py)
+    renamed = column_renames(df.columns)
+
+    if renamed:
+        df.rename(columns=renamed, inplace=True)
+
+    # Process Image Links
+    records = df.to_dict(orient='records')
+    for r in records:
+        raw_link = str(r.get('Image Link', ''))
+        r['DirectImage'] = process_drive_image(raw_link)
+        r['RawImageLink'] = raw_link
+
+    return records
+
+def on_order_snapshot(snapshot):
+    """New snapshot version: push row deltas to /api/stream and keep the search index in step."""
+    get_change_feed().publish_snapshot(snapshot.sheet, snapshot.records)
+    threading.Thread(target=get_search_index().update_sheet, args=(snapshot.sheet, snapshot.records), daemon=True).start()
+
+order_snapshots = SnapshotCache(load_order_records, ttl=CACHE_TTL, on_change=on_order_snapshot)
+order_payloads = PayloadCache()
+
+# --- CHANGE STREAM (SSE) ---
+# Every open stream holds one gunicorn thread (render.yaml: gthread, 16 threads per worker), so
+# at most STREAM_MAX_SUBSCRIBERS streams per worker; the rest are told to retry later
+STREAM_HEARTBEAT_SECONDS = 15   # Comment line so proxies keep the connection open
+STREAM_MAX_SECONDS = 120        # Recycle connections; EventSource reconnects with Last-Event-ID
+STREAM_POLL_SECONDS = CACHE_TTL # Sheet re-read interval while anyone is subscribed
+STREAM_MAX_SUBSCRIBERS = int(os.getenv('STREAM_MAX_SUBSCRIBERS', 4))  # Per worker; keeps 12 threads for requests
+STREAM_BUSY_RETRY_MS = 30000    # Reconnect delay sent to a client turned away when all slots are taken
+_stream_slots = threading.BoundedSemaphore(max(STREAM_MAX_SUBSCRIBERS, 1))
+_stream_poller = {'thread': None}
+_stream_poller_lock = threading.Lock()
+
+def order_stream_loop():
+    """Re-reads the active sheet while /api/stream has subscribers, so bot-saved rows are pushed."""
+    feed = get_change_feed()
+    while feed.subscribers > 0:
+        try:
+            cfg = get_config_service()
+            current_sheet = cfg.get('ACTIVE_SHEET_NAME', os.getenv('GOOGLE_SHEET_NAME'))
+            order_snapshots.get(current_sheet)  # Stale -> background refresh -> on_order_snapshot
+        except Exception as e:
+            events.exception('order_stream_poll_failed', error=str(e))
+        time.sleep(STREAM_POLL_SECONDS)
+    with _stream_poller_lock:
+        _stream_poller['thread'] = None
+
+def ensure_stream_poller():
+    with _stream_poller_lock:
+        if _stream_poller['thread'] is None:
+            _stream_poller['thread'] = threading.Thread(target=order_stream_loop, daemon=True)
+            _stream_poller['thread'].start()
+
+def sse_message(event, data, event_id=None):
+    lines = [f"id: {event_id}"] if event_id is not None else []
+    lines.append(f"event: {event}")
+    lines.append(f"data: {json.dumps(data, ensure_ascii=False, default=str)}")
+    return "\n".join(lines) + "\n\n"
+
+@app.route('/api/stream')
+def stream_orders():
+    # text/event-stream of row changes: event 'change' (data = feed event) or 'resync' (reload /api/orders)
+    # At most STREAM_MAX_SUBSCRIBERS open streams per worker (each holds a thread); extra clients retry in 30 s
+    feed = get_change_feed()
+    last_id = request.headers.get('Last-Event-ID') or request.args.get('since')
+    try:
+        seq = int(last_id) if last_id else feed.last_seq
+    except ValueError:
+        seq = feed.last_seq
+
+    def generate():
+        nonlocal seq
+        # Taken inside the generator: the finally below releases it even when the client disconnects
+        if not _stream_slots.acquire(blocking=False):
+            events.info('stream_rejected', limit=STREAM_MAX_SUBSCRIBERS)
+            # 200 + retry (not 503): EventSource gives up for good on an error status
+            yield f"retry: {STREAM_BUSY_RETRY_MS}\n: stream full\n\n"
+            return
+        try:
+            with feed.subscription():
+                ensure_stream_poller()
+                yield "retry: 3000\n\n"
+                if seq > feed.last_seq:
+                    # Id from before a restart: the deltas are gone
+                    seq = feed.last_seq
+                    yield sse_message('resync', {'seq': seq}, seq)
+                deadline = time.time() + STREAM_MAX_SECONDS
+                while time.time() < deadline:
+                    batch = feed.wait(seq, STREAM_HEARTBEAT_SECONDS)
+                    if batch is None:
+                        seq = feed.last_seq
+                        yield sse_message('resync', {'seq': seq}, seq)
+                    elif not batch:
+                        yield ": keepalive\n\n"
+                    for change in batch or []:
+                        seq = change['seq']
+                        yield sse_message('change', change, seq)
+        finally:
+            _stream_slots.release()
+
+    events.debug('stream_opened', since=seq, subscribers=feed.subscribers)
+    return Response(stream_with_context(generate()), mimetype='text/event-stream', headers={
+        'Cache-Control': 'no-cache',
+        'X-Accel-Buffering': 'no'
+    })
+
+# --- SEARCH ---
+SEARCH_ALL_TTL = 600          # Other months: re-read in the background at most this often
+_search_all_state = {'running': False, 'finished': 0}
+_search_all_lock = threading.Lock()
 
+def index_all_sheets():
+    """Background: feed every month worksheet (not _ tabs) into the search index."""
+    import services.auth_service as auth_service
     try:
-        data = sheet_service.get_all_data()
-        print(f"DEBUG: Fetched {len(data) if data else 0} records from sheet_service")
-        if not data:
-            return jsonify([])
-        
-        # Extended Logic: Fetch Formulas for Image Links
-        image_formulas = sheet_service.get_image_links()
-        
-        for i, record in enumerate(data):
-            formula_idx = i + 1
-            if formula_idx < len(image_formulas):
-                raw_formula = str(image_formulas[formula_idx])
-                match_url = re.search(r'["\'](https?://[^"\']+)["\']', raw_formula)
-                if match_url:
-                    record['Image Link'] = match_url.group(1)
-        
-        df = pd.DataFrame(data)
-        
-        # Normalize Columns
-        col_map = {
-            'Run No': 'Run No', 'run_no': 'Run No', 'ลำดับ': 'Run No', 'Run No.': 'Run No',
-            'Name': 'Name', 'receiver_name': 'Name', 'ชื่อลูกค้า': 'Name', 'ชื่อหน้ากล่อง': 'Name',
-            'Item': 'Item', 'item_name': 'Item', 'ชื่อของ': 'Item', 'รายการสินค้า': 'Item',
-            'Price': 'Price', 'price': 'Price', 'ยอดรวม': 'Price', 'ราคาของ': 'Price',
-            'Shop': 'Shop', 'shop': 'Shop', 'shop_name': 'Shop', 'ชื่อร้าน': 'Shop',
-            'Status': 'Status', 'status': 'Status', 'สถานะ': 'Status',
-            'Order ID': 'Order ID', 'order_id': 'Order ID', 'เลขออเดอร์': 'Order ID', 'เลขอเดอร์': 'Order ID',
-            'Image Link': 'Image Link', 'image_link': 'Image Link', 'Link รูป': 'Image Link', 'Link Ima.': 'Image Link',
-            'Tracking Number': 'Tracking', 'tracking_number': 'Tracking', 'เลขพัสดุ': 'Tracking',
-            'Platform': 'Platform', 'platform': 'Platform',
-            'Coins': 'Coins', 'coins': 'Coins', 'เหรียญ': 'Coins',
-            'Date': 'Date', 'date': 'Date', 'วันที่ bought': 'Date', 'วันที่': 'Date', 'วันที่ซื้อ': 'Date',
-            'Location': 'Location', 'location': 'Location', 'ที่อยู่': 'Location', 'ส่งที่ไหน': 'Location',
-            'วันรับของ': 'SavedDate', 'delivery_date': 'SavedDate', 'saved_date': 'SavedDate'
-        }
-        
-        renamed = {}
-        for col in df.columns:
-            for k, v in col_map.items():
-                if k in col: 
-                    renamed[col] = v
-                    break
-        
-        if renamed:
-            df.rename(columns=renamed, inplace=True)
-            
-        # Process Image Links
-        records = df.to_dict(orient='records')
-        for r in records:
-            raw_link = str(r.get('Image Link', ''))
-            r['DirectImage'] = process_drive_image(raw_link)
-            r['RawImageLink'] = raw_link
-
-        # Update Cache
-        order_cache['data'] = records
-        order_cache['timestamp'] = now
-        order_cache['sheet_name'] = current_sheet
-        print(f"DEBUG: Cache updated for {current_sheet}")
-
-        return jsonify(records)
+        client = auth_service.get_credential_manager().gspread_client()
+        spreadsheet = client.open_by_key(os.getenv('GOOGLE_SHEET_ID'))
+        index = get_search_index()
+        for ws in spreadsheet.worksheets():
+            if ws.title.startswith('_'):
+                continue
+            changed = index.update_sheet_rows(ws.title, ws.get_all_values())
+            events.debug('search_sheet_indexed', sheet=ws.title, changed=changed)
     except Exception as e:
-        print(f"❌ API Error /api/orders: {e}")
-        import traceback
-        traceback.print_exc()
-        return jsonify({'error': str(e)}), 500
+        events.exception('search_index_all_failed', error=str(e))
+    finally:
+        with _search_all_lock:
+            _search_all_state['running'] = False
+            _search_all_state['finished'] = time.time()
+
+def ensure_all_sheets_indexed():
+    """Starts index_all_sheets if stale. Returns True while indexing is in progress."""
+    with _search_all_lock:
+        if _search_all_state['running']:
+            return True
+        if time.time() - _search_all_state['finished'] < SEARCH_ALL_TTL:
+            return False
+        _search_all_state['running'] = True
+    threading.Thread(target=index_all_sheets, daemon=True).start()
+    return True
+
+@app.route('/api/search')
+def search_orders():
+    # ?q=สมชาย&scope=current|all&limit=20
+    query = request.args.get('q', '').strip()
+    scope = request.args.get('scope', 'current')
+    try:
+        limit = min(int_arg('limit', 20, minimum=1), 200)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    if not query:
+        return jsonify({'error': 'q required'}), 400
+
+    index = get_search_index()
+    indexing = False
+    if scope == 'all':
+        indexing = ensure_all_sheets_indexed()
+        sheets = None
+    else:
+        cfg = get_config_service()
+        current_sheet = cfg.get('ACTIVE_SHEET_NAME', os.getenv('GOOGLE_SHEET_NAME'))
+        try:
+            # Same snapshot as /api/orders; a no-op when the index already has this version
+            index.update_sheet(current_sheet, order_snapshots.get(current_sheet).records)
+        except Exception as e:
+            return jsonify({'error': 'Failed to load orders', 'detail': str(e)}), 500
+        sheets = [current_sheet]
+
+    start = time.perf_counter()
+    results = index.search(query, limit=limit, sheets=sheets)
+    took_ms = (time.perf_counter() - start) * 1000
+    # Length only: queries are customer names, order IDs and phone numbers
+    events.debug('search', query_length=len(query), scope=scope, hits=len(results), took_ms=round(took_ms, 2))
+    return jsonify({
+        'query': query,
+        'scope': scope,
+        'results': results,
+        'took_ms': round(took_ms, 2),
+        'indexing': indexing,
+        'sheets': index.sheet_info()
+    })
+
+@app.route('/api/accounting/summary')
+def get_accounting_summary():
+    # Per-shop / per-platform totals of a sheet (?sheet=, default: active), cached per snapshot version
+    cfg = get_config_service()
+    sheet = request.args.get('sheet') or cfg.get('ACTIVE_SHEET_NAME', os.getenv('GOOGLE_SHEET_NAME'))
+    try:
+        snapshot = order_snapshots.get(sheet)
+        start = time.perf_counter()
+        summary = accounting_summary(sheet, snapshot.version, snapshot.records)
+        took_ms = round((time.perf_counter() - start) * 1000, 2)
+        return jsonify(dict(summary, sheet=sheet, version=snapshot.version, took_ms=took_ms))
+    except Exception as e:
+        events.exception('accounting_summary_failed', sheet=sheet, error=str(e))
+        return jsonify({'error': 'Failed to summarize orders', 'detail': str(e)}), 500
+
+@app.route('/api/analytics/totals')
+def get_analytics_totals():
+    # Cross-month totals from the local store: ?by=shop|platform|sheet|status&since=<tab>&sheets=a,b&cancelled=1
+    from services.analytics_store import get_analytics_store
+    store = get_analytics_store()
+    sheets = [s for s in request.args.get('sheets', '').split(',') if s]
+    try:
+        start = time.perf_counter()
+        rows = store.totals(
+            by=request.args.get('by', 'shop'),
+            sheets=sheets or None,
+            since=request.args.get('since'),
+            include_cancelled=request.args.get('cancelled') == '1'
+        )
+        took_ms = round((time.perf_counter() - start) * 1000, 2)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    return jsonify({'rows': rows, 'took_ms': took_ms, 'sheets': store.sheets()})
+
+@app.route('/api/analytics/refresh', methods=['POST'])
+def refresh_analytics():
+    # Runs in the background; poll /api/analytics/totals (its 'sheets' show refreshed_at)
+    force = bool((request.json or {}).get('force')) if request.is_json else False
+    def run():
+        try:
+            analytics_refresh(force=force)
+        except Exception as e:
+            events.exception('analytics_refresh_failed', error=str(e))
+    threading.Thread(target=run, daemon=True).start()
+    return jsonify({'started': True, 'force': force})
 
 @app.route('/api/orders/check', methods=['POST'])
 def check_order():
@@ -498,10 +847,11 @@ def check_order():
     try:
         success = sheet_service.update_order_status(order_id, "Checked")
         if success:
-            order_cache['data'] = None # Invalidate
+            order_snapshots.invalidate(sheet_service.sheet.title)
+            get_change_feed().publish_change('status_changed', sheet_service.sheet.title, str(order_id).strip(), {'Status': "Checked"})
         return jsonify({'success': success})
     except Exception as e:
-        print(f"❌ Check Error: {e}")
+        events.error('order_check_failed', order_id=order_id, error=str(e))
         return jsonify({'error': str(e)}), 500
 
 @app.route('/api/orders/uncheck', methods=['POST'])
@@ -517,12 +867,23 @@ def uncheck_order():
     try:
         success = sheet_service.update_order_status(order_id, "Pending")
         if success:
-            order_cache['data'] = None # Invalidate
+            order_snapshots.invalidate(sheet_service.sheet.title)
+            get_change_feed().publish_change('status_changed', sheet_service.sheet.title, str(order_id).strip(), {'Status': "Pending"})
         return jsonify({'success': success})
     except Exception as e:
-        print(f"❌ Uncheck Error: {e}")
+        events.error('order_uncheck_failed', order_id=order_id, error=str(e))
         return jsonify({'error': str(e)}), 500
 
+def publish_recovered_image(sheet_name, target, url):
+    """Tells other dashboards about an image found in Drive (target = Run No or Order ID)."""
+    snapshot = order_snapshots.peek(sheet_name)
+    for record in snapshot.records if snapshot else []:
+        if target in (str(record.get('Run No', '')).strip(), str(record.get('Order ID', '')).strip()):
+            key = order_key(record)
+            if key and not record.get('DirectImage'):
+                get_change_feed().publish_change('image_recovered', sheet_name, key, {'DirectImage': url}, persist=False)
+            return
+
 @app.route('/api/find_image/<order_target>')
 def find_image(order_target):
     _, drive_service = get_services()
@@ -547,11 +908,12 @@ def find_image(order_target):
         
         if found_file:
             url = process_drive_image(found_file.get('webViewLink'))
+            publish_recovered_image(sheet_name, target_name, url)
             return jsonify({'found': True, 'url': url})
             
         return jsonify({'found': False})
     except Exception as e:
-        print(f"❌ Find Image Error: {e}")
+        events.error('find_image_failed', target=order_target, error=str(e))
         return jsonify({'error': str(e)}), 500
 
 @app.route('/api/sheets', methods=['GET'])
@@ -567,7 +929,7 @@ def get_sheets():
         return jsonify({'sheets': sheets, 'current': current})
     except Exception as e:
         import traceback
-        traceback.print_exc()
+        events.exception('api_sheets_failed', error=str(e))
         return jsonify({
             'error': str(e),
             'traceback': traceback.format_exc() if os.getenv('FLASK_DEBUG') == '1' else 'Consult logs'
@@ -585,7 +947,7 @@ def set_sheet():
     if success:
         cfg = get_config_service()
         cfg.set('ACTIVE_SHEET_NAME', sheet_name)
-        order_cache['data'] = None # Invalidate
+        order_snapshots.invalidate(sheet_name)
         return jsonify({'success': True})
     else:
         return jsonify({'error': 'Failed to switch sheet'}), 500
@@ -617,6 +979,15 @@ def update_ai_config():
         return jsonify({'success': True})
     return jsonify({'error': 'Invalid AI Provider'}), 400
 
+@app.route('/api/shops/reload', methods=['POST'])
+def reload_shops():
+    sheet_service, _ = get_services()
+    if not sheet_service: return jsonify({'error': 'Service unavailable'}), 500
+
+    registry = AIBaseService.shop_matcher_registry()
+    success = registry.sync_from_gsheets(sheet_service.client, os.getenv('GOOGLE_SHEET_ID'), force=True)
+    return jsonify({'success': success, 'shops': len(registry.matcher.mapping)})
+
 @app.route('/api/config', methods=['POST'])
 def update_config():
     cfg = get_config_service()
@@ -631,14 +1002,14 @@ def update_config():
         cfg.set_folder_for_sheet(sheet_name, folder_id)
 
         # Persist to Google Sheets so it survives Render deploys
-        import threading
+        import services.auth_service as auth_service
         def do_sync():
+            # Runs outside the request: no flask.g, so no get_services() (same client as config_sync_loop)
             try:
-                sheet_service, _ = get_services()
-                if sheet_service and sheet_service.client:
-                    cfg.sync_to_gsheets(sheet_service.client, os.getenv('GOOGLE_SHEET_ID'))
+                client = auth_service.get_credential_manager().gspread_client()
+                cfg.sync_to_gsheets(client, os.getenv('GOOGLE_SHEET_ID'), sheet_name)
             except Exception as e:
-                print(f"DEBUG: sync_to_gsheets background error: {e}")
+                events.warning('config_sync_to_failed', error=str(e))
         threading.Thread(target=do_sync, daemon=True).start()
 
         return jsonify({'success': True})
@@ -0,0 +1,366 @@
+"""
+Parallel, resumable accuracy + latency benchmark for the AI extraction.
+
+Examples:
+  python bench_accuracy.py                                   # active sheet's Drive folder, configured provider
+  python bench_accuracy.py --providers openai,gemini --workers 6
+  python bench_accuracy.py --local-folder "Order For AI training" --expected expected.csv
+  python bench_accuracy.py --models openai=gpt-4o-mini --name mini_vs_4o
+
+Every finished image is appended to bench_runs/<name>/checkpoint.jsonl, so re-running the same
+command resumes where it stopped (images that failed are run again). Downloads and extractions are cached in bench_cache/ keyed by
+file id / image hash + provider + model, so a re-run only pays for new work.
+"""
+import argparse
+import concurrent.futures
+import csv
+import hashlib
+import json
+import os
+import threading
+import time
+
+import certifi
+from dotenv import load_dotenv
+
+os.environ['SSL_CERT_FILE'] = certifi.where()
+
+FIELDS = ['order_id', 'shop', 'price', 'coins', 'receiver', 'platform', 'date', 'tracking']
+NUMERIC_FIELDS = {'price', 'coins'}
+AI_KEYS = {
+    'order_id': 'order_id', 'shop': 'shop_name', 'price': 'price', 'coins': 'coins',
+    'receiver': 'receiver_name', 'platform': 'platform', 'date': 'date', 'tracking': 'tracking_number'
+}
+# Sheet header candidates per field (first non-empty wins)
+SHEET_KEYS = {
+    'order_id': ['เลขออเดอร์', 'เลขอเดอร์', 'Order ID'],
+    'shop': ['ชื่อร้าน', 'Shop'],
+    'price': ['ราคาสุดท้าย', 'ราคาของ', 'Price'],
+    'coins': ['เหรียญ', 'Coins'],
+    'receiver': ['ชื่อหน้ากล่อง', 'ชื่อลูกค้า', 'Name'],
+    'platform': ['Platform'],
+    'date': ['วันที่ซื้อ', 'วันที่', 'Date'],
+    'tracking': ['เลขพัสดุ', 'Tracking Number'],
+}
+# USD per 1M tokens (input, output). Override with --price model=in,out
+PRICING = {
+    'gpt-4o': (2.50, 10.00),
+    'gpt-4o-mini': (0.15, 0.60),
+    'gpt-4.1': (2.00, 8.00),
+    'gpt-4.1-mini': (0.40, 1.60),
+    'gemini-2.5-flash': (0.30, 2.50),
+    'gemini-2.5-pro': (1.25, 10.00),
+}
+IMAGE_EXTS = ('.jpg', '.jpeg', '.png')
+
+
+def percentile(values, pct):
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    k = (len(ordered) - 1) * pct / 100
+    lo = int(k)
+    hi = min(lo + 1, len(ordered) - 1)
+    return ordered[lo] + (ordered[hi] - ordered[lo]) * (k - lo)
+
+
+def run_no_from_name(filename):
+    return os.path.splitext(filename)[0].strip()
+
+
+def field_matches(field, ai_value, expected):
+    """None when there's no expected value to compare against."""
+    if expected is None or str(expected).strip() in ('', 'N/A'):
+        return None
+    if field in NUMERIC_FIELDS:
+        try:
+            return abs(abs(float(str(ai_value).replace(',', ''))) - float(str(expected).replace(',', ''))) < 0.01
+        except (TypeError, ValueError):
+            return False
+    if field == 'shop':
+        from services.shop_matcher import normalize_shop_text
+        return normalize_shop_text(ai_value or '') == normalize_shop_text(expected)
+    return ' '.join(str(ai_value or '').split()).lower() == ' '.join(str(expected).split()).lower()
+
+
+class BenchmarkRunner:
+    def __init__(self, args):
+        self.args = args
+        self.cache_dir = args.cache_dir
+        self.image_cache = os.path.join(self.cache_dir, 'images')
+        self.extract_cache = os.path.join(self.cache_dir, 'extractions')
+        os.makedirs(self.image_cache, exist_ok=True)
+        os.makedirs(self.extract_cache, exist_ok=True)
+
+        self.run_dir = os.path.join(args.runs_dir, args.name)
+        os.makedirs(self.run_dir, exist_ok=True)
+        self.checkpoint_path = os.path.join(self.run_dir, 'checkpoint.jsonl')
+        self._checkpoint_lock = threading.Lock()
+        self._local = threading.local()
+        self._drive = None
+        self.pricing = dict(PRICING)
+        for item in args.price or []:
+            model, _, value = item.partition('=')
+            inp, _, out = value.partition(',')
+            self.pricing[model.strip()] = (float(inp), float(out))
+
+    # ─── Inputs ──────────────────────────────────────────────────────────────
+    def _drive_service(self):
+        if self._drive is None:
+            from services.drive_service import DriveService
+            from services.auth_service import get_google_credentials
+            self._drive = DriveService(get_google_credentials())
+        return self._drive
+
+    def list_images(self):
+        """[(key, filename, source)] for every image in the folder."""
+        if self.args.local_folder:
+            names = sorted(n for n in os.listdir(self.args.local_folder) if n.lower().endswith(IMAGE_EXTS))
+            return [(n, n, os.path.join(self.args.local_folder, n)) for n in names]
+
+        from services.config_service import ConfigService
+        cfg = ConfigService()
+        folder_id = self.args.drive_folder or cfg.get_folder_for_sheet(self.args.sheet or cfg.get('ACTIVE_SHEET_NAME'))
+        files = self._drive_service().list_images_in_folder(folder_id)
+        print(f"Drive folder {folder_id}: {len(files)} images")
+        return [(f['id'], f['name'], f['id']) for f in files if f['name'].lower().endswith(IMAGE_EXTS)]
+
+    def load_expected(self):
+        """run_no -> {field: expected value}"""
+        expected = {}
+        if self.args.expected:
+            with open(self.args.expected, 'r', encoding='utf-8') as f:
+                for row in csv.DictReader(f):
+                    run_no = str(row.get('RunNo') or row.get('run_no') or '').strip()
+                    if run_no:
+                        expected[run_no] = {field: row.get(field) for field in FIELDS}
+            return expected
+
+        if self.args.local_folder and not self.args.sheet:
+            return expected
+
+        from services.config_service import ConfigService
+        from services.sheet_service import SheetService
+        from services.auth_service import get_google_credentials
+        cfg = ConfigService()
+        sheet_name = self.args.sheet or cfg.get('ACTIVE_SHEET_NAME')
+        sheet_service = SheetService(get_google_credentials(), os.getenv('GOOGLE_SHEET_ID'), sheet_name)
+        for row in sheet_service.get_all_data():
+            run_no = str(row.get('Run No.') or row.get('Run No') or '').strip()
+            if not run_no:
+                continue
+            values = {}
+            for field, keys in SHEET_KEYS.items():
+                values[field] = next((str(row[k]).strip() for k in keys if str(row.get(k, '')).strip()), '')
+            expected[run_no] = values
+        print(f"Loaded {len(expected)} expected rows from sheet '{sheet_name}'")
+        return expected
+
+    def fetch_image(self, key, filename, source):
+        """Local path of the image, downloading into the cache once."""
+        if self.args.local_folder:
+            return source
+        ext = os.path.splitext(filename)[1].lower() or '.jpg'
+        path = os.path.join(self.image_cache, f"{key}{ext}")
+        if not os.path.exists(path):
+            content = self._drive_service().get_file_content(source)
+            if not content:
+                raise Exception("DL_FAILED")
+            tmp_path = f"{path}.part"
+            with open(tmp_path, 'wb') as f:
+                f.write(content)
+            os.replace(tmp_path, path)
+        return path
+
+    # ─── Extraction ──────────────────────────────────────────────────────────
+    def ai_service(self, provider, model):
+        """One service instance per worker thread and provider/model (last_usage isn't shared)."""
+        services = getattr(self._local, 'services', None)
+        if services is None:
+            services = self._local.services = {}
+        key = (provider, model)
+        if key not in services:
+            from services.ai_factory import AIFactory
+            services[key] = AIFactory.get_service(provider, model=model)
+        return services[key]
+
+    def extract(self, provider, model, image_path):
+        """Cached extraction: {'data', 'latency', 'usage', 'model', 'cached'}"""
+        with open(image_path, 'rb') as f:
+            digest = hashlib.sha1(f.read()).hexdigest()
+        service = self.ai_service(provider, model)
+        cache_path = os.path.join(self.extract_cache, f"{provider}_{service.model}_{digest}.json")
+        if os.path.exists(cache_path) and not self.args.no_cache:
+            with open(cache_path, 'r', encoding='utf-8') as f:
+                result = json.load(f)
+            result['cached'] = True
+            return result
+
+        service.last_usage = None
+        start = time.perf_counter()
+        data = service.extract_with_retry(image_path, max_retries=self.args.retries, delay=self.args.retry_delay)
+        latency = time.perf_counter() - start
+        result = {'data': data, 'latency': latency, 'usage': service.last_usage, 'model': service.model}
+        if data is not None:
+            with open(cache_path, 'w', encoding='utf-8') as f:
+                json.dump(result, f, ensure_ascii=False)
+        result['cached'] = False
+        return result
+
+    # ─── Run ─────────────────────────────────────────────────────────────────
+    def load_checkpoint(self):
+        """Latest result per (provider, model, image). run() only skips the SUCCESS ones."""
+        done = {}
+        if os.path.exists(self.checkpoint_path):
+            with open(self.checkpoint_path, 'r', encoding='utf-8') as f:
+                for line in f:
+                    try:
+                        r = json.loads(line)
+                    except ValueError:
+                        continue  # half-written line from an interrupted run
+                    done[(r['provider'], r['model_arg'], r['key'])] = r
+        return done
+
+    def save_result(self, result):
+        with self._checkpoint_lock:
+            with open(self.checkpoint_path, 'a', encoding='utf-8') as f:
+                f.write(json.dumps(result, ensure_ascii=False) + "\n")
+
+    def process(self, provider, model, key, filename, source, expected):
+        run_no = run_no_from_name(filename)
+        result = {'provider': provider, 'model_arg': model, 'key': key, 'filename': filename, 'run_no': run_no}
+        try:
+            image_path = self.fetch_image(key, filename, source)
+            extraction = self.extract(provider, model, image_path)
+            data = extraction['data']
+            result.update({
+                'model': extraction['model'], 'latency': extraction['latency'],
+                'usage': extraction['usage'], 'cached': extraction['cached'],
+                'status': 'SUCCESS' if data else 'AI_FAILED'
+            })
+            exp = expected.get(run_no, {})
+            result['ai'] = {field: (data or {}).get(AI_KEYS[field]) for field in FIELDS}
+            result['expected'] = {field: exp.get(field) for field in FIELDS}
+            result['match'] = {}
+            for field in FIELDS:
+                match = field_matches(field, result['ai'][field], exp.get(field))
+                # A failed extraction counts as a miss wherever there was something to compare
+                result['match'][field] = False if (not data and match is not None) else match
+        except Exception as e:
+            result.update({'status': 'DL_FAILED' if str(e) == 'DL_FAILED' else 'ERROR', 'error': str(e)[:200]})
+        return result
+
+    def run(self):
+        providers = [p.strip() for p in self.args.providers.split(',') if p.strip()]
+        models = {}
+        for item in self.args.models or []:
+            provider, _, model = item.partition('=')
+            models[provider.strip()] = model.strip()
+
+        images = self.list_images()
+        if self.args.limit:
+            images = images[:self.args.limit]
+        expected = self.load_expected()
+        done = self.load_checkpoint()
+
+        # AI_FAILED / DL_FAILED / ERROR rows are run again on resume (the new line replaces the old one)
+        tasks = []
+        retried = 0
+        for provider in providers:
+            model = models.get(provider)
+            for key, filename, source in images:
+                previous = done.get((provider, model, key))
+                if previous is None or previous.get('status') != 'SUCCESS':
+                    retried += previous is not None
+                    tasks.append((provider, model, key, filename, source))
+        print(f"{len(images)} images x {len(providers)} provider(s): {len(done)} already in checkpoint, "
+              f"{len(tasks)} to run ({retried} failed before)")
+
+        with concurrent.futures.ThreadPoolExecutor(max_workers=self.args.workers) as pool:
+            futures = {pool.submit(self.process, *task, expected): task for task in tasks}
+            for i, future in enumerate(concurrent.futures.as_completed(futures), 1):
+                result = future.result()
+                self.save_result(result)
+                done[(result['provider'], result['model_arg'], result['key'])] = result
+                latency = f"{result.get('latency', 0):.1f}s" + (" (cached)" if result.get('cached') else "")
+                print(f"[{i}/{len(tasks)}] {result['provider']} {result['filename']}: {result['status']} {latency}")
+
+        results = [r for r in done.values() if r['provider'] in providers]
+        self.write_report(results)
+        self.print_summary(results)
+
+    # ─── Reporting ───────────────────────────────────────────────────────────
+    def cost(self, model, usage):
+        if not usage or model not in self.pricing:
+            return None
+        price_in, price_out = self.pricing[model]
+        return (usage.get('input_tokens', 0) * price_in + usage.get('output_tokens', 0) * price_out) / 1_000_000
+
+    def write_report(self, results):
+        path = self.args.report or os.path.join(self.run_dir, 'report.csv')
+        with open(path, 'w', newline='', encoding='utf-8') as f:
+            writer = csv.writer(f)
+            header = ['Provider', 'Model', 'RunNo', 'Filename', 'Status', 'Latency', 'Cached', 'InputTokens', 'OutputTokens', 'CostUSD']
+            for field in FIELDS:
+                header += [f'AI_{field}', f'Sheet_{field}', f'{field}_Match']
+            writer.writerow(header)
+            for r in sorted(results, key=lambda r: (r['provider'], r['filename'])):
+                usage = r.get('usage') or {}
+                cost = self.cost(r.get('model'), usage)
+                row = [r['provider'], r.get('model', ''), r['run_no'], r['filename'], r['status'],
+                       f"{r.get('latency', 0):.2f}", r.get('cached', ''), usage.get('input_tokens', ''),
+                       usage.get('output_tokens', ''), f"{cost:.5f}" if cost is not None else '']
+                for field in FIELDS:
+                    match = (r.get('match') or {}).get(field)
+                    row += [(r.get('ai') or {}).get(field, '-'), (r.get('expected') or {}).get(field, '-'),
+                            '-' if match is None else str(match).upper()]
+                writer.writerow(row)
+        print(f"\nDetailed report: {path}")
+
+    def print_summary(self, results):
+        groups = {}
+        for r in results:
+            groups.setdefault((r['provider'], r.get('model') or r.get('model_arg') or '?'), []).append(r)
+
+        for (provider, model), rows in sorted(groups.items()):
+            ok = [r for r in rows if r['status'] == 'SUCCESS']
+            latencies = [r['latency'] for r in rows if r.get('latency')]
+            tokens_in = sum((r.get('usage') or {}).get('input_tokens', 0) for r in ok)
+            tokens_out = sum((r.get('usage') or {}).get('output_tokens', 0) for r in ok)
+            costs = [c for c in (self.cost(model, r.get('usage')) for r in ok) if c is not None]
+
+            print("\n" + "=" * 72)
+            print(f"{provider} / {model}: {len(ok)}/{len(rows)} extracted "
+                  f"({sum(1 for r in rows if r['status'] != 'SUCCESS')} failed)")
+            print(f"  latency p50 {percentile(latencies, 50):.2f}s  p95 {percentile(latencies, 95):.2f}s  "
+                  f"p99 {percentile(latencies, 99):.2f}s")
+            print(f"  tokens in {tokens_in:,} / out {tokens_out:,}"
+                  + (f"  cost ${sum(costs):.4f} (${sum(costs) / len(costs):.5f}/slip)" if costs else "  cost n/a"))
+            for field in FIELDS:
+                compared = [r['match'][field] for r in rows if r.get('match') and r['match'].get(field) is not None]
+                if compared:
+                    print(f"  {field:10} {sum(compared) / len(compared):6.1%}  ({sum(compared)}/{len(compared)})")
+
+
+if __name__ == "__main__":
+    load_dotenv()
+    from services.config_service import ConfigService
+
+    parser = argparse.ArgumentParser(description="Parallel, resumable AI extraction benchmark.")
+    parser.add_argument("--providers", default=ConfigService().get('AI_PROVIDER', 'openai'))
+    parser.add_argument("--models", action="append", help="provider=model override, e.g. openai=gpt-4o-mini")
+    parser.add_argument("--local-folder", help="Benchmark images from a local folder instead of Drive")
+    parser.add_argument("--drive-folder", help="Drive folder ID (default: folder of the sheet)")
+    parser.add_argument("--sheet", help="Worksheet with the expected values (default: active sheet)")
+    parser.add_argument("--expected", help="CSV with RunNo + field columns instead of the sheet")
+    parser.add_argument("--workers", type=int, default=4)
+    parser.add_argument("--limit", type=int, default=0, help="Only the first N images (0 = whole folder)")
+    parser.add_argument("--retries", type=int, default=2)
+    parser.add_argument("--retry-delay", type=float, default=5)
+    parser.add_argument("--name", default="default", help="Run name (checkpoint + report folder)")
+    parser.add_argument("--runs-dir", default="bench_runs")
+    parser.add_argument("--cache-dir", default="bench_cache")
+    parser.add_argument("--no-cache", action="store_true", help="Ignore cached extractions")
+    parser.add_argument("--report", help="CSV report path (default: bench_runs/<name>/report.csv)")
+    parser.add_argument("--price", action="append", help="model=input_usd_per_1M,output_usd_per_1M")
+    BenchmarkRunner(parser.parse_args()).run()
@@ -0,0 +1,140 @@
+"""
+Offline end-to-end benchmark of the bot pipeline (process_images_thread).
+
+1. Record: run the server with GRAVITY_RECORD_DIR=fixtures and send slips through LINE as usual.
+   Webhooks, image bytes and every LINE/OpenAI/Sheets/Drive response are saved per job.
+2. Replay: python replay_bench.py fixtures/<session> [--runs 5] [--latency-scale 1.0]
+           [--latency ai_service=3.0 --latency drive_service.upload_file=0.8]
+           [--save result.json] [--baseline previous.json --threshold 0.2] [--metrics]
+   No credentials or network are needed; external calls are answered from the fixtures
+   with the injected latency, local work (stitching, barcode, hashing) runs for real.
+"""
+import argparse
+import json
+import os
+import sys
+import tempfile
+import time
+
+
+def percentile(values, pct):
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    k = (len(ordered) - 1) * pct / 100
+    lo = int(k)
+    hi = min(lo + 1, len(ordered) - 1)
+    return ordered[lo] + (ordered[hi] - ordered[lo]) * (k - lo)
+
+
+def parse_latency(items):
+    fixed = {}
+    for item in items or []:
+        key, _, value = item.partition('=')
+        fixed[key.strip()] = float(value)
+    return fixed
+
+
+def run_replay(session_dir, runs, latency):
+    os.environ.pop('GRAVITY_RECORD_DIR', None)  # never re-record while replaying
+
+    import routes.bot as bot
+    import services.phash_index as phash_index
+    from services.replay_service import load_fixture_session, ReplayProvider, ReplayMessagingApi
+
+    jobs = load_fixture_session(session_dir)
+    if not jobs:
+        print(f"No replayable jobs found in {session_dir}")
+        return None
+
+    stages = {}
+    totals = []
+    for run in range(runs):
+        for job in jobs:
+            timings = []
+            provider = ReplayProvider(job, latency, timings, bot.get_config())
+            messaging = ReplayMessagingApi(latency, timings)
+
+            # Fresh near-duplicate index per run, otherwise run 2+ would short-circuit on run 1
+            tmp_index = os.path.join(tempfile.mkdtemp(prefix="replay_phash_"), "phash_index.jsonl")
+            phash_index._phash_index_instance = phash_index.PHashIndex(tmp_index)
+            bot.get_service_provider = lambda: provider
+            bot.messaging_api = messaging
+
+            with bot.user_states_lock:
+                bot.user_states[job['user_id']] = {'images': list(job['image_ids']), 'timer': None, 'reply_token': 'replay'}
+
+            start = time.perf_counter()
+            bot.process_images_thread(job['user_id'])
+            elapsed = time.perf_counter() - start
+            totals.append(elapsed)
+
+            for stage, duration in timings:
+                stages.setdefault(stage, []).append(duration)
+            outcome = messaging.sent[-1][1][0].splitlines()[0] if messaging.sent else "(no reply)"
+            print(f"[run {run + 1}/{runs}] {os.path.basename(job['dir'])}: {elapsed * 1000:8.1f} ms  {outcome}")
+
+    summary = {
+        'jobs': len(jobs),
+        'runs': runs,
+        'total': {'p50': percentile(totals, 50), 'p95': percentile(totals, 95), 'n': len(totals)},
+        'stages': {
+            stage: {'p50': percentile(v, 50), 'p95': percentile(v, 95), 'n': len(v)}
+            for stage, v in sorted(stages.items())
+        }
+    }
+    return summary
+
+
+def print_summary(summary, baseline=None, threshold=0.2):
+    print("\n" + "-" * 72)
+    print(f"{'Stage':44} {'p50 ms':>9} {'p95 ms':>9} {'n':>5}")
+    rows = list(summary['stages'].items()) + [('TOTAL process_images_thread', summary['total'])]
+    regressions = []
+    for stage, s in rows:
+        flag = ""
+        if baseline:
+            base = baseline['total'] if stage.startswith('TOTAL') else baseline['stages'].get(stage)
+            if base and base['p50'] > 0:
+                change = (s['p50'] - base['p50']) / base['p50']
+                flag = f"  {change:+.0%}"
+                if change > threshold:
+                    flag += "  ⚠️ REGRESSION"
+                    regressions.append(stage)
+        print(f"{stage:44} {s['p50'] * 1000:9.1f} {s['p95'] * 1000:9.1f} {s['n']:5}{flag}")
+    return regressions
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Replay recorded bot jobs offline and report per-stage latency.")
+    parser.add_argument("session_dir")
+    parser.add_argument("--runs", type=int, default=3)
+    parser.add_argument("--latency-scale", type=float, default=1.0, help="Multiply recorded latencies (0 = no sleeping)")
+    parser.add_argument("--latency", action="append", help="Fixed latency in seconds, e.g. ai_service=3.0")
+    parser.add_argument("--save", help="Write summary JSON here")
+    parser.add_argument("--baseline", help="Compare against a previously saved summary")
+    parser.add_argument("--threshold", type=float, default=0.2, help="Relative p50 increase counted as regression")
+    parser.add_argument("--metrics", action="store_true", help="Also print the pipeline's /metrics output")
+    args = parser.parse_args()
+
+    from services.replay_service import LatencyModel
+    summary = run_replay(args.session_dir, args.runs, LatencyModel(args.latency_scale, parse_latency(args.latency)))
+    if not summary:
+        sys.exit(1)
+
+    baseline = None
+    if args.baseline:
+        with open(args.baseline, 'r', encoding='utf-8') as f:
+            baseline = json.load(f)
+    regressions = print_summary(summary, baseline, args.threshold)
+
+    if args.metrics:
+        from services.metrics_service import get_metrics
+        print("\n" + get_metrics().render_prometheus())
+
+    if args.save:
+        with open(args.save, 'w', encoding='utf-8') as f:
+            json.dump(summary, f, indent=2)
+        print(f"\nSaved summary to {args.save}")
+
+    sys.exit(1 if regressions else 0)
@@ -25,9 +25,16 @@ from services.openai_service import OpenAIService
 from services.sheet_service import SheetService
 from services.accounting_service import AccountingService
 from services.config_service import ConfigService
+from services.phash_index import get_phash_index, phash
+from services.replay_service import get_recorder
+from services.metrics_service import get_metrics
+from services.event_log import get_event_log
+from services.job_queue import get_job_queue, JobWorker, MAX_ATTEMPTS
 
 # Blueprint Setup
 bot_bp = Blueprint('bot', __name__)
+metrics = get_metrics()
+events = get_event_log()
 
 # Config
 import json
@@ -122,7 +129,7 @@ class ServiceProvider:
     def sheet_service(self):
         if self._sheet_service is None:
             sheet_name = self.config.get('ACTIVE_SHEET_NAME', GOOGLE_SHEET_NAME)
-            print(f"DEBUG: Lazy connecting to Sheet: {sheet_name}")
+            events.debug('sheet_connect', source='bot', sheet=sheet_name)
             self._sheet_service = SheetService(self.creds, GOOGLE_SHEET_ID, sheet_name)
         return self._sheet_service
 
@@ -133,13 +140,23 @@ class ServiceProvider:
         return self._accounting_service
 
 def get_service_provider():
-    return ServiceProvider()
+    provider = ServiceProvider()
+    # GRAVITY_RECORD_DIR set: capture external calls of this job as a replay fixture
+    recorder = get_recorder()
+    if recorder:
+        return recorder.wrap_provider(provider)
+    return provider
 
 # State for Image Batching
 # user_id: {'images': [], 'timer': threading.Timer, 'reply_token': str}
 user_states = {}
 user_states_lock = threading.Lock()
 
+# Near-duplicate slips waiting for "ยืนยัน"
+# user_id: {'images': [message_id, ...], 'expires': float}
+pending_confirmations = {}
+CONFIRM_TTL = 600 # Seconds (LINE keeps message content available well beyond this)
+
 @bot_bp.route("/callback", methods=['POST'])
 def callback():
     # get X-Line-Signature header value
@@ -147,25 +164,25 @@ def callback():
 
     # get request body as text
     body = request.get_data(as_text=True)
-    print(f"DEBUG: Webhook Callback Received. Body length: {len(body)}")
+    events.debug('webhook_received', size=len(body))
+
+    recorder = get_recorder()
+    if recorder:
+        recorder.record_webhook(body)
 
     # handle webhook body
     try:
         if handler:
-            print("DEBUG: Passing body to handler...")
             handler.handle(body, signature)
-            print("DEBUG: Handler complete")
         else:
-            print("WARNING: Webhook received but handler is not initialized (check LINE credentials)")
+            events.warning('webhook_no_handler')
             current_app.logger.warning("Webhook received but handler is not initialized")
     except InvalidSignatureError:
-        print("❌ Invalid Signature Error")
+        events.warning('webhook_invalid_signature')
         current_app.logger.error("Invalid signature. Please check your channel access token/channel secret.")
         abort(400)
     except Exception as e:
-        print(f"❌ Webhook Handle Error: {e}")
-        import traceback
-        traceback.print_exc()
+        events.exception('webhook_failed', error=str(e))
 
     return 'OK'
 
@@ -176,52 +193,74 @@ if handler:
         user_id = event.source.user_id
         reply_token = event.reply_token
 
-        if text in ["export", "ขอไฟล์เบิกเงิน", "ทำบัญชี"]:
+        command, _, export_format = text.partition(' ')
+        if command in ["export", "ขอไฟล์เบิกเงิน", "ทำบัญชี"]:
+            # Optional format: "export csv", "ทำบัญชี parquet" (default xlsx)
+            export_format = export_format.strip() or 'xlsx'
             try:
                 # Lazy Load Services
                 provider = get_service_provider()
                 accounting_service = provider.accounting_service
                 
-                # Notify processing
-                if messaging_api:
-                    messaging_api.reply_message(
-                        ReplyMessageRequest(
-                            replyToken=reply_token,
-                            messages=[TextMessage(text="📊 กำลังสร้างไฟล์เบิกเงินและส่งเข้า Drive... รอสักครู่ครับ")]
-                        )
-                    )
+                # Notify processing (uses up the reply token: the result below is pushed)
+                send_messages(reply_token, user_id, [TextMessage(text="📊 กำลังสร้างไฟล์เบิกเงินและส่งเข้า Drive... รอสักครู่ครับ")])
                 
                 # Run export in background thread
                 def run_export():
                     try:
                         sheet_name = get_config().get('ACTIVE_SHEET_NAME', GOOGLE_SHEET_NAME)
                         folder_id = get_config().get_folder_for_sheet(sheet_name)
-                        link = accounting_service.export_report(folder_id)
-                        if link:
-                            msg = f"✅ สร้างไฟล์เสร็จแล้วครับ!\nโหลดได้ที่นี่: {link}"
+                        report = accounting_service.export_report(folder_id, fmt=export_format)
+                        if report and report['cached']:
+                            # Same sheet data as an earlier export (or one built at the same moment)
+                            msg = f"✅ ข้อมูลยังไม่เปลี่ยน ใช้ไฟล์ล่าสุดได้เลยครับ ({report['rows']} แถว)\nโหลดได้ที่นี่: {report['link']}"
+                        elif report:
+                            msg = (f"✅ สร้างไฟล์เสร็จแล้วครับ! ({report['rows']} แถว, {report['seconds']:.1f} วินาที)\n"
+                                   f"โหลดได้ที่นี่: {report['link']}")
                         else:
                             msg = "❌ ไม่พบข้อมูลใน Sheet หรือเกิดข้อผิดพลาดในการสร้างไฟล์"
                         
-                        if messaging_api:
-                            messaging_api.push_message(
-                                PushMessageRequest(
-                                    to=user_id,
-                                    messages=[TextMessage(text=msg)]
-                                )
-                            )
+                        send_messages(None, user_id, [TextMessage(text=msg)])
                     except Exception as e:
-                        print(f"Export Error: {e}")
-                        if messaging_api:
-                            messaging_api.push_message(
-                                PushMessageRequest(
-                                    to=user_id,
-                                    messages=[TextMessage(text=f"เกิดข้อผิดพลาด: {str(e)}")]
-                                )
-                            )
+                        events.exception('export_failed', user_id=user_id, error=str(e))
+                        send_messages(None, user_id, [TextMessage(text=f"เกิดข้อผิดพลาด: {str(e)}")])
 
                 threading.Thread(target=run_export).start()
             except Exception as e:
-                print(f"Text Handle Error: {e}")
+                events.exception('text_handle_failed', error=str(e))
+
+        elif text in ["summary", "สรุป", "สรุปยอด"]:
+            # Totals per shop / platform straight from the sheet data, no file
+            def run_summary():
+                try:
+                    provider = get_service_provider()
+                    summary = provider.accounting_service.summary()
+                    sheet_name = get_config().get('ACTIVE_SHEET_NAME', GOOGLE_SHEET_NAME)
+                    send_messages(reply_token, user_id, [TextMessage(text=accounting_summary_text(sheet_name, summary))])
+                except Exception as e:
+                    events.exception('summary_failed', user_id=user_id, error=str(e))
+                    send_messages(reply_token, user_id, [TextMessage(text=f"เกิดข้อผิดพลาด: {str(e)}")])
+
+            threading.Thread(target=run_summary).start()
+
+        elif text in ["confirm", "ยืนยัน"]:
+            with user_states_lock:
+                pending = pending_confirmations.pop(user_id, None)
+                if pending and pending['expires'] >= time.time():
+                    # Re-run the full pipeline on the same LINE images, skipping the near-duplicate check
+                    user_states[user_id] = {'images': pending['images'], 'timer': None, 'reply_token': reply_token, 'force': True}
+                else:
+                    pending = None
+
+            if pending:
+                enqueue_images_job(user_id)
+            elif messaging_api:
+                messaging_api.reply_message(
+                    ReplyMessageRequest(
+                        replyToken=reply_token,
+                        messages=[TextMessage(text="ไม่มีรูปที่รอการยืนยันค่ะ (หรือหมดเวลาแล้ว) กรุณาส่งรูปใหม่อีกครั้งนะคะ")]
+                    )
+                )
 
         elif text in ["status", "เช็กชีท", "ชีทไหน", "เช็ก"]:
             try:
@@ -252,7 +291,7 @@ if handler:
                         )
                     )
             except Exception as e:
-                print(f"Status Check Error: {e}")
+                events.exception('status_check_failed', error=str(e))
                 if messaging_api:
                     messaging_api.reply_message(
                         ReplyMessageRequest(
@@ -284,84 +323,274 @@ if handler:
                 user_states[user_id]['timer'].cancel()
             
             # Start new timer (1.0s) — รอ batch รูปหลายรูป แต่ให้สั้นพอเพื่อ process ได้ทันใน 30 วินาที
-            timer = threading.Timer(1.0, process_images_thread, args=[user_id])
+            timer = threading.Timer(1.0, enqueue_images_job, args=[user_id])
             user_states[user_id]['timer'] = timer
             timer.start()
 
 
+def send_messages(reply_token, user_id, messages):
+    """Reply first (free), fall back to push if the reply token has expired. reply_token=None: push only."""
+    if not messaging_api:
+        events.error('messaging_api_missing', user_id=user_id)
+        return
+    if reply_token:
+        try:
+            messaging_api.reply_message(
+                ReplyMessageRequest(replyToken=reply_token, messages=messages)
+            )
+            return
+        except Exception as e:
+            events.info('reply_failed_fallback_push', user_id=user_id, error=str(e))
+    try:
+        messaging_api.push_message(
+            PushMessageRequest(to=user_id, messages=messages)
+        )
+    except Exception as push_err:
+        events.error('push_failed', user_id=user_id, error=str(push_err))
+
+def known_order_summary(run_no, row):
+    """Summary for an order that is already in the sheet (columns B, C, F, H, I, J, L)."""
+    def col(i):
+        return row[i] if row and len(row) > i and row[i] else '-'
+    return (
+        f"📌 ออเดอร์นี้บันทึกไว้แล้ว (No. {run_no or '-'})\n"
+        f"ชื่อ: {col(1)}\n"
+        f"ที่อยู่: {col(2)}\n"
+        f"ร้าน: {col(7)}\n"
+        f"ยอด: {col(8)}\n"
+        f"เหรียญ: {col(9)}\n"
+        f"Platform: {col(5)}\n"
+        f"Order: {col(11)}\n"
+        f"(อ่านจากบาร์โค้ด ไม่ได้ส่งให้ AI ซ้ำ)"
+    )
+
+def accounting_summary_text(sheet_name, summary, limit=8):
+    """LINE text for AccountingService.summary(): totals, status, top shops and platforms by net."""
+    def money(value):
+        return f"{value:,.0f}"
+    status = summary['status']
+    lines = [
+        f"📊 สรุปยอด: {sheet_name}",
+        f"ออเดอร์ {summary['orders']} | ยอด {money(summary['price'])} | เหรียญ {money(summary['coins'])} | สุทธิ {money(summary['net'])}",
+        f"⏳ รอเช็ก {status['pending']['orders']} | ✅ เช็กแล้ว {status['checked']['orders']} | "
+        f"💾 saved {status['saved']['orders']} | ❌ ยกเลิก {status['cancelled']['orders']}",
+        "",
+        "🏪 ตามร้าน:",
+    ]
+    for row in summary['by_shop'][:limit]:
+        lines.append(f"• {row['shop']}: {row['orders']} ออเดอร์ สุทธิ {money(row['net'])} (เหรียญ {money(row['coins'])})")
+    if len(summary['by_shop']) > limit:
+        lines.append(f"… อีก {len(summary['by_shop']) - limit} ร้าน")
+    lines += ["", "🛒 ตาม Platform:"]
+    for row in summary['by_platform'][:limit]:
+        lines.append(f"• {row['platform']}: {row['orders']} ออเดอร์ สุทธิ {money(row['net'])} (เหรียญ {money(row['coins'])})")
+    return "\n".join(lines)
+
+def near_duplicate_summary(distance, entry):
+    """Shows the prior extraction of a near-duplicate slip and asks the user to confirm."""
+    prior = entry.get('data') or {}
+    return (
+        f"🔁 รูปนี้คล้ายกับออเดอร์ที่เคยบันทึกแล้ว (No. {entry.get('run_no') or '-'}, ชีท {entry.get('sheet_name') or '-'})\n"
+        f"ชื่อ: {prior.get('receiver_name', '-')}\n"
+        f"ร้าน: {prior.get('shop_name', '-')}\n"
+        f"ยอด: {prior.get('price', '-')}\n"
+        f"Order: {prior.get('order_id', '-')}\n\n"
+        f"ถ้าเป็นออเดอร์ใหม่จริงๆ พิมพ์ \"ยืนยัน\" ภายใน {CONFIRM_TTL // 60} นาที เพื่อประมวลผลใหม่ค่ะ"
+        f" (ความต่างของภาพ: {distance})"
+    )
+
+# Extraction jobs go through the durable queue (services/job_queue.py).
+# Default: every web process runs a small in-process consumer on the queue.
+# EXTRACTION_WORKER=external -> web only enqueues and the Procfile `worker:` process (worker.py) consumes;
+# separate services share the queue through REDIS_URL (a local jobs.db only works on one machine).
+EXTRACTION_WORKER = os.getenv('EXTRACTION_WORKER', 'inprocess').strip().lower()
+_inprocess_worker = None
+_inprocess_worker_lock = threading.Lock()
+
+def job_handlers():
+    return {
+        'process_images': lambda p, attempt: process_images_job(
+            p['user_id'], p['image_ids'], p['reply_token'], p.get('force', False), attempt=attempt
+        )
+    }
+
+class TransientJobError(Exception):
+    """A pipeline failure another attempt may fix (LINE download failed)."""
+
+# Errors worth another attempt: quota, timeouts, upstream 5xx. Anything else is reported at once.
+TRANSIENT_STATUS = (408, 429, 500, 502, 503, 504)
+TRANSIENT_MARKERS = ('429', 'quota', 'rate limit', 'resource exhausted', 'timed out', 'timeout',
+                     'temporarily unavailable', 'connection reset', 'connection aborted')
+
+def is_transient_error(error):
+    if isinstance(error, (TransientJobError, TimeoutError, ConnectionError)):
+        return True
+    response = getattr(error, 'response', None)
+    status = getattr(response, 'status_code', None) or getattr(error, 'status_code', None) or getattr(error, 'status', None)
+    if status in TRANSIENT_STATUS:
+        return True
+    message = str(error).lower()
+    return any(marker in message for marker in TRANSIENT_MARKERS)
+
+def ensure_inprocess_worker():
+    global _inprocess_worker
+    if EXTRACTION_WORKER == 'external' or _inprocess_worker is not None:
+        return
+    with _inprocess_worker_lock:
+        if _inprocess_worker is None:
+            concurrency = int(os.getenv('EXTRACTION_CONCURRENCY', '2'))
+            _inprocess_worker = JobWorker(get_job_queue(), job_handlers(), concurrency=concurrency).start()
+
+def enqueue_images_job(user_id):
+    # Retrieve and clear the batch, then persist it before anything else can fail
+    with user_states_lock:
+        state = user_states.pop(user_id, None)
+    if not state:
+        return
+
+    payload = {
+        'user_id': user_id,
+        'image_ids': state['images'],
+        'reply_token': state['reply_token'],
+        'force': state.get('force', False)
+    }
+    try:
+        get_job_queue().enqueue('process_images', payload)
+    except Exception as e:
+        # Queue file unavailable: process right here rather than drop the order
+        events.exception('job_enqueue_failed', user_id=user_id, error=str(e))
+        process_images_job(**payload)
+        return
+    ensure_inprocess_worker()
+
 def process_images_thread(user_id):
-    # Retrieve and clear state
+    # Direct (non-queued) run of the current batch, used by replay_bench.py
     with user_states_lock:
         if user_id not in user_states:
             return
         state = user_states.pop(user_id)
-    
-    image_ids = state['images']
-    reply_token = state['reply_token']
+    process_images_job(user_id, state['images'], state['reply_token'], state.get('force', False))
 
+def process_images_job(user_id, image_ids, reply_token, force=False, attempt=None):
     # ไม่ส่งข้อความ "กำลังประมวลผล" เพราะ reply token ใช้ได้แค่ครั้งเดียว
     # เก็บ token ไว้ใช้กับผลลัพธ์สุดท้าย (reply_message = ฟรี ไม่เสีย quota)
-    print(f"DEBUG: Processing {len(image_ids)} image(s) for user {user_id}")
+    # attempt: queue attempt (None = direct run). Transient errors are raised for the queue to retry
+    # with backoff; the user only hears about an error on the last attempt.
+    events.info('job_started', user_id=user_id, images=len(image_ids), force=force, attempt=attempt)
 
     final_messages = []
+    pipeline_start = time.perf_counter()
+    pipeline_outcome = 'error'
 
     try:
         # 1. Initialize Services inside try-block (Lazy)
-        print("DEBUG: [1] Initializing service provider...", flush=True)
         provider = get_service_provider()
         image_service = provider.image_service
         drive_service = provider.drive_service
         ai_service = provider.ai_service
         sheet_service = provider.sheet_service
-        print("DEBUG: [2] Service references obtained", flush=True)
         
         # 2. Download Images
-        print(f"DEBUG: [3] Downloading {len(image_ids)} images...", flush=True)
         headers = {'Authorization': f'Bearer {LINE_CHANNEL_ACCESS_TOKEN}'}
         downloaded_paths = []
-        for msg_id in image_ids:
-            path = image_service.download_image(msg_id, headers)
-            if path:
-                downloaded_paths.append(path)
+        with metrics.span('line_download') as span:
+            for msg_id in image_ids:
+                path = image_service.download_image(msg_id, headers)
+                if path:
+                    downloaded_paths.append(path)
+            span.size = sum(os.path.getsize(p) for p in downloaded_paths)
+            if not downloaded_paths:
+                span.outcome = 'empty'
         
         if not downloaded_paths:
-            raise Exception("ดาวน์โหลดรูปภาพไม่สำเร็จ")
-        print(f"DEBUG: [4] Downloaded {len(downloaded_paths)} images", flush=True)
+            raise TransientJobError("ดาวน์โหลดรูปภาพไม่สำเร็จ")
+        events.debug('job_downloaded', user_id=user_id, images=len(downloaded_paths))
+
+        # 2.1 Local barcode/QR fast path: known orders skip the AI call entirely
+        with metrics.span('barcode_decode') as span:
+            barcodes = image_service.decode_barcodes(downloaded_paths)
+            span.outcome = 'found' if barcodes else 'none'
+        for code in barcodes:
+            if not sheet_service.check_duplicate(code):
+                continue
+            if not get_config().get('BARCODE_SKIP_KNOWN', True):
+                break
+            events.info('barcode_known_order', user_id=user_id, order_id=code)
+            _, known_row = sheet_service.find_row_by_order_id(code)
+            known_run_no = known_row[3] if known_row and len(known_row) > 3 else None
+            send_messages(reply_token, user_id, [TextMessage(text=known_order_summary(known_run_no, known_row))])
+            pipeline_outcome = 'known_order'
+            return
 
         # 3. Stitch or Select Image
         final_image_path = downloaded_paths[0]
         if len(downloaded_paths) >= 2:
-            print(f"DEBUG: [5] Stitching {len(downloaded_paths)} images...", flush=True)
             final_image_path = os.path.join("temp_images", f"stitched_{int(time.time())}_{user_id[:5]}.jpg")
             os.makedirs("temp_images", exist_ok=True)
-            image_service.stitch_images(downloaded_paths[0], downloaded_paths[1], final_image_path)
-            print("DEBUG: [6] Stitching complete", flush=True)
+            with metrics.span('stitch') as span:
+                image_service.stitch_images(downloaded_paths[0], downloaded_paths[1], final_image_path)
+                span.size = os.path.getsize(final_image_path)
+
+        # 3.1 Near-duplicate check (perceptual hash): re-screenshots reuse the prior extraction
+        image_hash = None
+        try:
+            image_hash = phash(final_image_path)
+        except Exception as e:
+            events.warning('phash_failed', error=str(e))
+
+        if image_hash is not None and not force:
+            max_distance = int(get_config().get('PHASH_MAX_DISTANCE', 4))
+            with metrics.span('near_duplicate') as span:
+                distance, near_entry = get_phash_index().find_near(image_hash, max_distance)
+                span.outcome = 'hit' if near_entry else 'miss'
+            if near_entry:
+                events.info('near_duplicate', user_id=user_id, order_id=near_entry.get('order_id'), distance=distance)
+                with user_states_lock:
+                    pending_confirmations[user_id] = {'images': image_ids, 'expires': time.time() + CONFIRM_TTL}
+                send_messages(reply_token, user_id, [TextMessage(text=near_duplicate_summary(distance, near_entry))])
+                pipeline_outcome = 'near_duplicate'
+                return
             
         # 4. AI Extraction (with auto-retry if failed)
-        print(f"DEBUG: [7] Extracting data with {ai_service.__class__.__name__}...", flush=True)
-        data = ai_service.extract_with_retry(final_image_path)
-        print(f"DEBUG: [8] AI Extraction complete. Data: {data}", flush=True)
+        with metrics.span('ai_extraction') as span:
+            span.size = os.path.getsize(final_image_path)
+            data = ai_service.extract_with_retry(final_image_path)
+            if not data:
+                span.outcome = 'empty'
+        # Field names only: the values are receiver names/addresses
+        events.debug('ai_extracted', user_id=user_id, service=ai_service.__class__.__name__,
+                     fields=sorted(k for k, v in data.items() if v) if data else [])
         
+        # Not transient: the model answered, so a retry would repeat the paid call for the same result
         if not data:
              raise Exception("AI ไม่สามารถสกัดข้อมูลจากรูปภาพได้")
 
+        # Cross-validate IDs read by the model against locally decoded barcodes
+        if barcodes:
+            data['order_id'] = image_service.reconcile_code(data.get('order_id'), barcodes)
+            if data.get('tracking_number'):
+                data['tracking_number'] = image_service.reconcile_code(data.get('tracking_number'), barcodes)
+
         # 5. Duplicate Check & Update Logic
         order_id = data.get('order_id')
         if not order_id:
             raise Exception("ไม่พบเลขออเดอร์ในรูปภาพ")
             
-        is_duplicate = sheet_service.check_duplicate(order_id)
         existing_run_no = None
         target_row_idx = None
 
-        if is_duplicate:
-            print(f"DEBUG: Duplicate order {order_id} found. Fetching row info for update.")
-            target_row_idx, existing_row_data = sheet_service.find_row_by_order_id(order_id)
-            if existing_row_data and len(existing_row_data) >= 4:
-                try:
-                    existing_run_no = int(existing_row_data[3]) # Column D index 3
-                except:
-                    existing_run_no = None
+        with metrics.span('duplicate_check') as span:
+            is_duplicate = sheet_service.check_duplicate(order_id)
+            span.outcome = 'duplicate' if is_duplicate else 'new'
+
+            if is_duplicate:
+                events.info('duplicate_order', user_id=user_id, order_id=order_id)
+                target_row_idx, existing_row_data = sheet_service.find_row_by_order_id(order_id)
+                if existing_row_data and len(existing_row_data) >= 4:
+                    try:
+                        existing_run_no = int(existing_row_data[3]) # Column D index 3
+                    except:
+                        existing_run_no = None
 
         # 6. Drive Upload
         # Use existing Run No if updating, otherwise get new one
@@ -372,34 +601,49 @@ def process_images_thread(user_id):
         drive_error_msg = ""
         folder_display_name = "Unknown"
         
-        try:
-            sheet_name = get_config().get('ACTIVE_SHEET_NAME', GOOGLE_SHEET_NAME)
-            folder_id = get_config().get_folder_for_sheet(sheet_name)
-            folder_display_name = drive_service.get_folder_name(folder_id)
-            
-            drive_file = drive_service.upload_file(final_image_path, folder_id, target_filename)
-            if drive_file:
-                drive_link = drive_file.get('webViewLink', '')
-            else:
-                drive_error_msg = "Google Drive API returned None (Unknown Error)"
-        except Exception as e:
-            drive_error_msg = str(e)
-            print(f"DEBUG: Drive Upload Error: {e}")
+        with metrics.span('drive_upload') as span:
+            span.size = os.path.getsize(final_image_path)
+            try:
+                sheet_name = get_config().get('ACTIVE_SHEET_NAME', GOOGLE_SHEET_NAME)
+                folder_id = get_config().get_folder_for_sheet(sheet_name)
+                folder_display_name = drive_service.get_folder_name(folder_id)
+                
+                drive_file = drive_service.upload_file(final_image_path, folder_id, target_filename)
+                if drive_file:
+                    drive_link = drive_file.get('webViewLink', '')
+                else:
+                    drive_error_msg = "Google Drive API returned None (Unknown Error)"
+                    span.outcome = 'empty'
+            except Exception as e:
+                drive_error_msg = str(e)
+                span.outcome = 'error'
+                events.error('drive_upload_failed', user_id=user_id, error=str(e))
         
         data['image_link'] = drive_link
 
         # 7. Save or Update Sheet Data
         success = False
-        if is_duplicate and target_row_idx:
-            print(f"DEBUG: Updating existing row {target_row_idx} for order {order_id}")
-            success = sheet_service.update_existing_data(target_row_idx, data, next_run_no, existing_row_data=existing_row_data)
-            status_prefix = "✅ อัปเดตแล้ว!"
-        else:
-            print(f"DEBUG: Appending new row for order {order_id}")
-            success = sheet_service.append_data(data, next_run_no)
-            status_prefix = "✅ บันทึกแล้ว!"
+        with metrics.span('sheet_write') as span:
+            if is_duplicate and target_row_idx:
+                success = sheet_service.update_existing_data(target_row_idx, data, next_run_no, existing_row_data=existing_row_data)
+                status_prefix = "✅ อัปเดตแล้ว!"
+                span.outcome = 'update'
+            else:
+                success = sheet_service.append_data(data, next_run_no)
+                status_prefix = "✅ บันทึกแล้ว!"
+                span.outcome = 'append'
+            if not success:
+                span.outcome = 'failed'
 
         if success:
+            pipeline_outcome = 'ok'
+            if image_hash is not None:
+                try:
+                    sheet_name = get_config().get('ACTIVE_SHEET_NAME', GOOGLE_SHEET_NAME)
+                    get_phash_index().add(image_hash, data, run_no=next_run_no, sheet_name=sheet_name)
+                except Exception as e:
+                    events.warning('phash_record_failed', error=str(e))
+
             # Success Summary
             tracking_info = f"\nTracking: {data.get('tracking_number')}" if data.get('tracking_number') and data.get('tracking_number') != '-' else ""
             
@@ -422,64 +666,30 @@ def process_images_thread(user_id):
             )
             final_messages.append(TextMessage(text=summary))
             
-            # Send Final Result via Reply Message (Free)
-            if messaging_api:
-                try:
-                    print(f"DEBUG: Attempting reply_message for user {user_id}...")
-                    messaging_api.reply_message(
-                         ReplyMessageRequest(
-                              replyToken=reply_token,
-                              messages=final_messages
-                         )
-                    )
-                    print("DEBUG: reply_message successful")
-                except Exception as e:
-                    print(f"DEBUG: reply_message failed (likely expired token): {e}")
-                    # Fallback to Push Message (Might cost quota but more reliable)
-                    try:
-                        print(f"DEBUG: Attempting fallback push_message for user {user_id}...")
-                        messaging_api.push_message(
-                            PushMessageRequest(
-                                to=user_id,
-                                messages=final_messages
-                            )
-                        )
-                        print("DEBUG: Fallback push_message successful")
-                    except Exception as push_err:
-                        print(f"❌ CRITICAL: Both reply and push failed: {push_err}")
-            else:
-                print("❌ ERROR: messaging_api is None. Cannot reply to user.")
+            # Send Final Result via Reply Message (Free), push if the token expired
+            send_messages(reply_token, user_id, final_messages)
         else:
              error_detail = getattr(sheet_service, 'last_error', 'โปรดตรวจสอบชื่อหน้าชีท หรือสิทธิ์เข้าถึง')
              raise Exception(f"ไม่สามารถบันทึกข้อมูลลง Google Sheet ได้: {error_detail}")
 
     except Exception as e:
-        import traceback
-        error_detail = traceback.format_exc()
-        print(f"❌ ERROR in process_images_thread: {e}\n{error_detail}")
+        transient = is_transient_error(e)
+        if transient and attempt is not None and attempt < MAX_ATTEMPTS:
+            # The queue retries with backoff; nothing is sent to the user yet
+            pipeline_outcome = 'retry'
+            events.warning('job_retry', user_id=user_id, attempt=attempt, error=str(e))
+            raise
+        events.exception('job_failed', user_id=user_id, attempt=attempt, error=str(e))
         
         error_msg = f"❌ เกิดข้อผิดพลาดในการประมวลผล:\n{str(e)}"
-        final_messages_err = [TextMessage(text=error_msg)]
-        if messaging_api:
-            try:
-                messaging_api.reply_message(
-                     ReplyMessageRequest(
-                          replyToken=reply_token,
-                          messages=final_messages_err
-                     )
-                )
-            except Exception as reply_err:
-                print(f"DEBUG: Failed to send error message via reply: {reply_err}")
-                try:
-                    messaging_api.push_message(
-                        PushMessageRequest(
-                            to=user_id,
-                            messages=final_messages_err
-                        )
-                    )
-                except Exception as push_err:
-                    print(f"❌ Failed to send error message via push: {push_err}")
+        send_messages(reply_token, user_id, [TextMessage(text=error_msg)])
+        if transient and attempt is not None:
+            raise  # Out of attempts: the queue parks the job as 'dead'
     finally:
+        pipeline_elapsed = time.perf_counter() - pipeline_start
+        metrics.observe('pipeline', pipeline_elapsed, pipeline_outcome)
+        events.info('job_finished', user_id=user_id, outcome=pipeline_outcome, seconds=round(pipeline_elapsed, 3))
+
         # Cleanup temp files
         try:
             if 'downloaded_paths' in locals():
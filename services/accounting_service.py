@@ -1,78 +1,363 @@
-import pandas as pd
+import csv
+import hashlib
+import io
 import os
+import tempfile
+import threading
+import time
 from datetime import datetime
 
+from .event_log import get_event_log
+from .order_columns import canonical_column, column_renames
+
+events = get_event_log()
+
+# format -> (extension, mimetype)
+EXPORT_FORMATS = {
+    'xlsx': ('.xlsx', 'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet'),
+    'csv': ('.csv', 'text/csv'),
+    'parquet': ('.parquet', 'application/vnd.apache.parquet'),
+}
+SPOOL_MAX_BYTES = 16 * 1024 * 1024  # Report stays in memory up to this size, then spills to a temp file
+EXPORT_CACHE_SIZE = 32              # Finished exports remembered per process
+
+# (worksheet, format, folder, data fingerprint) -> finished export result; and builds in progress
+_export_results = {}
+_export_flights = {}
+_export_lock = threading.Lock()
+
+SUMMARY_CACHE_SIZE = 16
+STATUS_KEYS = ('pending', 'checked', 'saved', 'cancelled')
+UNKNOWN_GROUP = '(ไม่ระบุ)'
+# (sheet, version) -> summary dict
+_summaries = {}
+_summary_lock = threading.Lock()
+
+def _current_rss():
+    """Resident set size in bytes (Linux /proc), None where unavailable."""
+    try:
+        with open('/proc/self/statm') as f:
+            return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+    except (OSError, ValueError, AttributeError):
+        return None
+
+class _PeakRssSampler:
+    """
+    Peak RSS growth while the block runs, sampled every `interval` seconds.
+    (tracemalloc would be exact for Python objects but slows openpyxl ~6x.)
+    Process-wide, so concurrent requests count too: an upper bound, not an exact figure.
+    """
+    def __init__(self, interval=0.05):
+        self.interval = interval
+        self.base = None
+        self.peak = None
+        self._stop = threading.Event()
+        self._thread = None
+
+    def __enter__(self):
+        self.base = self.peak = _current_rss()
+        if self.base is not None:
+            self._thread = threading.Thread(target=self._run, daemon=True)
+            self._thread.start()
+        return self
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            self._sample()
+
+    def _sample(self):
+        rss = _current_rss()
+        if rss is not None and rss > self.peak:
+            self.peak = rss
+
+    def __exit__(self, *exc):
+        self._stop.set()
+        if self._thread:
+            self._thread.join()
+            self._sample()
+        return False
+
+    @property
+    def growth(self):
+        return max(0, self.peak - self.base) if self.base is not None else 0
+
+def data_fingerprint(header, records):
+    """Content version of the sheet data: equal exactly when the exported rows would be."""
+    digest = hashlib.sha1()
+    digest.update('\x1f'.join(header).encode('utf-8'))
+    for record in records:
+        digest.update(b'\x1e')
+        digest.update('\x1f'.join(str(record.get(h, '')) for h in header).encode('utf-8'))
+    return digest.hexdigest()
+
+class _ExportFlight:
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+def _price_value(value):
+    try:
+        return float(str(value).replace(',', '').strip() or 0)
+    except ValueError:
+        return 0.0
+
+def _numeric(column):
+    # "1,250", " 890 ", "฿45" -> float; anything else -> 0
+    import pandas as pd
+    cleaned = column.astype(str).str.replace(r'[,\s฿]', '', regex=True)
+    return pd.to_numeric(cleaned, errors='coerce').fillna(0.0)
+
+def _status_keys(column):
+    # Same buckets as orderStatusKey() in static/js/app.js
+    status = column.fillna('').astype(str).str.strip().str.lower()
+    key = status.where(status.isin(['checked', 'saved']), 'pending')
+    return key.mask(status.str.contains('cancel', regex=False), 'cancelled')
+
+def compute_summary(records):
+    """
+    Vectorized totals over order records (raw sheet headers or canonical names):
+    overall and per status, per shop and per platform. net = price - coins. Cancelled orders are
+    counted under status but left out of the overall / shop / platform money totals.
+    """
+    import pandas as pd
+    # Only the five columns used, straight from the records (cheaper than a full DataFrame)
+    columns = {}
+    for header, canonical in column_renames(records[0].keys() if records else []).items():
+        columns.setdefault(canonical, header)  # Two headers with the same canonical name: first wins
+    index = pd.RangeIndex(len(records))
+
+    def column(name):
+        header = columns.get(name)
+        return pd.Series([r.get(header) for r in records], index=index, dtype=object) if header else None
+
+    def text(name):
+        values = column(name)
+        if values is None:
+            return pd.Series(UNKNOWN_GROUP, index=index)
+        values = values.fillna('').astype(str).str.strip()
+        return values.mask(values == '', UNKNOWN_GROUP)
+
+    price, coins, status = column('Price'), column('Coins'), column('Status')
+    price = _numeric(price) if price is not None else pd.Series(0.0, index=index)
+    coins = _numeric(coins) if coins is not None else pd.Series(0.0, index=index)
+    status = _status_keys(status) if status is not None else pd.Series('pending', index=index)
+    frame = pd.DataFrame({
+        'shop': text('Shop'), 'platform': text('Platform'), 'status': status,
+        'price': price, 'coins': coins, 'net': price - coins,
+    })
+    for key in STATUS_KEYS:
+        frame[key] = (status == key).astype(int)
+    active = frame[frame['status'] != 'cancelled']
+
+    by_status = frame.groupby('status')[['price', 'coins', 'net']].agg(['sum', 'count'])
+    status_totals = {}
+    for key in STATUS_KEYS:
+        if key in by_status.index:
+            row = by_status.loc[key]
+            status_totals[key] = {'orders': int(row[('net', 'count')]), 'price': round(float(row[('price', 'sum')]), 2),
+                                  'coins': round(float(row[('coins', 'sum')]), 2), 'net': round(float(row[('net', 'sum')]), 2)}
+        else:
+            status_totals[key] = {'orders': 0, 'price': 0.0, 'coins': 0.0, 'net': 0.0}
+
+    def grouped(by):
+        sums = active.groupby(by)[['price', 'coins', 'net', 'pending', 'checked', 'saved']].sum()
+        sums['orders'] = active.groupby(by).size()
+        sums = sums.sort_values('net', ascending=False)
+        return [
+            {by: name, 'orders': int(row.orders), 'price': round(float(row.price), 2), 'coins': round(float(row.coins), 2),
+             'net': round(float(row.net), 2), 'pending': int(row.pending), 'checked': int(row.checked), 'saved': int(row.saved)}
+            for name, row in zip(sums.index, sums.itertuples(index=False))
+        ]
+
+    return {
+        'orders': int(len(active)),
+        'price': round(float(active['price'].sum()), 2),
+        'coins': round(float(active['coins'].sum()), 2),
+        'net': round(float(active['net'].sum()), 2),
+        'status': status_totals,
+        'by_shop': grouped('shop'),
+        'by_platform': grouped('platform'),
+    }
+
+def accounting_summary(sheet, version, records):
+    """compute_summary() once per (sheet, version); repeated calls are a dict lookup."""
+    key = (sheet, version)
+    with _summary_lock:
+        summary = _summaries.get(key)
+    if summary is not None:
+        return summary
+    start = time.perf_counter()
+    summary = compute_summary(records or [])
+    events.debug('accounting_summary_computed', sheet=sheet, records=len(records or []),
+                 ms=round((time.perf_counter() - start) * 1000, 1))
+    with _summary_lock:
+        _summaries[key] = summary
+        while len(_summaries) > SUMMARY_CACHE_SIZE:
+            _summaries.pop(next(iter(_summaries)))
+    return summary
+
 class AccountingService:
     def __init__(self, sheet_service, drive_service):
         self.sheet_service = sheet_service
         self.drive_service = drive_service
-        self.temp_dir = "temp_reports"
-        if not os.path.exists(self.temp_dir):
-            os.makedirs(self.temp_dir)
 
-    def export_report(self, folder_id):
+    def export_report(self, folder_id, fmt='xlsx'):
         """
-        Fetches data, sorts it, generates Excel, and uploads to Drive.
-        Returns: Drive Link
+        Fetches data, sorts it (Shop -> Item -> Price), writes the report and uploads it to Drive.
+        Exports are keyed by (worksheet, format, folder, data fingerprint):
+        - unchanged data: the earlier Drive file is returned at once ('cached': True) if it still exists
+        - concurrent identical requests wait for one build and share its result
+        Returns: {'link', 'filename', 'format', 'rows', 'bytes', 'seconds', 'rows_per_sec', 'peak_mb', 'cached'} or None
         """
+        if fmt not in EXPORT_FORMATS:
+            raise ValueError(f"Unknown export format '{fmt}' (use {', '.join(EXPORT_FORMATS)})")
+
         # 1. Get Data
-        print("Fetching data for export...")
         records = self.sheet_service.get_all_data()
         if not records:
             return None
+        header = list(records[0].keys())
+        sheet = self.sheet_service.sheet.title if self.sheet_service.sheet else ''
+        key = (sheet, fmt, folder_id, data_fingerprint(header, records))
+
+        with _export_lock:
+            cached = _export_results.get(key)
+            flight = _export_flights.get(key) if cached is None else None
+            leader = cached is None and flight is None
+            if leader:
+                flight = _export_flights[key] = _ExportFlight()
+
+        if cached is not None:
+            if self.drive_service.file_exists(cached['file_id']):
+                events.info('report_export_reused', sheet=sheet, format=fmt, filename=cached['filename'])
+                return dict(cached, cached=True)
+            with _export_lock:
+                _export_results.pop(key, None)  # Deleted in Drive: build again
+            return self.export_report(folder_id, fmt)
+
+        if not leader:
+            events.info('report_export_joined', sheet=sheet, format=fmt)
+            flight.done.wait()
+            if flight.error is not None:
+                raise flight.error
+            return dict(flight.result, cached=True) if flight.result else None
 
-        # 2. Convert to DataFrame
-        df = pd.DataFrame(records)
-        
-        # Expected Columns based on SheetService mapping (approximate)
-        # We need to map the header names from the sheet to our logic
-        # Run No., Image Link, ชื่อหน้ากล่อง, ส่งที่ไหน, Platform, วันที่ซื้อ, ชื่อร้าน, ราคาของ, เหรียญ, ชื่อของ, เลขออเดอร์, เลขพัสดุ
-        
-        # Let's check if the dataframe is empty or missing columns
-        if df.empty: return None
-
-        # 3. Sort Data: Shop Name (H) -> Item Name (K) -> Price (I)
-        # Note: Column headers from get_all_records() are the first row keys
-        # We need to ensure we use the correct Thai headers as defined in the sheet
-        # H: ชื่อร้าน
-        # K: ชื่อของ
-        # I: ราคาของ
-        
         try:
-            # Clean Price for sorting (remove commas)
-            if 'ราคาของ' in df.columns:
-                df['price_val'] = df['ราคาของ'].astype(str).str.replace(',', '', regex=True)
-                df['price_val'] = pd.to_numeric(df['price_val'], errors='coerce').fillna(0)
-            else:
-                df['price_val'] = 0
-
-            # Sort
-            sort_cols = []
-            if 'ชื่อร้าน' in df.columns: sort_cols.append('ชื่อร้าน')
-            if 'ชื่อของ' in df.columns: sort_cols.append('ชื่อของ')
-            sort_cols.append('price_val')
-            
-            df_sorted = df.sort_values(by=sort_cols)
-            
-            # Remove helper column
-            df_sorted = df_sorted.drop(columns=['price_val'])
-            
+            flight.result = self._build_report(records, header, folder_id, fmt)
+            if flight.result:
+                with _export_lock:
+                    _export_results[key] = flight.result
+                    while len(_export_results) > EXPORT_CACHE_SIZE:
+                        _export_results.pop(next(iter(_export_results)))
+            return dict(flight.result, cached=False) if flight.result else None
         except Exception as e:
-            print(f"Sorting error: {e}")
-            df_sorted = df # Fallback to original order
-
-        # 4. Generate Excel
-        date_str = datetime.now().strftime("%Y%m%d_%H%M")
-        filename = f"Accounting_Report_{date_str}.xlsx"
-        file_path = os.path.join(self.temp_dir, filename)
-        
-        print(f"Saving Excel to {file_path}...")
-        df_sorted.to_excel(file_path, index=False, engine='openpyxl')
-
-        # 5. Upload to Drive
-        print("Uploading report to Drive...")
-        drive_file = self.drive_service.upload_file(file_path, folder_id, custom_name=filename)
-        
-        if drive_file:
-            return drive_file.get('webViewLink', '')
-        return None
+            flight.error = e
+            raise
+        finally:
+            with _export_lock:
+                _export_flights.pop(key, None)
+            flight.done.set()
+
+    def summary(self):
+        """Aggregates of the current worksheet, cached per data fingerprint (no file is generated)."""
+        records = self.sheet_service.get_all_data()
+        header = list(records[0].keys()) if records else []
+        sheet = self.sheet_service.sheet.title if self.sheet_service.sheet else ''
+        return accounting_summary(sheet, data_fingerprint(header, records), records)
+
+    def _build_report(self, records, header, folder_id, fmt):
+        extension, mimetype = EXPORT_FORMATS[fmt]
+        start = time.perf_counter()
+        with _PeakRssSampler() as memory:
+            # 2. Sort Data: Shop Name (H) -> Item Name (K) -> Price (I), typed keys instead of a DataFrame
+            rows = self._sorted_rows(records, header)
+
+            # 3. Write + 4. Upload
+            date_str = datetime.now().strftime("%Y%m%d_%H%M")
+            filename = f"Accounting_Report_{date_str}{extension}"
+            with tempfile.SpooledTemporaryFile(max_size=SPOOL_MAX_BYTES) as fh:
+                getattr(self, f'_write_{fmt}')(fh, header, rows)
+                size = fh.tell()
+                written = time.perf_counter()
+                drive_file = self.drive_service.upload_stream(fh, filename, mimetype, folder_id=folder_id)
+            if not drive_file:
+                return None
+
+            seconds = time.perf_counter() - start
+            result = {
+                'link': drive_file.get('webViewLink', ''),
+                'file_id': drive_file.get('id'),
+                'filename': filename,
+                'format': fmt,
+                'rows': len(rows),
+                'bytes': size,
+                'seconds': round(seconds, 3),
+                'rows_per_sec': round(len(rows) / max(written - start, 1e-9)),  # Sort + write
+                'peak_mb': round(memory.growth / (1024 * 1024), 1),  # RSS growth during the export
+            }
+        events.info('report_exported', upload_seconds=round(time.perf_counter() - written, 3),
+                    **{k: v for k, v in result.items() if k != 'link'})
+        return result
+
+    @staticmethod
+    def _sorted_rows(records, header):
+        columns = {canonical_column(h): h for h in reversed(header)}  # First matching header wins
+        shop, item, price = columns.get('Shop'), columns.get('Item'), columns.get('Price')
+
+        def key(record):
+            return (
+                str(record.get(shop, '')) if shop else '',
+                str(record.get(item, '')) if item else '',
+                _price_value(record.get(price)) if price else 0.0,
+            )
+
+        try:
+            ordered = sorted(records, key=key)
+        except Exception as e:
+            events.warning('report_sort_failed', error=str(e))
+            ordered = records  # Fallback to original order
+        return [[record.get(h, '') for h in header] for record in ordered]
+
+    @staticmethod
+    def _write_xlsx(fh, header, rows):
+        # Write-only mode streams rows to the zip instead of building every cell object
+        from openpyxl import Workbook
+        from openpyxl.cell import WriteOnlyCell
+        from openpyxl.styles import Font
+
+        wb = Workbook(write_only=True)
+        ws = wb.create_sheet('Sheet1')
+        bold = Font(bold=True)
+        header_cells = []
+        for title in header:
+            cell = WriteOnlyCell(ws, value=title)
+            cell.font = bold
+            header_cells.append(cell)
+        ws.append(header_cells)
+        for row in rows:
+            ws.append(row)
+        wb.save(fh)
+
+    @staticmethod
+    def _write_csv(fh, header, rows, batch=1000):
+        # BOM: Excel opens Thai text correctly only with it. Encoded in batches
+        # (SpooledTemporaryFile cannot be wrapped in a TextIOWrapper on Python 3.10)
+        fh.write('\ufeff'.encode('utf-8'))
+        buf = io.StringIO()
+        writer = csv.writer(buf)
+        writer.writerow(header)
+        for i in range(0, len(rows), batch):
+            writer.writerows(rows[i:i + batch])
+            fh.write(buf.getvalue().encode('utf-8'))
+            buf.seek(0)
+            buf.truncate()
+        fh.write(buf.getvalue().encode('utf-8'))
+
+    @staticmethod
+    def _write_parquet(fh, header, rows):
+        import pandas as pd
+        try:
+            pd.DataFrame(rows, columns=header).to_parquet(fh, index=False)
+        except ImportError as e:
+            raise Exception(f"Parquet export needs pyarrow installed: {e}")
@@ -1,4 +1,8 @@
 import base64
+from .shop_matcher import ShopMatcherRegistry
+from .event_log import get_event_log
+
+events = get_event_log()
 
 class AIBaseService:
     SHOP_MAPPING = {
@@ -49,27 +53,31 @@ class AIBaseService:
         "ความสุขเทเลคอม": ["ความสุขเทเลคอม"],
         "U shop": ["u shop"]
     }
+    _shop_registry = None
 
     def __init__(self, api_key):
         self.api_key = api_key
+        self.model = None
+        self.last_usage = None # {'input_tokens': int, 'output_tokens': int} of the latest call (extract_with_retry: all attempts)
+
+    @classmethod
+    def shop_matcher_registry(cls):
+        """Process-wide compiled matcher built once from SHOP_MAPPING (+ _GravityShops tab)."""
+        # Stored on the base class so OpenAI/Gemini share one matcher (and one reload)
+        if AIBaseService._shop_registry is None:
+            AIBaseService._shop_registry = ShopMatcherRegistry(AIBaseService.SHOP_MAPPING)
+        return AIBaseService._shop_registry
 
     @classmethod
     def map_shop_name(cls, raw_name):
-        """Standardize shop name based on keywords."""
+        """Standardize shop name based on keywords (longest match, then fuzzy)."""
         if not raw_name:
             return raw_name
-            
-        raw_name_lower = raw_name.lower().strip()
-        print(f"DEBUG: Processing Raw Shop Name: '{raw_name}'")
-        
-        # Check for exact matches and keyword contains
-        for standard_name, keywords in cls.SHOP_MAPPING.items():
-            for kw in keywords:
-                if kw in raw_name_lower:
-                    print(f"DEBUG: Mapped '{raw_name}' -> '{standard_name}' (Match found for keyword '{kw}')")
-                    return standard_name
-        
-        print(f"DEBUG: No mapping found for '{raw_name}'. Returning original.")
+
+        standard_name, how = cls.shop_matcher_registry().matcher.match(raw_name)
+        if standard_name:
+            events.debug('shop_mapped', raw=raw_name, shop=standard_name, how=how)
+            return standard_name
         return raw_name
 
     def encode_image(self, image_path):
@@ -92,25 +100,35 @@ class AIBaseService:
         """
         import time
 
+        # Failed and empty attempts are billed too: last_usage ends up as the sum over every attempt
+        usage = None
+        result = None
         for attempt in range(max_retries + 1):
+            self.last_usage = None
             try:
-                print(f"DEBUG: AI extract attempt {attempt + 1}/{max_retries + 1}")
+                events.debug('ai_extract_attempt', model=self.model, attempt=attempt + 1, max_attempts=max_retries + 1)
                 result = self.extract_data_from_image(image_path)
                 if result is not None:
                     if attempt > 0:
-                        print(f"DEBUG: AI extract succeeded on retry attempt {attempt + 1}")
-                    return result
+                        events.info('ai_extract_retry_succeeded', model=self.model, attempt=attempt + 1)
                 else:
-                    print(f"DEBUG: AI returned None on attempt {attempt + 1}")
+                    events.warning('ai_extract_empty', model=self.model, attempt=attempt + 1)
             except Exception as e:
-                print(f"DEBUG: AI extract error on attempt {attempt + 1}: {e}")
-
+                events.warning('ai_extract_error', model=self.model, attempt=attempt + 1, error=str(e))
+
+            if self.last_usage:
+                usage = usage or {'input_tokens': 0, 'output_tokens': 0}
+                for k in usage:
+                    usage[k] += self.last_usage.get(k) or 0
+            if result is not None:
+                break
             if attempt < max_retries:
-                print(f"DEBUG: Retrying in {delay}s...")
                 time.sleep(delay)
 
-        print("DEBUG: All AI extract attempts failed. Returning None.")
-        return None
+        self.last_usage = usage
+        if result is None:
+            events.error('ai_extract_failed', model=self.model, attempts=max_retries + 1)
+        return result
 
 
     def get_prompt(self):
@@ -4,7 +4,7 @@ from .gemini_service import GeminiService
 
 class AIFactory:
     @staticmethod
-    def get_service(provider, api_key_openai=None, api_key_gemini=None):
+    def get_service(provider, api_key_openai=None, api_key_gemini=None, model=None):
         """
         Returns the appropriate AI service instance based on the provider.
         """
@@ -13,9 +13,9 @@ class AIFactory:
         if provider == "gemini":
             if not api_key_gemini:
                 api_key_gemini = os.getenv('GEMINI_API_KEY')
-            return GeminiService(api_key_gemini)
+            return GeminiService(api_key_gemini, model=model)
         else:
             # Default to OpenAI
             if not api_key_openai:
                 api_key_openai = os.getenv('OPENAI_API_KEY')
-            return OpenAIService(api_key_openai)
+            return OpenAIService(api_key_openai, model=model)
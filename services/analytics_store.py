@@ -0,0 +1,233 @@
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from gspread.utils import absolute_range_name
+
+from .event_log import get_event_log
+from .order_columns import rows_to_records
+
+events = get_event_log()
+
+DEFAULT_STORE_PATH = "analytics.db"
+BATCH_TABS = 8      # Worksheets per values.batchGet call
+FETCH_WORKERS = 4   # batchGet calls in flight at once
+
+# (column, canonical field from order_columns, SQLite type). Typed columns: SUM() needs no parsing at query time
+COLUMNS = (
+    ('run_no', 'Run No', 'TEXT'),
+    ('name', 'Name', 'TEXT'),
+    ('item', 'Item', 'TEXT'),
+    ('price', 'Price', 'REAL'),
+    ('coins', 'Coins', 'REAL'),
+    ('shop', 'Shop', 'TEXT'),
+    ('platform', 'Platform', 'TEXT'),
+    ('status', 'Status', 'TEXT'),
+    ('order_id', 'Order ID', 'TEXT'),
+    ('tracking', 'Tracking', 'TEXT'),
+    ('date', 'Date', 'TEXT'),
+    ('location', 'Location', 'TEXT'),
+    ('saved_date', 'SavedDate', 'TEXT'),
+)
+GROUP_COLUMNS = ('shop', 'platform', 'sheet', 'status')
+
+def _number(value):
+    try:
+        return float(str(value).replace(',', '').replace('฿', '').strip() or 0)
+    except ValueError:
+        return 0.0
+
+
+class AnalyticsStore:
+    """
+    Local copy of every month worksheet for cross-month questions (spend per shop, coin trends).
+    - refresh() reads all tabs with one values.batchGet per BATCH_TABS tabs, FETCH_WORKERS in parallel,
+      normalizes headers with the shared alias map and rewrites only tabs whose content changed.
+      If the spreadsheet's Drive modifiedTime is unchanged, nothing is read at all.
+    - Queries run on the local SQLite file (typed, indexed columns), not against the Sheets API.
+    Path: ANALYTICS_DB_PATH env (default analytics.db).
+    """
+    def __init__(self, db_path=None):
+        self.db_path = db_path or os.getenv('ANALYTICS_DB_PATH', DEFAULT_STORE_PATH)
+        directory = os.path.dirname(self.db_path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._local = threading.local()
+        self._refresh_lock = threading.Lock()
+        conn = self._conn()
+        columns = ",\n".join(f"{name} {kind}" for name, _, kind in COLUMNS)
+        conn.executescript(f"""
+            CREATE TABLE IF NOT EXISTS sheets (
+                title TEXT PRIMARY KEY,
+                position INTEGER NOT NULL,
+                fingerprint TEXT NOT NULL,
+                rows INTEGER NOT NULL,
+                refreshed_at REAL NOT NULL
+            );
+            CREATE TABLE IF NOT EXISTS orders (
+                sheet TEXT NOT NULL,
+                row INTEGER NOT NULL,
+                {columns},
+                PRIMARY KEY (sheet, row)
+            );
+            CREATE INDEX IF NOT EXISTS idx_orders_shop ON orders (shop);
+            CREATE INDEX IF NOT EXISTS idx_orders_platform ON orders (platform);
+            CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT);
+        """)
+
+    def _conn(self):
+        # One connection per thread (same pattern as JobQueue)
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.db_path, timeout=30, isolation_level=None)
+            conn.row_factory = sqlite3.Row
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    def _meta(self, key):
+        row = self._conn().execute("SELECT value FROM meta WHERE key = ?", (key,)).fetchone()
+        return row['value'] if row else None
+
+    def _set_meta(self, key, value):
+        self._conn().execute("INSERT OR REPLACE INTO meta (key, value) VALUES (?, ?)", (key, value))
+
+    # ─── Refresh ────────────────────────────────────────────────────────────────
+
+    def refresh(self, client, sheet_id, force=False):
+        """Pulls changed worksheets into the store. Returns a summary dict. Concurrent calls are skipped."""
+        if not self._refresh_lock.acquire(blocking=False):
+            return {'skipped': 'refresh already running'}
+        start = time.time()
+        try:
+            spreadsheet = client.open_by_key(sheet_id)
+            modified = None
+            try:
+                modified = spreadsheet.get_lastUpdateTime()
+            except Exception as e:
+                events.warning('analytics_modified_time_failed', error=str(e))
+            if not force and modified and modified == self._meta('spreadsheet_modified'):
+                return {'skipped': 'spreadsheet unchanged', 'modified': modified}
+
+            titles = [ws.title for ws in spreadsheet.worksheets() if not ws.title.startswith('_')]
+            batches = [titles[i:i + BATCH_TABS] for i in range(0, len(titles), BATCH_TABS)]
+
+            def fetch(batch):
+                resp = spreadsheet.values_batch_get([absolute_range_name(t) for t in batch])
+                # valueRanges come back in request order
+                return [(title, vr.get('values', [])) for title, vr in zip(batch, resp.get('valueRanges', []))]
+
+            with ThreadPoolExecutor(max_workers=FETCH_WORKERS) as pool:
+                fetched = [item for result in pool.map(fetch, batches) for item in result]
+            fetched_seconds = time.time() - start
+
+            changed = self._store(titles, fetched)
+            if modified:
+                self._set_meta('spreadsheet_modified', modified)
+            summary = {
+                'sheets': len(titles), 'changed': changed, 'batches': len(batches),
+                'rows': self.row_count(), 'fetch_seconds': round(fetched_seconds, 2),
+                'seconds': round(time.time() - start, 2),
+            }
+            events.info('analytics_refreshed', **summary)
+            return summary
+        finally:
+            self._refresh_lock.release()
+
+    def _store(self, titles, fetched):
+        conn = self._conn()
+        known = {row['title']: row['fingerprint'] for row in conn.execute("SELECT title, fingerprint FROM sheets")}
+        positions = {title: i for i, title in enumerate(titles)}
+        names = [name for name, _, _ in COLUMNS]
+        insert = f"INSERT INTO orders (sheet, row, {', '.join(names)}) VALUES ({', '.join('?' * (len(names) + 2))})"
+        changed = []
+        now = time.time()
+
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            for title, values in fetched:
+                fingerprint = hashlib.sha1(json.dumps(values, ensure_ascii=False).encode('utf-8')).hexdigest()
+                if known.get(title) == fingerprint:
+                    conn.execute("UPDATE sheets SET position = ? WHERE title = ?", (positions[title], title))
+                    continue
+                rows = []
+                for i, record in enumerate(rows_to_records(values)):
+                    if not any(record.values()):
+                        continue  # Blank row
+                    row = [title, i + 2]
+                    for _, field, kind in COLUMNS:
+                        value = record.get(field, '')
+                        row.append(_number(value) if kind == 'REAL' else str(value).strip())
+                    rows.append(row)
+                conn.execute("DELETE FROM orders WHERE sheet = ?", (title,))
+                conn.executemany(insert, rows)
+                conn.execute(
+                    "INSERT OR REPLACE INTO sheets (title, position, fingerprint, rows, refreshed_at) VALUES (?, ?, ?, ?, ?)",
+                    (title, positions[title], fingerprint, len(rows), now)
+                )
+                changed.append(title)
+            for title in set(known) - set(positions):
+                conn.execute("DELETE FROM orders WHERE sheet = ?", (title,))
+                conn.execute("DELETE FROM sheets WHERE title = ?", (title,))
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+        return changed
+
+    # ─── Queries ────────────────────────────────────────────────────────────────
+
+    def sheets(self):
+        """Stored worksheets in tab order."""
+        rows = self._conn().execute("SELECT title, position, rows, refreshed_at FROM sheets ORDER BY position").fetchall()
+        return [dict(row) for row in rows]
+
+    def row_count(self):
+        return self._conn().execute("SELECT COUNT(*) AS n FROM orders").fetchone()['n']
+
+    def totals(self, by='shop', sheets=None, since=None, include_cancelled=False):
+        """
+        Price / coins / net per `by` (shop, platform, sheet or status) over the chosen worksheets:
+        `sheets` (list of titles) or `since` (that tab and every tab after it in tab order), else all.
+        """
+        if by not in GROUP_COLUMNS:
+            raise ValueError(f"Unknown grouping '{by}' (use {', '.join(GROUP_COLUMNS)})")
+        where, params = [], []
+        if sheets:
+            where.append(f"o.sheet IN ({', '.join('?' * len(sheets))})")
+            params += list(sheets)
+        if since:
+            where.append("s.position >= (SELECT position FROM sheets WHERE title = ?)")
+            params.append(since)
+        if not include_cancelled:
+            where.append("LOWER(o.status) NOT LIKE '%cancel%'")
+        sql = f"""
+            SELECT o.{by} AS "group", COUNT(*) AS orders, SUM(o.price) AS price, SUM(o.coins) AS coins,
+                   SUM(o.price) - SUM(o.coins) AS net, MIN(s.position) AS first_position
+            FROM orders o JOIN sheets s ON s.title = o.sheet
+            {'WHERE ' + ' AND '.join(where) if where else ''}
+            GROUP BY o.{by}
+            ORDER BY {'first_position' if by == 'sheet' else 'net DESC'}
+        """
+        return [
+            {by: row['group'], 'orders': row['orders'], 'price': round(row['price'] or 0, 2),
+             'coins': round(row['coins'] or 0, 2), 'net': round(row['net'] or 0, 2)}
+            for row in self._conn().execute(sql, params)
+        ]
+
+
+_analytics_store_instance = None
+_analytics_store_lock = threading.Lock()
+
+def get_analytics_store():
+    global _analytics_store_instance
+    if _analytics_store_instance is None:
+        with _analytics_store_lock:
+            if _analytics_store_instance is None:
+                _analytics_store_instance = AnalyticsStore()
+    return _analytics_store_instance
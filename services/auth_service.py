@@ -1,12 +1,26 @@
 import os
 import json
+import datetime
+import threading
+import time
 from google.oauth2.credentials import Credentials
 from google_auth_oauthlib.flow import InstalledAppFlow
 from google.auth.transport.requests import Request
 
+from .event_log import get_event_log
+
+events = get_event_log()
+
 SCOPES = ['https://www.googleapis.com/auth/spreadsheets', 'https://www.googleapis.com/auth/drive']
 
 def get_google_credentials():
+    """
+    Shared, proactively refreshed user credentials (see CredentialManager).
+    Only the very first call in a process loads the token; later calls never block on OAuth.
+    """
+    return get_credential_manager().credentials()
+
+def _load_google_credentials():
     """
     User OAuth Token loader. ใช้ Account ส่วนตัวของผู้ใช้เท่านั้น
     (ไม่ใช้ Service Account เพราะไม่มี Drive storage)
@@ -95,6 +109,141 @@ def get_google_credentials():
     
     raise FileNotFoundError("❌ [AUTH ERROR] No token.json or client_secret.json found.")
 
+class CredentialManager:
+    """
+    Process-wide holder of the Google user credentials.
+    - Loaded once (token env/file), then refreshed by a background thread REFRESH_MARGIN seconds
+      before expiry, so requests and bot jobs never wait for an OAuth round trip.
+    - Refreshes are single-flight (_refresh_lock), and the network call never holds _lock: callers
+      whose token is still valid get the cached session/client while a refresh runs or backs off.
+    - After a failed refresh, callers with an expired token retry at most once per RETRY_DELAY
+      (a revoked token must not cost every request an OAuth round trip).
+    - The Credentials object is refreshed in place, so every client built on it (gspread, Drive)
+      picks up the new token automatically.
+    """
+    # Must exceed google-auth's own expiry threshold (~3m45s) so clients never refresh on their own
+    REFRESH_MARGIN = 600
+    RETRY_DELAY = 30
+
+    def __init__(self, loader=None):
+        self._loader = loader or _load_google_credentials
+        self._lock = threading.RLock()          # State only (creds, session, client): never held over the network
+        self._refresh_lock = threading.Lock()   # One refresh at a time
+        self._wake = threading.Event()
+        self._creds = None
+        self._session = None
+        self._gspread_client = None
+        self._refresher = None
+        self._failed_at = None
+        self.last_refresh = None
+        self.last_error = None
+
+    def credentials(self):
+        creds = self._creds
+        if creds is not None and creds.valid:
+            return creds
+        with self._lock:
+            if self._creds is None:
+                self._creds = self._loader()
+                self._start_refresher()
+            creds = self._creds
+        if creds is not None and not creds.valid and creds.refresh_token:
+            # Background refresh fell behind (e.g. laptop sleep): one caller refreshes, others wait for it
+            self._refresh(force=False)
+        return creds
+
+    def set_credentials(self, creds):
+        """Adopt freshly issued credentials (OAuth callback) without a restart."""
+        with self._lock:
+            self._creds = creds
+            self._session = None
+            self._gspread_client = None
+            self._failed_at = None
+            self._start_refresher()
+        self._wake.set()
+
+    def owns(self, creds):
+        return creds is not None and creds is self._creds
+
+    def authorized_session(self):
+        """Shared requests session (connection pool) that signs requests with the managed token."""
+        creds = self.credentials()
+        with self._lock:
+            if self._session is None:
+                from google.auth.transport.requests import AuthorizedSession
+                self._session = AuthorizedSession(creds)
+            return self._session
+
+    def gspread_client(self):
+        creds = self.credentials()
+        with self._lock:
+            if self._gspread_client is None:
+                import gspread
+                self._gspread_client = gspread.authorize(creds, session=self.authorized_session())
+            return self._gspread_client
+
+    def seconds_until_refresh(self):
+        creds = self._creds
+        if creds is None or creds.expiry is None:
+            return self.REFRESH_MARGIN
+        remaining = (creds.expiry - datetime.datetime.utcnow()).total_seconds()
+        return max(0.0, remaining - self.REFRESH_MARGIN)
+
+    def _start_refresher(self):
+        if self._refresher is None:
+            self._refresher = threading.Thread(target=self._refresh_loop, daemon=True)
+            self._refresher.start()
+
+    def _refresh_loop(self):
+        while True:
+            self._wake.wait(self.seconds_until_refresh())
+            self._wake.clear()
+            creds = self._creds
+            if creds is None or not creds.refresh_token or self.seconds_until_refresh() > 0:
+                continue
+            if not self._refresh(force=True):
+                # Backoff without any lock held: valid-token callers are not blocked meanwhile
+                self._wake.wait(self.RETRY_DELAY)
+
+    def _refresh(self, force):
+        """
+        Refreshes the current credentials in place. force=False (a caller with an expired token):
+        skipped if another thread refreshed meanwhile or the last failure is younger than RETRY_DELAY.
+        """
+        with self._refresh_lock:
+            creds = self._creds
+            if creds is None or not creds.refresh_token:
+                return False
+            if not force:
+                if creds.valid:
+                    return True
+                if self._failed_at is not None and time.time() - self._failed_at < self.RETRY_DELAY:
+                    return False
+            try:
+                creds.refresh(Request())
+            except Exception as e:
+                self._failed_at = time.time()
+                self.last_error = str(e)
+                events.error('google_token_refresh_failed', error=str(e))
+                return False
+            self._failed_at = None
+            self.last_refresh = time.time()
+            self.last_error = None
+            events.info('google_token_refreshed', expiry=str(creds.expiry))
+            return True
+
+
+_credential_manager_instance = None
+_credential_manager_lock = threading.Lock()
+
+def get_credential_manager():
+    global _credential_manager_instance
+    if _credential_manager_instance is None:
+        with _credential_manager_lock:
+            if _credential_manager_instance is None:
+                _credential_manager_instance = CredentialManager()
+    return _credential_manager_instance
+
 def get_auth_flow(redirect_uri, state=None):
     """
     Creates a Flow object for web-based OAuth.
@@ -176,6 +325,8 @@ def save_token_from_response(url, state, redirect_uri, code_verifier=None):
     with open(token_path, 'w') as token:
         token.write(token_json_str)
     
+    get_credential_manager().set_credentials(creds)
+
     print("--- GOOGLE_TOKEN_JSON START ---")
     print(token_json_str)
     print("--- GOOGLE_TOKEN_JSON END ---")
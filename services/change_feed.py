@@ -0,0 +1,172 @@
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+
+from .event_log import get_event_log
+
+events = get_event_log()
+
+FEED_CAPACITY = 2000   # Events kept for reconnecting clients (Last-Event-ID)
+# Client-only fields (not from the sheet): never reported as a change
+_LOCAL_FIELDS = ('RawImageLink',)
+
+
+def order_key(record):
+    """Stable key of an order row: Order ID, else Run No. None = untracked row."""
+    order_id = str(record.get('Order ID') or '').strip()
+    if order_id:
+        return order_id
+    run_no = str(record.get('Run No') or '').strip()
+    return f"run:{run_no}" if run_no else None
+
+
+def diff_orders(old, new):
+    """
+    Row-level diff of two snapshots (lists of order records).
+    Returns [(kind, key, payload)]: ('order_added', key, record), ('order_removed', key, None)
+    or (kind, key, {field: new value}) with kind status_changed / image_recovered / order_updated.
+    """
+    old_by_key = {}
+    for record in old:
+        key = order_key(record)
+        if key is not None:
+            old_by_key[key] = record
+
+    changes = []
+    seen = set()
+    for record in new:
+        key = order_key(record)
+        if key is None or key in seen:
+            continue
+        seen.add(key)
+        before = old_by_key.get(key)
+        if before is None:
+            changes.append(('order_added', key, record))
+            continue
+        if before is record:
+            continue
+        delta = {f: v for f, v in record.items() if f not in _LOCAL_FIELDS and before.get(f) != v}
+        if not delta:
+            continue
+        if set(delta) == {'Status'}:
+            kind = 'status_changed'
+        elif delta.get('DirectImage') and not before.get('DirectImage'):
+            kind = 'image_recovered'
+        else:
+            kind = 'order_updated'
+        changes.append((kind, key, delta))
+
+    for key in old_by_key:
+        if key not in seen:
+            changes.append(('order_removed', key, None))
+    return changes
+
+
+class ChangeFeed:
+    """
+    In-process change bus for the dashboard stream (/api/stream).
+    - publish_snapshot() diffs a fresh /api/orders snapshot against the last one per sheet and
+      publishes one event per changed row.
+    - publish_change() pushes a change known up front (check/uncheck, image recovered) without
+      waiting for the next snapshot.
+    - Events carry a monotonic seq (the SSE id), so a reconnecting client resumes with since(seq);
+      None means it fell out of the buffer and must reload /api/orders.
+    """
+    def __init__(self, capacity=FEED_CAPACITY):
+        self._cond = threading.Condition()
+        self._events = deque(maxlen=capacity)
+        self._seq = 0
+        self._snapshots = {}   # sheet -> last published records
+        self._subscribers = 0
+
+    @property
+    def last_seq(self):
+        return self._seq
+
+    @property
+    def subscribers(self):
+        return self._subscribers
+
+    @contextmanager
+    def subscription(self):
+        with self._cond:
+            self._subscribers += 1
+        try:
+            yield self
+        finally:
+            with self._cond:
+                self._subscribers -= 1
+
+    def _publish_locked(self, kind, sheet, key, **fields):
+        self._seq += 1
+        event = {'seq': self._seq, 'ts': time.time(), 'kind': kind, 'sheet': sheet, 'key': key}
+        event.update(fields)
+        self._events.append(event)
+        return event
+
+    def publish_snapshot(self, sheet, records):
+        """Diffs against the previous snapshot of `sheet`. The first snapshot is only a baseline."""
+        with self._cond:
+            previous = self._snapshots.get(sheet)
+            self._snapshots[sheet] = records
+            if previous is None or previous is records:
+                return 0
+            changes = diff_orders(previous, records)
+            for kind, key, payload in changes:
+                if kind == 'order_added':
+                    self._publish_locked(kind, sheet, key, order=payload)
+                elif kind == 'order_removed':
+                    self._publish_locked(kind, sheet, key)
+                else:
+                    self._publish_locked(kind, sheet, key, changes=payload)
+            if changes:
+                self._cond.notify_all()
+        if changes:
+            events.debug('change_feed_snapshot', sheet=sheet, changes=len(changes), seq=self._seq)
+        return len(changes)
+
+    def publish_change(self, kind, sheet, key, changes, persist=True):
+        """
+        Publishes a change made by this process. persist=True also applies it to the stored snapshot,
+        so the next publish_snapshot() does not report it a second time; use persist=False for
+        changes that never reach the sheet (an image found in Drive).
+        """
+        with self._cond:
+            if persist and sheet in self._snapshots:
+                self._snapshots[sheet] = [
+                    dict(r, **changes) if order_key(r) == key else r for r in self._snapshots[sheet]
+                ]
+            event = self._publish_locked(kind, sheet, key, changes=changes)
+            self._cond.notify_all()
+        return event['seq']
+
+    def since(self, seq):
+        """Events after `seq`, or None if some of them were already dropped from the buffer."""
+        with self._cond:
+            return self._since_locked(seq)
+
+    def _since_locked(self, seq):
+        if seq >= self._seq:
+            return []
+        if not self._events or self._events[0]['seq'] > seq + 1:
+            return None
+        return [e for e in self._events if e['seq'] > seq]
+
+    def wait(self, seq, timeout):
+        """Blocks until there are events after `seq` or `timeout` passes; same result as since()."""
+        with self._cond:
+            self._cond.wait_for(lambda: self._seq > seq, timeout)
+            return self._since_locked(seq)
+
+
+_change_feed_instance = None
+_change_feed_lock = threading.Lock()
+
+def get_change_feed():
+    global _change_feed_instance
+    if _change_feed_instance is None:
+        with _change_feed_lock:
+            if _change_feed_instance is None:
+                _change_feed_instance = ChangeFeed()
+    return _change_feed_instance
@@ -1,5 +1,15 @@
+import copy
 import json
 import os
+import threading
+import time
+from contextlib import contextmanager
+from datetime import datetime
+
+try:
+    import fcntl  # POSIX only: serializes read-modify-write across gunicorn workers
+except ImportError:
+    fcntl = None
 
 class ConfigService:
     def __init__(self, config_file='config.json'):
@@ -10,55 +20,107 @@ class ConfigService:
             "AI_PROVIDER": "openai",
             "SHEET_FOLDER_MAP": {}
         }
+        self._lock = threading.RLock()
         self._cached_config = None
+        self._cached_stat = None
         self.config = self._load_config()
+        # _GravityConfig sync state (see sync_from_gsheets)
+        self._remote_lock = threading.Lock()
+        self._remote_ws = None
+        self._remote_sheet_id = None
+        self._remote_version = None
+        self._remote_rows = {}
 
-    def _load_config(self, force_reload=False):
-        # Return cache if available and not explicitly clearing
-        if not force_reload and self._cached_config is not None:
-            return self._cached_config
-
-        if not os.path.exists(self.config_path):
-            self._save_config(self.default_config)
-            self._cached_config = self.default_config
-            return self.default_config
-        
+    def _stat_key(self):
         try:
-            with open(self.config_path, 'r', encoding='utf-8') as f:
-                data = json.load(f)
-                if "SHEET_FOLDER_MAP" not in data:
-                    data["SHEET_FOLDER_MAP"] = {}
-                self._cached_config = data
-                return data
-        except Exception as e:
-            print(f"Error loading config: {e}")
-            return self.default_config
+            st = os.stat(self.config_path)
+            return (st.st_mtime_ns, st.st_size)
+        except OSError:
+            return None
+
+    def _load_config(self, force_reload=False):
+        """
+        Cached config, revalidated with one stat() per call: re-parsed only when another
+        worker/thread replaced config.json (mtime or size changed) or force_reload is set.
+        """
+        stat_key = self._stat_key()
+        cached = self._cached_config
+        if not force_reload and cached is not None and stat_key == self._cached_stat:
+            return cached
+
+        with self._lock:
+            if stat_key is None:
+                self._save_config(copy.deepcopy(self.default_config))
+                return self._cached_config
+
+            try:
+                with open(self.config_path, 'r', encoding='utf-8') as f:
+                    data = json.load(f)
+                    if "SHEET_FOLDER_MAP" not in data:
+                        data["SHEET_FOLDER_MAP"] = {}
+                    self._cached_config = data
+                    self._cached_stat = stat_key
+                    return data
+            except Exception as e:
+                print(f"Error loading config: {e}")
+                return self.default_config
 
     def _save_config(self, config_data):
-        self._cached_config = config_data # Update cache
-        try:
-            with open(self.config_path, 'w', encoding='utf-8') as f:
-                json.dump(config_data, f, indent=4, ensure_ascii=False)
-        except Exception as e:
-            print(f"Error saving config: {e}")
+        """Atomic write (tmp file + rename): readers in other workers never see a half-written file."""
+        with self._lock:
+            tmp_path = f"{self.config_path}.tmp.{os.getpid()}.{threading.get_ident()}"
+            try:
+                with open(tmp_path, 'w', encoding='utf-8') as f:
+                    json.dump(config_data, f, indent=4, ensure_ascii=False)
+                    f.flush()
+                    os.fsync(f.fileno())
+                os.replace(tmp_path, self.config_path)
+                self._cached_stat = self._stat_key()
+            except Exception as e:
+                print(f"Error saving config: {e}")
+                if os.path.exists(tmp_path):
+                    os.remove(tmp_path)
+            self._cached_config = config_data # Update cache
+
+    @contextmanager
+    def _write_lock(self):
+        """Thread lock + (on POSIX) an flock on config.json.lock for read-modify-write updates."""
+        with self._lock:
+            if fcntl is None:
+                yield
+                return
+            with open(f"{self.config_path}.lock", 'a') as lock_file:
+                fcntl.flock(lock_file, fcntl.LOCK_EX)
+                try:
+                    yield
+                finally:
+                    fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    def _update(self, mutate):
+        """Copy-on-write: readers holding the previous dict keep a consistent snapshot."""
+        with self._write_lock():
+            new_config = copy.deepcopy(self._load_config(force_reload=True))
+            mutate(new_config)
+            self._save_config(new_config)
+            self.config = new_config
+        return True
 
     def get(self, key, default=None):
-        # Reload from disk every time to ensure fresh values across workers/threads
-        self.config = self._load_config(force_reload=True)
+        # Revalidated against the file on every call, so values stay fresh across workers/threads
+        self.config = self._load_config()
         return self.config.get(key, default)
 
     def set(self, key, value):
-        self.config = self._load_config(force_reload=True) # Sync before writing
-        self.config[key] = value
-        self._save_config(self.config)
-        return True
+        def mutate(config):
+            config[key] = value
+        return self._update(mutate)
 
     def get_folder_for_sheet(self, sheet_name):
         """Returns the specific folder ID for a sheet, or the default fallback."""
         if not sheet_name:
             sheet_name = self.get('ACTIVE_SHEET_NAME', os.getenv("GOOGLE_SHEET_NAME"))
             
-        self.config = self._load_config(force_reload=True)
+        self.config = self._load_config()
         folder_map = self.config.get("SHEET_FOLDER_MAP", {})
         
         # If specific mapping exists and is not empty
@@ -70,87 +132,153 @@ class ConfigService:
 
     def set_folder_for_sheet(self, sheet_name, folder_id):
         """Sets the folder ID for a specific sheet and syncs with global if active."""
-        self.config = self._load_config()
-        if "SHEET_FOLDER_MAP" not in self.config:
-            self.config["SHEET_FOLDER_MAP"] = {}
-            
-        self.config["SHEET_FOLDER_MAP"][sheet_name] = folder_id
-        
-        # If this is the active sheet, also sync the global default
-        if self.config.get('ACTIVE_SHEET_NAME') == sheet_name:
-            self.config["GOOGLE_DRIVE_FOLDER_ID"] = folder_id
-            
-        self._save_config(self.config)
-        return True
+        def mutate(config):
+            config.setdefault("SHEET_FOLDER_MAP", {})[sheet_name] = folder_id
+            # If this is the active sheet, also sync the global default
+            if config.get('ACTIVE_SHEET_NAME') == sheet_name:
+                config["GOOGLE_DRIVE_FOLDER_ID"] = folder_id
+        return self._update(mutate)
 
     # ─── Google Sheets Persistence ───────────────────────────────────────────────
     CONFIG_SHEET_NAME = "_GravityConfig"
+    # Rows 2-3 of _GravityConfig: bumped on every write, so readers only poll one small range
+    VERSION_KEY = "CONFIG_VERSION"
+    UPDATED_AT_KEY = "CONFIG_UPDATED_AT"
+    FOLDER_KEY_PREFIX = "SHEET_FOLDER_MAP_"
+
+    def _config_worksheet(self, gspread_client, sheet_id, create=False):
+        """The _GravityConfig worksheet, opened once and reused by the sync loop."""
+        if self._remote_ws is not None and self._remote_sheet_id == sheet_id:
+            return self._remote_ws
+        spreadsheet = gspread_client.open_by_key(sheet_id)
+        try:
+            ws = spreadsheet.worksheet(self.CONFIG_SHEET_NAME)
+        except Exception:
+            if not create:
+                return None
+            ws = spreadsheet.add_worksheet(title=self.CONFIG_SHEET_NAME, rows=50, cols=2)
+            ws.update(range_name="A1:B3", values=[["Key", "Value"], [self.VERSION_KEY, "0"], [self.UPDATED_AT_KEY, ""]])
+            print(f"DEBUG: Created new worksheet: {self.CONFIG_SHEET_NAME}")
+        self._remote_ws = ws
+        self._remote_sheet_id = sheet_id
+        return ws
 
-    def sync_from_gsheets(self, gspread_client, sheet_id):
+    def _remote_version_changed(self, ws):
+        """One small values.get (A2:B2). True when the remote version differs from the last one seen."""
+        if self._remote_version is None:
+            return True
+        head = ws.get("A2:B2")
+        if not head or not head[0] or head[0][0] != self.VERSION_KEY:
+            return True
+        return (head[0][1] if len(head[0]) > 1 else "") != self._remote_version
+
+    def _has_version_rows(self, rows):
+        return len(rows) >= 2 and rows[1] and rows[1][0] == self.VERSION_KEY
+
+    def _index_remote_rows(self, rows):
+        """
+        Remembers key -> row number (for upserts) and the remote version. Read-only: a tab without
+        the version rows (old layout) gets version None, so it is re-read until sync_to_gsheets repairs it.
+        """
+        self._remote_rows = {row[0]: i + 1 for i, row in enumerate(rows) if row and row[0]}
+        if self._has_version_rows(rows):
+            self._remote_version = rows[1][1] if len(rows[1]) > 1 else ""
+        else:
+            self._remote_version = None
+        return rows
+
+    def _repair_remote_layout(self, ws, rows):
+        """Write path only: puts the Key/Value header and the version rows at A1:B3. Returns the new rows."""
+        if self._has_version_rows(rows):
+            return rows
+        version_rows = [[self.VERSION_KEY, "0"], [self.UPDATED_AT_KEY, ""]]
+        if not any(any(cell for cell in row) for row in rows):
+            # Empty tab: nothing to shift, write the whole head in place
+            ws.update(range_name="A1:B3", values=[["Key", "Value"]] + version_rows)
+            return [["Key", "Value"]] + version_rows
+        if rows[0] and rows[0][0] == "Key":
+            ws.insert_rows(version_rows, row=2)
+            return rows[:1] + version_rows + rows[1:]
+        # Header missing too (data starts at row 1)
+        ws.insert_rows([["Key", "Value"]] + version_rows, row=1)
+        return [["Key", "Value"]] + version_rows + rows
+
+    def sync_from_gsheets(self, gspread_client, sheet_id, force=False):
         """
         โหลด SHEET_FOLDER_MAP จาก worksheet _GravityConfig ใน Google Sheets
-        เรียกตอน startup เพื่อดึงค่าล่าสุดมา override local config
+        Versioned: อ่านแค่ CONFIG_VERSION ก่อน แล้วโหลดทั้งแท็บเฉพาะตอนที่ version เปลี่ยน
+        (เรียกจาก background loop ใน app.py ไม่ใช่ทุก request)
         """
         try:
-            spreadsheet = gspread_client.open_by_key(sheet_id)
-            try:
-                ws = spreadsheet.worksheet(self.CONFIG_SHEET_NAME)
-            except Exception:
-                print(f"DEBUG: No {self.CONFIG_SHEET_NAME} worksheet found, skipping sync.")
-                return False
-
-            rows = ws.get_all_values()  # [[Key, Value], ...]
-            if not rows:
-                return False
+            with self._remote_lock:
+                ws = self._config_worksheet(gspread_client, sheet_id)
+                if ws is None:
+                    print(f"DEBUG: No {self.CONFIG_SHEET_NAME} worksheet found, skipping sync.")
+                    return False
+                if not force and not self._remote_version_changed(ws):
+                    return False
 
-            self.config = self._load_config(force_reload=True)
-            if "SHEET_FOLDER_MAP" not in self.config:
-                self.config["SHEET_FOLDER_MAP"] = {}
+                rows = self._index_remote_rows(ws.get_all_values())  # [[Key, Value], ...]
 
-            updated = False
+            remote_map = {}
             for row in rows:
-                if len(row) >= 2 and row[0].startswith("SHEET_FOLDER_MAP_"):
-                    sheet_name = row[0][len("SHEET_FOLDER_MAP_"):]
+                if len(row) >= 2 and row[0].startswith(self.FOLDER_KEY_PREFIX):
+                    sheet_name = row[0][len(self.FOLDER_KEY_PREFIX):]
                     folder_id = row[1].strip()
                     if sheet_name and folder_id:
-                        self.config["SHEET_FOLDER_MAP"][sheet_name] = folder_id
-                        updated = True
+                        remote_map[sheet_name] = folder_id
 
-            if updated:
-                self._save_config(self.config)
-                print(f"DEBUG: Config synced from GSheets ({len(self.config['SHEET_FOLDER_MAP'])} mappings)")
+            # Only rewrite config.json when something actually changed (keeps other workers' caches valid)
+            local_map = self._load_config().get("SHEET_FOLDER_MAP", {})
+            if any(local_map.get(k) != v for k, v in remote_map.items()):
+                self._update(lambda config: config.setdefault("SHEET_FOLDER_MAP", {}).update(remote_map))
+                print(f"DEBUG: Config synced from GSheets ({len(self.config['SHEET_FOLDER_MAP'])} mappings, version {self._remote_version})")
             return True
         except Exception as e:
+            self._remote_ws = None  # Re-open next time (token refresh, deleted tab, ...)
             print(f"DEBUG: sync_from_gsheets failed: {e}")
             return False
 
-    def sync_to_gsheets(self, gspread_client, sheet_id):
+    def sync_to_gsheets(self, gspread_client, sheet_id, sheet_name=None):
         """
         เขียน SHEET_FOLDER_MAP ลง worksheet _GravityConfig ใน Google Sheets
-        เรียกหลังจาก set_folder_for_sheet เพื่อให้ค่าคงอยู่ข้าม Deploy
+        Upsert เฉพาะแถวของ sheet_name (หรือทุก mapping ถ้าไม่ระบุ) + bump version ใน batch_update เดียว
         """
         try:
-            spreadsheet = gspread_client.open_by_key(sheet_id)
+            with self._remote_lock:
+                ws = self._config_worksheet(gspread_client, sheet_id, create=True)
+                # Someone else wrote since our last read: refresh the row index so upserts hit the right rows
+                seen_version = self._remote_version
+                if not self._remote_rows or self._remote_version_changed(ws):
+                    self._index_remote_rows(self._repair_remote_layout(ws, ws.get_all_values()))
 
-            # หา worksheet หรือสร้างใหม่ถ้ายังไม่มี
-            try:
-                ws = spreadsheet.worksheet(self.CONFIG_SHEET_NAME)
-            except Exception:
-                ws = spreadsheet.add_worksheet(title=self.CONFIG_SHEET_NAME, rows=50, cols=2)
-                print(f"DEBUG: Created new worksheet: {self.CONFIG_SHEET_NAME}")
-
-            self.config = self._load_config(force_reload=True)
-            folder_map = self.config.get("SHEET_FOLDER_MAP", {})
-
-            # สร้าง rows [["Key", "Value"], ...]
-            rows = [["Key", "Value"]]
-            for sname, fid in folder_map.items():
-                rows.append([f"SHEET_FOLDER_MAP_{sname}", fid])
-
-            ws.clear()
-            ws.update(range_name="A1", values=rows)
-            print(f"DEBUG: Config synced to GSheets ({len(folder_map)} mappings)")
+                folder_map = self._load_config().get("SHEET_FOLDER_MAP", {})
+                names = [sheet_name] if sheet_name else list(folder_map)
+
+                version = str(time.time_ns())
+                updated_at = datetime.now().isoformat(timespec='seconds')
+                data = [{'range': "A2:B3", 'values': [[self.VERSION_KEY, version], [self.UPDATED_AT_KEY, updated_at]]}]
+                next_row = max(self._remote_rows.values(), default=3) + 1
+                for name in names:
+                    key = f"{self.FOLDER_KEY_PREFIX}{name}"
+                    row = self._remote_rows.get(key)
+                    if row is None:
+                        row = next_row
+                        next_row += 1
+                    data.append({'range': f"A{row}:B{row}", 'values': [[key, folder_map.get(name, "")]]})
+
+                if next_row - 1 > ws.row_count:
+                    ws.add_rows(next_row - 1 - ws.row_count + 10)
+                ws.batch_update(data)
+
+                for entry in data[1:]:
+                    self._remote_rows[entry['values'][0][0]] = int(entry['range'].split(':')[0][1:])
+                # Our own write needs no re-read, unless remote changes arrived that we have not applied yet
+                self._remote_version = version if seen_version == self._remote_version else None
+
+            print(f"DEBUG: Config synced to GSheets ({len(names)} mapping(s), version {version})")
             return True
         except Exception as e:
+            self._remote_ws = None
             print(f"DEBUG: sync_to_gsheets failed: {e}")
             return False
@@ -1,23 +1,67 @@
-from googleapiclient.discovery import build
-from googleapiclient.http import MediaFileUpload
+from googleapiclient.discovery import build_from_document
+from googleapiclient.http import MediaFileUpload, MediaIoBaseUpload
+import json
 import os
+import threading
+from urllib.parse import quote
+
+from .auth_service import get_credential_manager
+
+# Parsed Drive v3 discovery document, loaded once per process from the copy bundled with googleapiclient
+_discovery_doc = None
+_discovery_lock = threading.Lock()
+# Per-thread Drive clients: httplib2 connections are not thread-safe, but are kept alive per thread
+_thread_local = threading.local()
+
+# Media download for streaming (httplib2 reads whole bodies, so this goes through requests)
+MEDIA_URL = "https://www.googleapis.com/drive/v3/files/{file_id}?alt=media&supportsAllDrives=true"
+STREAM_CHUNK_SIZE = 64 * 1024
+UPLOAD_CHUNK_SIZE = 5 * 1024 * 1024  # Resumable upload chunk (multiple of 256 KB)
+# Request headers forwarded to Drive / response headers passed back by open_media_stream
+_FORWARD_REQUEST_HEADERS = ('Range', 'If-None-Match', 'If-Modified-Since')
+_FORWARD_RESPONSE_HEADERS = ('Content-Type', 'Content-Length', 'Content-Range', 'ETag', 'Last-Modified')
+
+def _drive_discovery_document():
+    global _discovery_doc
+    if _discovery_doc is None:
+        with _discovery_lock:
+            if _discovery_doc is None:
+                from googleapiclient import discovery_cache
+                _discovery_doc = json.loads(discovery_cache.get_static_doc('drive', 'v3'))
+    return _discovery_doc
+
+def _thread_drive_client(credentials):
+    """Drive v3 Resource for (this thread, these credentials); built once, reused by later DriveServices."""
+    clients = getattr(_thread_local, 'clients', None)
+    if clients is None:
+        clients = _thread_local.clients = {}
+    entry = clients.get(id(credentials))
+    if entry is None or entry[0] is not credentials:
+        import httplib2
+        from google_auth_httplib2 import AuthorizedHttp
+        http = AuthorizedHttp(credentials, http=httplib2.Http(timeout=120))
+        entry = clients[id(credentials)] = (credentials, build_from_document(_drive_discovery_document(), http=http))
+    return entry[1]
 
 class DriveService:
     def __init__(self, credentials=None):
-        self.service = None
+        # Cheap: the client is resolved lazily per thread (see _thread_drive_client)
+        self.credentials = credentials
         self.scopes = ['https://www.googleapis.com/auth/drive']
         
         if not credentials:
             print("Warning: No credentials provided to DriveService.")
-            return
 
+    @property
+    def service(self):
+        if not self.credentials:
+            return None
         try:
             # Directly use the authorized user credentials
-            self.service = build('drive', 'v3', credentials=credentials)
-            print("DEBUG: Drive Service Initialized (User Identity)")
+            return _thread_drive_client(self.credentials)
         except Exception as e:
             print(f"Warning: DriveService init failed: {e}")
-            self.service = None
+            return None
 
     def upload_file(self, file_path, folder_id=None, custom_name=None, overwrite=True):
         if not self.service:
@@ -25,7 +69,24 @@ class DriveService:
             return None
 
         file_name = custom_name if custom_name else os.path.basename(file_path)
-        
+        media = MediaFileUpload(file_path, mimetype='image/jpeg')
+        return self._upload_media(media, file_name, folder_id, overwrite)
+
+    def upload_stream(self, fh, file_name, mimetype, folder_id=None, overwrite=True):
+        """
+        Uploads the whole of an open binary file object (e.g. a SpooledTemporaryFile). Files larger
+        than UPLOAD_CHUNK_SIZE go up in resumable chunks, never whole in memory.
+        """
+        if not self.service:
+            print("Drive service not initialized.")
+            return None
+
+        size = fh.seek(0, os.SEEK_END)
+        fh.seek(0)
+        media = MediaIoBaseUpload(fh, mimetype=mimetype, chunksize=UPLOAD_CHUNK_SIZE, resumable=size > UPLOAD_CHUNK_SIZE)
+        return self._upload_media(media, file_name, folder_id, overwrite)
+
+    def _upload_media(self, media, file_name, folder_id, overwrite):
         # --- Handle Overwrite Logic ---
         if overwrite and file_name:
             try:
@@ -40,8 +101,6 @@ class DriveService:
         if folder_id:
             file_metadata['parents'] = [folder_id]
 
-        media = MediaFileUpload(file_path, mimetype='image/jpeg')
-        
         try:
             file = self.service.files().create(
                 body=file_metadata,
@@ -67,6 +126,16 @@ class DriveService:
         except Exception as e:
             print(f"Delete Error for {file_id}: {e}")
 
+    def file_exists(self, file_id):
+        """True if the file is still in Drive and not in the trash."""
+        if not self.service or not file_id: return False
+        try:
+            file = self.service.files().get(fileId=file_id, fields='id, trashed', supportsAllDrives=True).execute()
+            return not file.get('trashed', False)
+        except Exception as e:
+            print(f"File lookup failed for {file_id}: {e}")
+            return False
+
     def make_public(self, file_id):
         if not self.service: return
         try:
@@ -141,6 +210,48 @@ class DriveService:
             print(f"Error downloading file content: {e}")
             return None
 
+    def _media_session(self):
+        manager = get_credential_manager()
+        if manager.owns(self.credentials):
+            return manager.authorized_session()
+        from google.auth.transport.requests import AuthorizedSession
+        return AuthorizedSession(self.credentials)
+
+    def open_media_stream(self, file_id, request_headers=None, chunk_size=STREAM_CHUNK_SIZE):
+        """
+        Opens file media without buffering it. Returns (status, headers, chunks), or None if the file
+        does not exist. Range / conditional headers are forwarded, so Drive itself answers 206, 304
+        or 416. `chunks` yields at most chunk_size bytes at a time and closes the connection when done.
+        """
+        if not self.credentials: return None
+        headers = {'Accept-Encoding': 'identity'}  # Content-Length must match the bytes we pass on
+        for name in _FORWARD_REQUEST_HEADERS:
+            if request_headers and request_headers.get(name):
+                headers[name] = request_headers.get(name)
+
+        resp = self._media_session().get(
+            MEDIA_URL.format(file_id=quote(file_id, safe='')), headers=headers, stream=True, timeout=(10, 120)
+        )
+        if resp.status_code == 404:
+            resp.close()
+            return None
+        if resp.status_code not in (200, 206, 304, 416):
+            detail = resp.text[:200]
+            resp.close()
+            raise Exception(f"Drive media download failed ({resp.status_code}): {detail}")
+
+        passed = {name: resp.headers[name] for name in _FORWARD_RESPONSE_HEADERS if name in resp.headers}
+
+        def chunks():
+            try:
+                for chunk in resp.iter_content(chunk_size):
+                    if chunk:
+                        yield chunk
+            finally:
+                resp.close()
+
+        return resp.status_code, passed, chunks()
+
     def get_folder_name(self, folder_id):
         """Retrieves folder name from ID."""
         if not self.service or not folder_id: return "Unknown Folder"
@@ -0,0 +1,131 @@
+import json
+import os
+import queue
+import random
+import sys
+import threading
+import time
+import traceback
+from collections import deque
+
+LEVELS = {'debug': 10, 'info': 20, 'warning': 30, 'error': 40}
+LEVEL_NAMES = {v: k for k, v in LEVELS.items()}
+
+
+class EventLogger:
+    """
+    Structured, leveled event log for the hot paths (replaces print()).
+    - Events below `level` return after one int comparison, so debug instrumentation can stay in.
+    - Kept events go to an in-memory ring buffer (served at /debug/events).
+    - Events at/above `stream_level` are written to stdout as one JSON line each by a background
+      thread, so request threads never block on the log write.
+    Events must not carry customer data (names, addresses, phone numbers): log ids and counts instead.
+    Env: LOG_LEVEL (default info), LOG_STREAM_LEVEL (default info), LOG_DEBUG_SAMPLE (0-1, default 1),
+         LOG_BUFFER_SIZE (default 2000).
+    """
+    def __init__(self, level=None, stream_level=None, debug_sample=None, buffer_size=None, stream=None):
+        self.level = LEVELS.get((level or os.getenv('LOG_LEVEL', 'info')).lower(), 20)
+        self.stream_level = LEVELS.get((stream_level or os.getenv('LOG_STREAM_LEVEL', 'info')).lower(), 20)
+        self.debug_sample = float(debug_sample if debug_sample is not None else os.getenv('LOG_DEBUG_SAMPLE', '1'))
+        self.buffer = deque(maxlen=int(buffer_size or os.getenv('LOG_BUFFER_SIZE', '2000')))
+        self.stream = stream or sys.stdout
+        self.dropped = 0
+        self._seq = 0
+        self._seq_lock = threading.Lock()
+        self._queue = queue.SimpleQueue()
+        self._writer = None
+        self._writer_lock = threading.Lock()
+
+    @property
+    def level_name(self):
+        return LEVEL_NAMES.get(self.level, str(self.level))
+
+    def set_level(self, level):
+        self.level = LEVELS.get(str(level).lower(), self.level)
+
+    def is_enabled(self, level_name):
+        return LEVELS[level_name] >= self.level
+
+    def debug(self, event, **fields):
+        if self.level > 10:
+            return
+        if self.debug_sample < 1 and random.random() >= self.debug_sample:
+            self.dropped += 1
+            return
+        self._emit(10, event, fields)
+
+    def info(self, event, **fields):
+        if self.level > 20:
+            return
+        self._emit(20, event, fields)
+
+    def warning(self, event, **fields):
+        if self.level > 30:
+            return
+        self._emit(30, event, fields)
+
+    def error(self, event, **fields):
+        self._emit(40, event, fields)
+
+    def exception(self, event, **fields):
+        """Error event with the current traceback attached (call from an except block)."""
+        fields['traceback'] = traceback.format_exc()
+        self._emit(40, event, fields)
+
+    def _emit(self, level, event, fields):
+        # seq must be unique and in buffer order: /debug/events?since= relies on it
+        with self._seq_lock:
+            self._seq += 1
+            record = {'seq': self._seq, 'ts': time.time(), 'level': LEVEL_NAMES[level], 'event': event}
+            record.update(fields)
+            self.buffer.append(record)
+        if level >= self.stream_level:
+            self._ensure_writer()
+            self._queue.put(record)
+
+    def _ensure_writer(self):
+        if self._writer is None:
+            with self._writer_lock:
+                if self._writer is None:
+                    self._writer = threading.Thread(target=self._write_loop, daemon=True)
+                    self._writer.start()
+
+    def _write_loop(self):
+        while True:
+            record = self._queue.get()
+            lines = [record]
+            # Drain whatever else is queued and write it in one go
+            try:
+                while len(lines) < 500:
+                    lines.append(self._queue.get_nowait())
+            except queue.Empty:
+                pass
+            try:
+                self.stream.write("".join(json.dumps(r, ensure_ascii=False, default=str) + "\n" for r in lines))
+                self.stream.flush()
+            except Exception:
+                pass
+
+    def recent(self, limit=200, level=None, event=None, since=None):
+        """Newest-last slice of the ring buffer, optionally filtered."""
+        min_level = LEVELS.get(level, 0) if level else 0
+        records = list(self.buffer)
+        out = [
+            r for r in records
+            if LEVELS[r['level']] >= min_level
+            and (not event or event in r['event'])
+            and (since is None or r['seq'] > since)
+        ]
+        return out[-limit:]
+
+
+_event_log_instance = None
+_event_log_lock = threading.Lock()
+
+def get_event_log():
+    global _event_log_instance
+    if _event_log_instance is None:
+        with _event_log_lock:
+            if _event_log_instance is None:
+                _event_log_instance = EventLogger()
+    return _event_log_instance
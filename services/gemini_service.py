@@ -5,10 +5,12 @@ from PIL import Image
 from .ai_base_service import AIBaseService
 
 class GeminiService(AIBaseService):
-    def __init__(self, api_key):
+    DEFAULT_MODEL = 'gemini-2.5-flash'
+
+    def __init__(self, api_key, model=None):
         super().__init__(api_key)
         self.client = genai.Client(api_key=api_key)
-        self.model = 'gemini-2.5-flash'
+        self.model = model or self.DEFAULT_MODEL
         print(f"DEBUG: Gemini initialized with new SDK model: {self.model}")
 
     def extract_data_from_image(self, image_path):
@@ -27,6 +29,12 @@ class GeminiService(AIBaseService):
                 contents=[prompt, img]
             )
             
+            usage = getattr(response, 'usage_metadata', None)
+            if usage:
+                self.last_usage = {
+                    'input_tokens': usage.prompt_token_count or 0,
+                    'output_tokens': usage.candidates_token_count or 0
+                }
             text = response.text.strip()
             
             # Clean up response text to ensure it's valid JSON
@@ -3,6 +3,17 @@ from PIL import Image
 import requests
 from io import BytesIO
 
+from .event_log import get_event_log
+
+events = get_event_log()
+
+# Optional: local barcode/QR decoding (needs `pip install pyzbar` + the zbar system library)
+try:
+    from pyzbar.pyzbar import decode as zbar_decode
+except Exception as e:  # ImportError, or OSError when libzbar is missing
+    zbar_decode = None
+    events.info('barcode_unavailable', error=type(e).__name__)
+
 class ImageService:
     def __init__(self):
         # Use absolute path for temp directory
@@ -66,3 +77,52 @@ class ImageService:
             import shutil
             shutil.copy2(image_path1, output_path)
             return output_path
+
+    @property
+    def barcode_enabled(self):
+        return zbar_decode is not None
+
+    def decode_barcodes(self, image_paths):
+        """
+        Reads barcodes / QR codes locally from the downloaded slips (before the AI call).
+        Returns a de-duplicated list of decoded strings, or [] if pyzbar isn't available.
+        """
+        if zbar_decode is None:
+            return []
+
+        codes = []
+        for path in image_paths:
+            try:
+                with Image.open(path) as img:
+                    gray = img.convert('L')
+                    for symbol in zbar_decode(gray):
+                        value = symbol.data.decode('utf-8', errors='ignore').strip()
+                        if value and value not in codes:
+                            codes.append(value)
+            except Exception as e:
+                events.warning('barcode_decode_failed', error=type(e).__name__)
+        # Counts only: the codes are order and tracking numbers
+        events.debug('barcode_decoded', images=len(image_paths), codes=len(codes))
+        return codes
+
+    @staticmethod
+    def reconcile_code(ai_value, codes, max_diff=2):
+        """
+        Cross-validates an AI-read ID (order_id / tracking_number) against decoded barcodes.
+        If the AI value differs from a decoded code of the same length by at most `max_diff`
+        characters (typical OCR slips: 0/O, 1/I, 5/S), the barcode value wins.
+        """
+        if not codes:
+            return ai_value
+        ai_str = str(ai_value or '').strip()
+        if not ai_str or ai_str in codes:
+            return ai_value
+
+        for code in codes:
+            if len(code) != len(ai_str):
+                continue
+            diff = sum(1 for a, b in zip(code.upper(), ai_str.upper()) if a != b)
+            if diff <= max_diff:
+                events.info('barcode_corrected_ai_value', length=len(code), diff=diff)
+                return code
+        return ai_value
@@ -0,0 +1,412 @@
+import json
+import os
+import socket
+import sqlite3
+import threading
+import time
+
+from .event_log import get_event_log
+
+try:
+    import redis  # Only needed for the shared queue (REDIS_URL)
+except ImportError:
+    redis = None
+
+events = get_event_log()
+
+DEFAULT_QUEUE_PATH = "jobs.db"
+LEASE_SECONDS = 600     # A job not completed (or renewed) within this window is handed out again
+RENEW_SECONDS = 60      # A running job's lease is extended this often, so a slow handler is not run twice
+MAX_ATTEMPTS = 3        # After this many leases the job is parked as 'dead'
+RETRY_BACKOFF = 30      # Seconds before a failed job becomes visible again (x attempts)
+REDIS_PREFIX = "gravity:jobs:"
+
+
+class JobQueue:
+    """
+    Durable local job queue on SQLite (at-least-once).
+    - enqueue() commits before returning, so a restart after the webhook never loses the job.
+    - lease() hands a job to one consumer for LEASE_SECONDS. If the consumer dies (deploy, OOM,
+      recycled gunicorn worker) the lease expires and another consumer picks the job up again.
+    - While a handler runs its lease is renewed, so only a dead consumer loses the job.
+    - Handlers must still tolerate re-runs (the bot pipeline updates by Order ID).
+    Path: JOB_QUEUE_PATH env (default jobs.db). Every consumer must open the same file, i.e. run on
+    the same machine and disk: separate hosts (e.g. two Render services) use RedisJobQueue instead.
+    """
+    shared = False
+
+    def __init__(self, db_path=None):
+        self.db_path = db_path or os.getenv('JOB_QUEUE_PATH', DEFAULT_QUEUE_PATH)
+        self.location = self.db_path
+        directory = os.path.dirname(self.db_path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._local = threading.local()
+        self._wakeup = threading.Event()
+        conn = self._conn()
+        conn.execute("""
+            CREATE TABLE IF NOT EXISTS jobs (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                kind TEXT NOT NULL,
+                payload TEXT NOT NULL,
+                status TEXT NOT NULL DEFAULT 'queued',
+                attempts INTEGER NOT NULL DEFAULT 0,
+                available_at REAL NOT NULL,
+                lease_until REAL,
+                leased_by TEXT,
+                last_error TEXT,
+                created_at REAL NOT NULL,
+                updated_at REAL NOT NULL
+            )
+        """)
+        conn.execute("CREATE INDEX IF NOT EXISTS idx_jobs_ready ON jobs (status, available_at)")
+        conn.commit()
+
+    def _conn(self):
+        # One connection per thread; WAL lets the web tier enqueue while workers lease
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.db_path, timeout=30, isolation_level=None)
+            conn.row_factory = sqlite3.Row
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    def enqueue(self, kind, payload):
+        now = time.time()
+        cur = self._conn().execute(
+            "INSERT INTO jobs (kind, payload, available_at, created_at, updated_at) VALUES (?, ?, ?, ?, ?)",
+            (kind, json.dumps(payload, ensure_ascii=False), now, now, now)
+        )
+        self._wakeup.set()
+        events.info('job_enqueued', job_id=cur.lastrowid, kind=kind)
+        return cur.lastrowid
+
+    def lease(self, worker_id, lease_seconds=LEASE_SECONDS):
+        """Atomically claims the oldest ready job (queued, or leased with an expired lease)."""
+        now = time.time()
+        conn = self._conn()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            row = conn.execute(
+                """
+                SELECT * FROM jobs
+                WHERE (status = 'queued' AND available_at <= ?)
+                   OR (status = 'leased' AND lease_until < ?)
+                ORDER BY id LIMIT 1
+                """,
+                (now, now)
+            ).fetchone()
+            if row is None:
+                conn.execute("COMMIT")
+                return None
+            if row['status'] == 'leased':
+                events.warning('job_lease_expired', job_id=row['id'], previous_worker=row['leased_by'])
+            if row['attempts'] >= MAX_ATTEMPTS:
+                conn.execute(
+                    "UPDATE jobs SET status = 'dead', updated_at = ?, last_error = COALESCE(last_error, 'lease expired') WHERE id = ?",
+                    (now, row['id'])
+                )
+                conn.execute("COMMIT")
+                events.error('job_dead', job_id=row['id'], kind=row['kind'], attempts=row['attempts'])
+                return self.lease(worker_id, lease_seconds)
+            conn.execute(
+                "UPDATE jobs SET status = 'leased', attempts = attempts + 1, lease_until = ?, leased_by = ?, updated_at = ? WHERE id = ?",
+                (now + lease_seconds, worker_id, now, row['id'])
+            )
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+        job = dict(row)
+        job['payload'] = json.loads(job['payload'])
+        job['attempts'] += 1
+        return job
+
+    def renew(self, job_id, worker_id, lease_seconds=LEASE_SECONDS):
+        """Extends a running job's lease. False if the job is no longer leased by `worker_id`."""
+        cur = self._conn().execute(
+            "UPDATE jobs SET lease_until = ?, updated_at = ? WHERE id = ? AND status = 'leased' AND leased_by = ?",
+            (time.time() + lease_seconds, time.time(), job_id, worker_id)
+        )
+        return cur.rowcount == 1
+
+    def complete(self, job_id):
+        self._conn().execute(
+            "UPDATE jobs SET status = 'done', lease_until = NULL, updated_at = ? WHERE id = ?",
+            (time.time(), job_id)
+        )
+
+    def fail(self, job_id, error, attempts):
+        """Handler raised: retry with backoff, or park as 'dead' after MAX_ATTEMPTS."""
+        now = time.time()
+        if attempts >= MAX_ATTEMPTS:
+            status, available_at = 'dead', now
+        else:
+            status, available_at = 'queued', now + RETRY_BACKOFF * attempts
+        self._conn().execute(
+            "UPDATE jobs SET status = ?, available_at = ?, lease_until = NULL, last_error = ?, updated_at = ? WHERE id = ?",
+            (status, available_at, str(error)[:1000], now, job_id)
+        )
+        return status
+
+    def wait(self, timeout):
+        """Sleeps until a job is enqueued in this process or `timeout` passes."""
+        self._wakeup.wait(timeout)
+        self._wakeup.clear()
+
+    def purge_done(self, older_than=7 * 86400):
+        self._conn().execute(
+            "DELETE FROM jobs WHERE status = 'done' AND updated_at < ?", (time.time() - older_than,)
+        )
+
+    def stats(self):
+        rows = self._conn().execute("SELECT status, COUNT(*) AS n FROM jobs GROUP BY status").fetchall()
+        return {row['status']: row['n'] for row in rows}
+
+class RedisJobQueue:
+    """
+    The same queue on Redis (REDIS_URL), so a web service and a separate worker service share jobs.
+    - job:<id> hash holds the job; the queued/leased/done/dead sorted sets hold its id, scored by
+      available_at / lease_until / updated_at.
+    - lease() claims inside a WATCH/MULTI transaction, so two consumers never take the same job.
+    - enqueue() pushes onto a wakeup list that idle consumers block on (BLPOP) in any process.
+    """
+    shared = True
+
+    def __init__(self, url, prefix=REDIS_PREFIX, client=None):
+        if client is None:
+            if redis is None:
+                raise RuntimeError("REDIS_URL is set but the 'redis' package is not installed")
+            client = redis.Redis.from_url(url, decode_responses=True)
+        self.client = client
+        self.prefix = prefix
+        kwargs = self.client.connection_pool.connection_kwargs
+        # Host/db only: the URL may carry a password
+        self.location = f"redis://{kwargs.get('host', '?')}:{kwargs.get('port', '?')}/{kwargs.get('db', 0)}"
+
+    def _key(self, name):
+        return f"{self.prefix}{name}"
+
+    def _job_key(self, job_id):
+        return self._key(f"job:{job_id}")
+
+    def enqueue(self, kind, payload):
+        now = time.time()
+        job_id = self.client.incr(self._key('seq'))
+        pipe = self.client.pipeline()
+        pipe.hset(self._job_key(job_id), mapping={
+            'id': job_id, 'kind': kind, 'payload': json.dumps(payload, ensure_ascii=False),
+            'status': 'queued', 'attempts': 0, 'available_at': now, 'created_at': now, 'updated_at': now
+        })
+        pipe.zadd(self._key('queued'), {job_id: now})
+        pipe.lpush(self._key('wakeup'), job_id)
+        pipe.ltrim(self._key('wakeup'), 0, 63)
+        pipe.execute()
+        events.info('job_enqueued', job_id=job_id, kind=kind)
+        return job_id
+
+    def lease(self, worker_id, lease_seconds=LEASE_SECONDS):
+        """Atomically claims the oldest ready job (queued, or leased with an expired lease)."""
+        queued, leased, dead = self._key('queued'), self._key('leased'), self._key('dead')
+        while True:
+            with self.client.pipeline() as pipe:
+                try:
+                    pipe.watch(queued, leased)
+                    now = time.time()
+                    ids = pipe.zrangebyscore(queued, '-inf', now, start=0, num=1)
+                    expired = not ids
+                    if expired:
+                        ids = pipe.zrangebyscore(leased, '-inf', f"({now}", start=0, num=1)
+                    if not ids:
+                        pipe.unwatch()
+                        return None
+                    job_id = ids[0]
+                    job = pipe.hgetall(self._job_key(job_id))
+                    pipe.multi()
+                    pipe.zrem(queued, job_id)
+                    pipe.zrem(leased, job_id)
+                    if not job:
+                        pipe.execute()  # Purged meanwhile: drop the stale id
+                        continue
+                    attempts = int(job['attempts'])
+                    if attempts >= MAX_ATTEMPTS:
+                        pipe.hset(self._job_key(job_id), mapping={
+                            'status': 'dead', 'updated_at': now,
+                            'last_error': job.get('last_error') or 'lease expired'
+                        })
+                        pipe.zadd(dead, {job_id: now})
+                        pipe.execute()
+                        events.error('job_dead', job_id=int(job_id), kind=job['kind'], attempts=attempts)
+                        continue
+                    pipe.hset(self._job_key(job_id), mapping={
+                        'status': 'leased', 'attempts': attempts + 1, 'lease_until': now + lease_seconds,
+                        'leased_by': worker_id, 'updated_at': now
+                    })
+                    pipe.zadd(leased, {job_id: now + lease_seconds})
+                    pipe.execute()
+                except redis.WatchError:
+                    continue  # Another consumer changed the queue first: look again
+            if expired:
+                events.warning('job_lease_expired', job_id=int(job_id), previous_worker=job.get('leased_by'))
+            return {
+                'id': int(job_id), 'kind': job['kind'], 'payload': json.loads(job['payload']),
+                'status': 'leased', 'attempts': attempts + 1, 'created_at': float(job['created_at']),
+                'leased_by': worker_id, 'last_error': job.get('last_error')
+            }
+
+    def renew(self, job_id, worker_id, lease_seconds=LEASE_SECONDS):
+        """Extends a running job's lease. False if the job is no longer leased by `worker_id`."""
+        key = self._job_key(job_id)
+        with self.client.pipeline() as pipe:
+            try:
+                pipe.watch(key)
+                status, leased_by = pipe.hmget(key, 'status', 'leased_by')
+                if status != 'leased' or leased_by != worker_id:
+                    pipe.unwatch()
+                    return False
+                now = time.time()
+                pipe.multi()
+                pipe.hset(key, mapping={'lease_until': now + lease_seconds, 'updated_at': now})
+                pipe.zadd(self._key('leased'), {job_id: now + lease_seconds})
+                pipe.execute()
+                return True
+            except redis.WatchError:
+                return False  # Re-leased or finished meanwhile
+
+    def _finish(self, job_id, status, score, fields):
+        now = time.time()
+        pipe = self.client.pipeline()
+        pipe.hset(self._job_key(job_id), mapping=dict(fields, status=status, updated_at=now))
+        pipe.hdel(self._job_key(job_id), 'lease_until')
+        pipe.zrem(self._key('leased'), job_id)
+        pipe.zadd(self._key(status), {job_id: score})
+        pipe.execute()
+
+    def complete(self, job_id):
+        self._finish(job_id, 'done', time.time(), {})
+
+    def fail(self, job_id, error, attempts):
+        """Handler raised: retry with backoff, or park as 'dead' after MAX_ATTEMPTS."""
+        now = time.time()
+        if attempts >= MAX_ATTEMPTS:
+            status, available_at = 'dead', now
+        else:
+            status, available_at = 'queued', now + RETRY_BACKOFF * attempts
+        self._finish(job_id, status, available_at, {'available_at': available_at, 'last_error': str(error)[:1000]})
+        return status
+
+    def wait(self, timeout):
+        """Blocks until a job is enqueued by any process or `timeout` passes."""
+        self.client.blpop([self._key('wakeup')], timeout=max(timeout, 0.01))
+
+    def purge_done(self, older_than=7 * 86400):
+        done = self._key('done')
+        ids = self.client.zrangebyscore(done, '-inf', time.time() - older_than)
+        if ids:
+            pipe = self.client.pipeline()
+            pipe.delete(*[self._job_key(job_id) for job_id in ids])
+            pipe.zrem(done, *ids)
+            pipe.execute()
+
+    def stats(self):
+        pipe = self.client.pipeline()
+        statuses = ('queued', 'leased', 'done', 'dead')
+        for status in statuses:
+            pipe.zcard(self._key(status))
+        return {status: n for status, n in zip(statuses, pipe.execute()) if n}
+
+
+class JobWorker:
+    """
+    Consumer loop: lease -> handler(payload, attempt) -> complete / fail.
+    handlers: {kind: callable(payload, attempt)}. A handler raises to have the job retried with
+    backoff (parked as 'dead' after MAX_ATTEMPTS); attempt == MAX_ATTEMPTS is the last try.
+    Used by the in-process consumer and by worker.py.
+    """
+    def __init__(self, job_queue, handlers, concurrency=1, poll_interval=1.0, name=None):
+        self.queue = job_queue
+        self.handlers = handlers
+        self.concurrency = concurrency
+        self.poll_interval = poll_interval
+        self.name = name or f"{socket.gethostname()}:{os.getpid()}"
+        self._threads = []
+        self._stop = threading.Event()
+
+    def start(self):
+        for i in range(self.concurrency):
+            t = threading.Thread(target=self._loop, args=[f"{self.name}#{i}"], daemon=True)
+            t.start()
+            self._threads.append(t)
+        events.info('job_worker_started', worker=self.name, concurrency=self.concurrency, queue=self.queue.location)
+        return self
+
+    def stop(self):
+        self._stop.set()
+
+    def run_forever(self):
+        self.start()
+        last_purge = 0
+        try:
+            while not self._stop.is_set():
+                if time.time() - last_purge > 3600:
+                    self.queue.purge_done()
+                    last_purge = time.time()
+                self._stop.wait(5)
+        except KeyboardInterrupt:
+            self.stop()
+
+    def _loop(self, worker_id):
+        while not self._stop.is_set():
+            try:
+                job = self.queue.lease(worker_id)
+            except Exception as e:
+                events.exception('job_lease_failed', worker=worker_id, error=str(e))
+                job = None
+            if job is None:
+                self.queue.wait(self.poll_interval)
+                continue
+            self.run_job(job, worker_id)
+
+    def run_job(self, job, worker_id):
+        handler = self.handlers.get(job['kind'])
+        events.info('job_leased', job_id=job['id'], kind=job['kind'], attempt=job['attempts'],
+                    worker=worker_id, waited=round(time.time() - job['created_at'], 3))
+        done = threading.Event()
+        renewer = threading.Thread(target=self._renew_loop, args=(job['id'], worker_id, done), daemon=True)
+        renewer.start()
+        try:
+            if handler is None:
+                raise Exception(f"No handler for job kind '{job['kind']}'")
+            handler(job['payload'], job['attempts'])
+            self.queue.complete(job['id'])
+        except Exception as e:
+            status = self.queue.fail(job['id'], e, job['attempts'])
+            events.exception('job_handler_failed', job_id=job['id'], kind=job['kind'], status=status,
+                             attempt=job['attempts'], error=str(e))
+        finally:
+            done.set()
+
+    def _renew_loop(self, job_id, worker_id, done):
+        while not done.wait(RENEW_SECONDS):
+            try:
+                if not self.queue.renew(job_id, worker_id):
+                    events.warning('job_lease_lost', job_id=job_id, worker=worker_id)
+                    return
+            except Exception as e:
+                events.warning('job_lease_renew_failed', job_id=job_id, error=str(e))
+
+
+_job_queue_instance = None
+_job_queue_lock = threading.Lock()
+
+def get_job_queue():
+    """RedisJobQueue when REDIS_URL is set (shared by every service), else the local SQLite file."""
+    global _job_queue_instance
+    if _job_queue_instance is None:
+        with _job_queue_lock:
+            if _job_queue_instance is None:
+                redis_url = os.getenv('REDIS_URL', '').strip()
+                _job_queue_instance = RedisJobQueue(redis_url) if redis_url else JobQueue()
+    return _job_queue_instance
@@ -0,0 +1,136 @@
+import threading
+import time
+from contextlib import contextmanager
+
+# Seconds: LINE download / stitching are sub-second, AI extraction is 5-30 s
+DURATION_BUCKETS = (0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 20, 30, 60)
+# Bytes: JPEG slips are ~100 KB - 5 MB
+SIZE_BUCKETS = (10_000, 50_000, 100_000, 250_000, 500_000, 1_000_000, 2_500_000, 5_000_000, 10_000_000)
+
+
+class Histogram:
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)  # last slot = +Inf
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        for i, bound in enumerate(self.buckets):
+            if value <= bound:
+                self.counts[i] += 1
+                break
+        else:
+            self.counts[-1] += 1
+        self.sum += value
+        self.count += 1
+
+
+class Span:
+    """One timed pipeline stage. Code inside the span may set `outcome` and `size`."""
+    def __init__(self, stage):
+        self.stage = stage
+        self.outcome = 'ok'
+        self.size = None
+        self.duration = None
+
+
+class MetricsRegistry:
+    """
+    In-process stage metrics for the bot pipeline, rendered in Prometheus text format at /metrics.
+    Note: each gunicorn worker process keeps its own registry.
+    """
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._durations = {}  # stage -> Histogram
+        self._sizes = {}      # stage -> Histogram
+        self._outcomes = {}   # (stage, outcome) -> count
+        self.started_at = time.time()
+
+    def observe(self, stage, seconds, outcome='ok', size=None):
+        with self._lock:
+            hist = self._durations.get(stage)
+            if hist is None:
+                hist = self._durations[stage] = Histogram(DURATION_BUCKETS)
+            hist.observe(seconds)
+            key = (stage, outcome)
+            self._outcomes[key] = self._outcomes.get(key, 0) + 1
+            if size is not None:
+                size_hist = self._sizes.get(stage)
+                if size_hist is None:
+                    size_hist = self._sizes[stage] = Histogram(SIZE_BUCKETS)
+                size_hist.observe(size)
+
+    @contextmanager
+    def span(self, stage):
+        """
+        with metrics.span('ai_extraction') as s:
+            ...
+            s.outcome = 'empty'
+        Exceptions are recorded as outcome='error' and re-raised.
+        """
+        s = Span(stage)
+        start = time.perf_counter()
+        try:
+            yield s
+        except Exception:
+            s.outcome = 'error'
+            raise
+        finally:
+            s.duration = time.perf_counter() - start
+            self.observe(stage, s.duration, s.outcome, s.size)
+
+    def render_prometheus(self):
+        lines = [
+            "# HELP gravity_stage_duration_seconds Bot pipeline stage duration.",
+            "# TYPE gravity_stage_duration_seconds histogram",
+        ]
+        with self._lock:
+            for stage, hist in sorted(self._durations.items()):
+                lines.extend(self._render_histogram('gravity_stage_duration_seconds', stage, hist))
+
+            lines += [
+                "# HELP gravity_stage_payload_bytes Payload size handled by a stage.",
+                "# TYPE gravity_stage_payload_bytes histogram",
+            ]
+            for stage, hist in sorted(self._sizes.items()):
+                lines.extend(self._render_histogram('gravity_stage_payload_bytes', stage, hist))
+
+            lines += [
+                "# HELP gravity_stage_total Bot pipeline stage executions by outcome.",
+                "# TYPE gravity_stage_total counter",
+            ]
+            for (stage, outcome), count in sorted(self._outcomes.items()):
+                lines.append(f'gravity_stage_total{{stage="{stage}",outcome="{outcome}"}} {count}')
+
+        lines += [
+            "# HELP gravity_process_start_time_seconds Start time of this worker.",
+            "# TYPE gravity_process_start_time_seconds gauge",
+            f"gravity_process_start_time_seconds {self.started_at:.0f}",
+        ]
+        return "\n".join(lines) + "\n"
+
+    @staticmethod
+    def _render_histogram(name, stage, hist):
+        lines = []
+        cumulative = 0
+        for bound, count in zip(hist.buckets, hist.counts):
+            cumulative += count
+            lines.append(f'{name}_bucket{{stage="{stage}",le="{bound}"}} {cumulative}')
+        cumulative += hist.counts[-1]
+        lines.append(f'{name}_bucket{{stage="{stage}",le="+Inf"}} {cumulative}')
+        lines.append(f'{name}_sum{{stage="{stage}"}} {hist.sum:.6f}')
+        lines.append(f'{name}_count{{stage="{stage}"}} {hist.count}')
+        return lines
+
+
+_metrics_instance = None
+_metrics_lock = threading.Lock()
+
+def get_metrics():
+    global _metrics_instance
+    if _metrics_instance is None:
+        with _metrics_lock:
+            if _metrics_instance is None:
+                _metrics_instance = MetricsRegistry()
+    return _metrics_instance
@@ -3,20 +3,23 @@ from openai import OpenAI
 from .ai_base_service import AIBaseService
 
 class OpenAIService(AIBaseService):
-    def __init__(self, api_key):
+    DEFAULT_MODEL = "gpt-4o"
+
+    def __init__(self, api_key, model=None):
         super().__init__(api_key)
         self.client = OpenAI(api_key=api_key)
+        self.model = model or self.DEFAULT_MODEL
 
     def extract_data_from_image(self, image_path):
         """
-        Sends image to OpenAI GPT-4o and extracts data as JSON.
+        Sends image to OpenAI (GPT-4o by default) and extracts data as JSON.
         """
         base64_image = self.encode_image(image_path)
         prompt = self.get_prompt()
         
         try:
             response = self.client.chat.completions.create(
-                model="gpt-4o",
+                model=self.model,
                 messages=[
                     {
                         "role": "user",
@@ -35,6 +38,11 @@ class OpenAIService(AIBaseService):
                 max_tokens=1000,
             )
             
+            if response.usage:
+                self.last_usage = {
+                    'input_tokens': response.usage.prompt_tokens,
+                    'output_tokens': response.usage.completion_tokens
+                }
             content = response.choices[0].message.content
             
             # Clean up response text to ensure it's valid JSON
@@ -0,0 +1,50 @@
+# Sheet header aliases -> canonical dashboard column names.
+# Headers differ between months (Thai / English / snake_case); a header maps to the first alias it contains.
+COLUMN_ALIASES = {
+    'Run No': 'Run No', 'run_no': 'Run No', 'ลำดับ': 'Run No', 'Run No.': 'Run No',
+    'Name': 'Name', 'receiver_name': 'Name', 'ชื่อลูกค้า': 'Name', 'ชื่อหน้ากล่อง': 'Name',
+    'Item': 'Item', 'item_name': 'Item', 'ชื่อของ': 'Item', 'รายการสินค้า': 'Item',
+    'Price': 'Price', 'price': 'Price', 'ยอดรวม': 'Price', 'ราคาของ': 'Price',
+    'Shop': 'Shop', 'shop': 'Shop', 'shop_name': 'Shop', 'ชื่อร้าน': 'Shop',
+    'Status': 'Status', 'status': 'Status', 'สถานะ': 'Status',
+    'Order ID': 'Order ID', 'order_id': 'Order ID', 'เลขออเดอร์': 'Order ID', 'เลขอเดอร์': 'Order ID',
+    'Image Link': 'Image Link', 'image_link': 'Image Link', 'Link รูป': 'Image Link', 'Link Ima.': 'Image Link',
+    'Tracking Number': 'Tracking', 'tracking_number': 'Tracking', 'เลขพัสดุ': 'Tracking',
+    'Platform': 'Platform', 'platform': 'Platform',
+    'Coins': 'Coins', 'coins': 'Coins', 'เหรียญ': 'Coins',
+    'Date': 'Date', 'date': 'Date', 'วันที่ bought': 'Date', 'วันที่': 'Date', 'วันที่ซื้อ': 'Date',
+    'Location': 'Location', 'location': 'Location', 'ที่อยู่': 'Location', 'ส่งที่ไหน': 'Location',
+    'วันรับของ': 'SavedDate', 'delivery_date': 'SavedDate', 'saved_date': 'SavedDate'
+}
+
+_canonical_cache = {}
+
+def canonical_column(header):
+    """Canonical name for a sheet header, or None if it is not a known column."""
+    header = str(header)
+    if header not in _canonical_cache:
+        _canonical_cache[header] = next((v for k, v in COLUMN_ALIASES.items() if k in header), None)
+    return _canonical_cache[header]
+
+def column_renames(headers):
+    """{header: canonical} for the headers that have a canonical name (as used by DataFrame.rename)."""
+    renamed = {}
+    for header in headers:
+        canonical = canonical_column(header)
+        if canonical:
+            renamed[header] = canonical
+    return renamed
+
+def rows_to_records(rows):
+    """Raw get_all_values() rows (header first) -> records keyed by canonical column, one per data row."""
+    if not rows:
+        return []
+    columns = [(i, canonical_column(h)) for i, h in enumerate(rows[0])]
+    columns = [(i, name) for i, name in columns if name]
+    records = []
+    for row in rows[1:]:
+        record = {}
+        for i, name in columns:
+            record[name] = row[i] if i < len(row) else ""
+        records.append(record)
+    return records
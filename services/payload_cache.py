@@ -0,0 +1,117 @@
+import gzip
+import hashlib
+import json
+import threading
+import time
+from collections import OrderedDict
+
+from .event_log import get_event_log
+
+try:
+    import orjson  # ~5-10x faster than json.dumps for large lists of dicts
+except ImportError:
+    orjson = None
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+events = get_event_log()
+
+GZIP_LEVEL = 6
+BROTLI_QUALITY = 5  # Smaller than gzip -6 at a similar cost; 11 is far too slow per version
+MAX_ENTRIES = 8     # Encoded payloads kept (one per sheet, latest version only)
+
+
+def dumps_json(obj):
+    """Compact UTF-8 JSON bytes (Thai text is not \\u-escaped)."""
+    if orjson is not None:
+        return orjson.dumps(obj, default=str)
+    return json.dumps(obj, ensure_ascii=False, separators=(',', ':'), default=str).encode('utf-8')
+
+
+def available_encodings():
+    return ('br', 'gzip') if brotli is not None else ('gzip',)
+
+
+class EncodedPayload:
+    """The JSON body of one snapshot version plus its compressed variants (built on first use)."""
+    def __init__(self, key, version, body):
+        self.key = key
+        self.version = version
+        # Hash of the body, not the version: versions come from a per-process counter, so after a
+        # restart or on another worker the same number can mean different records
+        self.digest = hashlib.sha1(body).hexdigest()[:20]
+        self.etag = f'W/"{self.digest}"'
+        self._variants = {'identity': body}
+        self._lock = threading.Lock()
+
+    def body(self, encoding='identity'):
+        variant = self._variants.get(encoding)
+        if variant is not None:
+            return variant
+        with self._lock:
+            variant = self._variants.get(encoding)
+            if variant is None:
+                start = time.perf_counter()
+                raw = self._variants['identity']
+                if encoding == 'br':
+                    variant = brotli.compress(raw, quality=BROTLI_QUALITY)
+                elif encoding == 'gzip':
+                    variant = gzip.compress(raw, compresslevel=GZIP_LEVEL)
+                else:
+                    raise ValueError(f"Unsupported encoding: {encoding}")
+                self._variants[encoding] = variant
+                events.debug('payload_compressed', key=self.key, version=self.version, encoding=encoding,
+                             raw=len(raw), compressed=len(variant), ms=round((time.perf_counter() - start) * 1000, 1))
+        return variant
+
+    def sizes(self):
+        return {encoding: len(data) for encoding, data in self._variants.items()}
+
+
+class PayloadCache:
+    """
+    Serialized responses per (key, version): a repeated hit is a dict lookup instead of
+    re-serializing thousands of records. Only the latest version of each key is kept.
+    """
+    def __init__(self, max_entries=MAX_ENTRIES):
+        self.max_entries = max_entries
+        self._entries = OrderedDict()  # key -> EncodedPayload
+        self._lock = threading.Lock()
+
+    def get(self, key, version, build):
+        """EncodedPayload for `version`; build() -> JSON-able object is called once per version."""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry.version == version:
+                self._entries.move_to_end(key)
+                return entry
+        start = time.perf_counter()
+        entry = EncodedPayload(key, version, dumps_json(build()))
+        events.debug('payload_serialized', key=key, version=version, bytes=len(entry.body()),
+                     ms=round((time.perf_counter() - start) * 1000, 1), serializer='orjson' if orjson else 'json')
+        with self._lock:
+            current = self._entries.get(key)
+            if current is not None and current.version == version:
+                return current  # Another thread built the same version meanwhile
+            self._entries[key] = entry
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+        return entry
+
+    def stats(self):
+        with self._lock:
+            return {key: {'version': e.version, 'sizes': e.sizes()} for key, e in self._entries.items()}
+
+
+def negotiate_encoding(accept_encodings):
+    """Best encoding we can serve for a werkzeug Accept-Encoding header ('identity' if none)."""
+    best, best_quality = 'identity', 0
+    for encoding in available_encodings():
+        quality = accept_encodings[encoding]
+        if quality > best_quality:
+            best, best_quality = encoding, quality
+    return best
@@ -0,0 +1,256 @@
+import json
+import os
+import threading
+import time
+from contextlib import contextmanager
+
+import numpy as np
+from PIL import Image
+
+try:
+    import fcntl  # POSIX only: serializes appends/compaction across gunicorn workers
+except ImportError:
+    fcntl = None
+
+
+# Status bar / navigation bar are cropped before hashing so a clock or battery change
+# doesn't move the hash (fractions of image height)
+CORE_TOP = 0.06
+CORE_BOTTOM = 0.05
+
+MAX_ENTRIES = 20000   # Newest slips kept (PHASH_INDEX_MAX_ENTRIES)
+MAX_AGE_DAYS = 180    # Older prior extractions are ignored and dropped (PHASH_INDEX_MAX_AGE_DAYS)
+COMPACT_SLACK = 0.5   # Rewrite the log once it holds 50% more lines than live entries (or the cap)
+
+
+def _dct_matrix(n):
+    k = np.arange(n)
+    m = np.cos(np.pi * (2 * k[None, :] + 1) * k[:, None] / (2 * n))
+    m[0] *= 1 / np.sqrt(2)
+    return m * np.sqrt(2 / n)
+
+_DCT_CACHE = {}
+
+
+def phash(image_path, size=64, keep=16):
+    """
+    Perceptual hash (DCT pHash) as an int of keep*keep-1 bits.
+    Low-frequency DCT coefficients of the slip body are compared to their median,
+    which is stable under re-screenshots / recompression (unlike dHash on flat white UIs).
+    """
+    with Image.open(image_path) as img:
+        w, h = img.size
+        body = img.crop((0, int(h * CORE_TOP), w, int(h * (1 - CORE_BOTTOM))))
+        pixels = np.asarray(body.convert('L').resize((size, size), Image.LANCZOS), dtype=np.float64)
+
+    m = _DCT_CACHE.get(size)
+    if m is None:
+        m = _DCT_CACHE[size] = _dct_matrix(size)
+    low = (m @ pixels @ m.T)[:keep, :keep].flatten()[1:]  # drop the DC term
+    bits = low > np.median(low)
+
+    value = 0
+    for bit in bits:
+        value = (value << 1) | int(bit)
+    return value
+
+
+def hamming(a, b):
+    return (a ^ b).bit_count()
+
+
+class BKTree:
+    """Burkhard-Keller tree over Hamming distance: near-neighbour lookups touch only a few nodes."""
+    def __init__(self):
+        self.root = None  # [hash, key, {distance: child}]
+
+    def add(self, value, key):
+        if self.root is None:
+            self.root = [value, key, {}]
+            return
+        node = self.root
+        while True:
+            d = hamming(value, node[0])
+            if d == 0:
+                node[1] = key  # same hash: newest entry wins
+                return
+            child = node[2].get(d)
+            if child is None:
+                node[2][d] = [value, key, {}]
+                return
+            node = child
+
+    def search(self, value, max_distance):
+        """Returns [(distance, key), ...] sorted by distance."""
+        if self.root is None:
+            return []
+        results = []
+        stack = [self.root]
+        while stack:
+            node = stack.pop()
+            d = hamming(value, node[0])
+            if d <= max_distance:
+                results.append((d, node[1]))
+            lo, hi = d - max_distance, d + max_distance
+            for dist, child in node[2].items():
+                if lo <= dist <= hi:
+                    stack.append(child)
+        results.sort(key=lambda r: r[0])
+        return results
+
+
+class PHashIndex:
+    """
+    Persistent index: perceptual hash -> prior extraction of every processed slip.
+    Stored as an append-only JSON Lines log next to config.json (override with PHASH_INDEX_PATH):
+    add() appends one line, later lines win on load. The log is compacted (rewritten with live
+    entries only) once it holds COMPACT_SLACK more lines than needed; entries older than
+    PHASH_INDEX_MAX_AGE_DAYS or beyond the newest PHASH_INDEX_MAX_ENTRIES are dropped then.
+    """
+    def __init__(self, index_path=None, max_distance=4, max_entries=None, max_age_days=None):
+        default_path = os.path.abspath(os.path.join(os.path.dirname(__file__), '..', 'phash_index.jsonl'))
+        self.index_path = index_path or os.getenv('PHASH_INDEX_PATH', default_path)
+        self.max_distance = max_distance
+        self.max_entries = int(max_entries or os.getenv('PHASH_INDEX_MAX_ENTRIES', MAX_ENTRIES))
+        max_age_days = max_age_days if max_age_days is not None else os.getenv('PHASH_INDEX_MAX_AGE_DAYS', MAX_AGE_DAYS)
+        self.max_age = float(max_age_days) * 86400
+        self._lock = threading.Lock()
+        self._entries = {}  # hex hash -> entry
+        self._tree = BKTree()
+        self._lines = 0     # Lines in the log (live + superseded)
+        self._load()
+
+    def _read_log(self):
+        """{key: entry} from the log (later lines win) and its line count."""
+        entries, lines = {}, 0
+        if not os.path.exists(self.index_path):
+            return entries, lines
+        with open(self.index_path, 'r', encoding='utf-8') as f:
+            for line in f:
+                lines += 1
+                try:
+                    record = json.loads(line)
+                except ValueError:
+                    continue  # Half-written line from a crash
+                key = record.pop('key', None)
+                if key:
+                    entries[key] = record
+        return entries, lines
+
+    def _load(self):
+        try:
+            entries, self._lines = self._read_log()
+            # One-time import of the old single-JSON index (phash_index.json)
+            base, ext = os.path.splitext(self.index_path)
+            legacy_path = f"{base}.json" if ext == '.jsonl' else None
+            if not entries and legacy_path and os.path.exists(legacy_path):
+                with open(legacy_path, 'r', encoding='utf-8') as f:
+                    entries = json.load(f)
+                self._set_entries(self._prune(entries))
+                self._compact()
+            else:
+                self._set_entries(self._prune(entries))
+            if self._entries:
+                print(f"DEBUG: Loaded perceptual hash index ({len(self._entries)} slips)")
+        except Exception as e:
+            print(f"Error loading phash index: {e}")
+
+    def _prune(self, entries):
+        """Drops expired entries and keeps the newest max_entries."""
+        cutoff = time.time() - self.max_age
+        live = [(key, entry) for key, entry in entries.items() if entry.get('saved_at', 0) >= cutoff]
+        if len(live) > self.max_entries:
+            live.sort(key=lambda item: item[1].get('saved_at', 0))
+            live = live[-self.max_entries:]
+        return dict(live)
+
+    def _set_entries(self, entries):
+        # BK-trees have no delete: rebuilt after pruning
+        self._entries = entries
+        self._tree = BKTree()
+        for key in entries:
+            self._tree.add(int(key, 16), key)
+
+    @contextmanager
+    def _file_lock(self):
+        """flock on <index>.lock (POSIX): other workers append to the same log."""
+        if fcntl is None:
+            yield
+            return
+        with open(f"{self.index_path}.lock", 'a') as lock_file:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    def _needs_compaction(self):
+        return (self._lines > self.max_entries * (1 + COMPACT_SLACK)
+                or self._lines > len(self._entries) * (1 + COMPACT_SLACK) + 100)
+
+    def _compact(self):
+        """Rewrites the log with live entries only, keeping lines other workers appended since our load."""
+        with self._file_lock():
+            merged, _ = self._read_log()
+            for key, entry in self._entries.items():
+                if entry.get('saved_at', 0) >= merged.get(key, {}).get('saved_at', 0):
+                    merged[key] = entry
+            entries = self._prune(merged)
+            tmp_path = f"{self.index_path}.tmp"
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                for key, entry in entries.items():
+                    f.write(json.dumps(dict(entry, key=key), ensure_ascii=False) + "\n")
+            os.replace(tmp_path, self.index_path)
+        self._set_entries(entries)
+        self._lines = len(entries)
+
+    def find_near(self, image_hash, max_distance=None):
+        """Returns (distance, entry) of the closest prior slip, or (None, None). Expired entries are skipped."""
+        limit = self.max_distance if max_distance is None else max_distance
+        cutoff = time.time() - self.max_age
+        with self._lock:
+            for distance, key in self._tree.search(image_hash, limit):
+                entry = self._entries.get(key)
+                if entry is not None and entry.get('saved_at', 0) >= cutoff:
+                    return distance, entry
+            return None, None
+
+    def add(self, image_hash, data, run_no=None, sheet_name=None):
+        """Records a processed slip: one appended line (plus an occasional compaction)."""
+        key = f"{image_hash:x}"
+        entry = {
+            'data': data,
+            'order_id': str(data.get('order_id', '')) if data else '',
+            'run_no': run_no,
+            'sheet_name': sheet_name,
+            'saved_at': time.time()
+        }
+        with self._lock:
+            self._entries[key] = entry
+            self._tree.add(image_hash, key)
+            try:
+                with self._file_lock():
+                    with open(self.index_path, 'a', encoding='utf-8') as f:
+                        f.write(json.dumps(dict(entry, key=key), ensure_ascii=False) + "\n")
+                self._lines += 1
+                if self._needs_compaction():
+                    self._compact()
+            except Exception as e:
+                print(f"Error saving phash index: {e}")
+        return key
+
+    def stats(self):
+        with self._lock:
+            return {'entries': len(self._entries), 'log_lines': self._lines}
+
+
+_phash_index_instance = None
+_phash_index_lock = threading.Lock()
+
+def get_phash_index():
+    global _phash_index_instance
+    if _phash_index_instance is None:
+        with _phash_index_lock:
+            if _phash_index_instance is None:
+                _phash_index_instance = PHashIndex()
+    return _phash_index_instance
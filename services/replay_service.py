@@ -0,0 +1,304 @@
+import json
+import os
+import shutil
+import threading
+import time
+from datetime import datetime
+
+from .image_service import ImageService
+
+# Which service calls are external (LINE / OpenAI / Google) and therefore recorded + replayed.
+# Local work (stitch, barcode decode, hashing) always runs for real.
+RECORDED_METHODS = {
+    'image_service': ['download_image'],
+    'ai_service': ['extract_with_retry'],
+    'sheet_service': ['check_duplicate', 'find_row_by_order_id', 'get_next_run_no',
+                      'append_data', 'update_existing_data', 'get_all_data'],
+    'drive_service': ['get_folder_name', 'upload_file'],
+}
+
+
+def _json_safe(value):
+    """Best-effort conversion of call args/results to JSON (tuples -> lists, unknown -> repr)."""
+    if isinstance(value, (str, int, float, bool)) or value is None:
+        return value
+    if isinstance(value, (list, tuple)):
+        return [_json_safe(v) for v in value]
+    if isinstance(value, dict):
+        return {str(k): _json_safe(v) for k, v in value.items()}
+    return repr(value)
+
+
+class FixtureRecorder:
+    """
+    Records real traffic into a fixture session directory:
+      <root>/<session>/webhooks.jsonl          raw LINE webhook bodies
+      <root>/<session>/job_<n>/calls.jsonl     one line per external call (result + elapsed)
+      <root>/<session>/job_<n>/images/<id>.jpg downloaded LINE image bytes
+    Enabled by setting GRAVITY_RECORD_DIR.
+    """
+    def __init__(self, root_dir):
+        session = datetime.now().strftime("%Y%m%d_%H%M%S") + f"_{os.getpid()}"
+        self.session_dir = os.path.join(root_dir, session)
+        os.makedirs(self.session_dir, exist_ok=True)
+        self._lock = threading.Lock()
+        self._job_count = 0
+        print(f"DEBUG: Recording fixtures to {self.session_dir}")
+
+    def record_webhook(self, body):
+        with self._lock:
+            with open(os.path.join(self.session_dir, 'webhooks.jsonl'), 'a', encoding='utf-8') as f:
+                f.write(json.dumps({'ts': time.time(), 'body': body}, ensure_ascii=False) + "\n")
+
+    def new_job_dir(self):
+        with self._lock:
+            self._job_count += 1
+            job_dir = os.path.join(self.session_dir, f"job_{self._job_count:04d}")
+        os.makedirs(os.path.join(job_dir, 'images'), exist_ok=True)
+        return job_dir
+
+    def wrap_provider(self, provider):
+        return RecordingProvider(provider, self)
+
+
+class RecordingProxy:
+    """Wraps a service and appends every recorded method call to the job's calls.jsonl."""
+    def __init__(self, target, service_name, job_dir, lock):
+        self._target = target
+        self._service_name = service_name
+        self._job_dir = job_dir
+        self._lock = lock
+        self._methods = set(RECORDED_METHODS.get(service_name, []))
+
+    def __getattr__(self, name):
+        attr = getattr(self._target, name)
+        if name not in self._methods or not callable(attr):
+            return attr
+
+        def recorded(*args, **kwargs):
+            start = time.perf_counter()
+            error = None
+            result = None
+            try:
+                result = attr(*args, **kwargs)
+                return result
+            except Exception as e:
+                error = str(e)
+                raise
+            finally:
+                elapsed = time.perf_counter() - start
+                self._write(name, args, result, error, elapsed)
+        return recorded
+
+    def _write(self, method, args, result, error, elapsed):
+        # Never record headers/credentials: keep only plain positional args
+        safe_args = [_json_safe(a) for a in args if isinstance(a, (str, int, float))]
+        stored = _json_safe(result)
+        if method == 'download_image' and result and os.path.exists(result):
+            image_name = f"{args[0]}.jpg"
+            shutil.copy2(result, os.path.join(self._job_dir, 'images', image_name))
+            stored = image_name
+
+        entry = {
+            'service': self._service_name,
+            'method': method,
+            'args': safe_args,
+            'result': stored,
+            'error': error,
+            'elapsed': round(elapsed, 6)
+        }
+        with self._lock:
+            with open(os.path.join(self._job_dir, 'calls.jsonl'), 'a', encoding='utf-8') as f:
+                f.write(json.dumps(entry, ensure_ascii=False) + "\n")
+
+
+class RecordingProvider:
+    """ServiceProvider look-alike: one instance per bot job, one job_<n>/ fixture."""
+    def __init__(self, provider, recorder):
+        self._provider = provider
+        self._recorder = recorder
+        self._job_dir = None
+        self._lock = threading.Lock()
+        self._wrapped = {}
+
+    def __getattr__(self, name):
+        if name not in RECORDED_METHODS:
+            return getattr(self._provider, name)
+        if name not in self._wrapped:
+            if self._job_dir is None:
+                self._job_dir = self._recorder.new_job_dir()
+            self._wrapped[name] = RecordingProxy(getattr(self._provider, name), name, self._job_dir, self._lock)
+        return self._wrapped[name]
+
+
+_recorder_instance = None
+_recorder_lock = threading.Lock()
+
+def get_recorder():
+    """Returns the process-wide FixtureRecorder, or None when GRAVITY_RECORD_DIR is not set."""
+    global _recorder_instance
+    root = os.getenv('GRAVITY_RECORD_DIR', '').strip()
+    if not root:
+        return None
+    if _recorder_instance is None:
+        with _recorder_lock:
+            if _recorder_instance is None:
+                _recorder_instance = FixtureRecorder(root)
+    return _recorder_instance
+
+
+# ─── Replay ───────────────────────────────────────────────────────────────────
+
+class LatencyModel:
+    """
+    Injected latency for stand-ins.
+    - fixed: {"ai_service": 3.0, "drive_service.upload_file": 0.8} seconds (method key wins over service key)
+    - otherwise the recorded elapsed time multiplied by `scale` (scale=0 -> no sleeping)
+    """
+    def __init__(self, scale=1.0, fixed=None):
+        self.scale = scale
+        self.fixed = fixed or {}
+
+    def delay_for(self, service, method, recorded_elapsed):
+        key = f"{service}.{method}"
+        if key in self.fixed:
+            return self.fixed[key]
+        if service in self.fixed:
+            return self.fixed[service]
+        return (recorded_elapsed or 0) * self.scale
+
+
+class ReplayService:
+    """Stand-in that answers recorded methods from calls.jsonl in FIFO order (last answer repeats)."""
+    def __init__(self, service_name, calls, latency, timings):
+        self._service_name = service_name
+        self._calls = {}
+        for call in calls:
+            self._calls.setdefault(call['method'], []).append(call)
+        self._cursor = {}
+        self._latency = latency
+        self._timings = timings
+        self.last_error = None
+
+    def _next_call(self, method):
+        recorded = self._calls.get(method)
+        if not recorded:
+            raise AttributeError(f"No recorded calls for {self._service_name}.{method}")
+        idx = self._cursor.get(method, 0)
+        self._cursor[method] = idx + 1
+        return recorded[min(idx, len(recorded) - 1)]
+
+    def _answer(self, method):
+        start = time.perf_counter()
+        call = self._next_call(method)
+        time.sleep(self._latency.delay_for(self._service_name, method, call.get('elapsed')))
+        self._timings.append((f"{self._service_name}.{method}", time.perf_counter() - start))
+        if call.get('error'):
+            self.last_error = call['error']
+            raise Exception(call['error'])
+        return call.get('result')
+
+    def __getattr__(self, name):
+        if name.startswith('_'):
+            raise AttributeError(name)
+        return lambda *args, **kwargs: self._answer(name)
+
+
+class ReplayImageService(ImageService):
+    """Real ImageService (stitching, barcode decode) whose LINE download reads fixture bytes."""
+    def __init__(self, job_dir, calls, latency, timings):
+        super().__init__()
+        self._job_dir = job_dir
+        self._replay = ReplayService('image_service', calls, latency, timings)
+        self._timings = timings
+
+    def download_image(self, message_id, headers):
+        image_name = self._replay._answer('download_image')
+        file_path = os.path.join(self.temp_dir, f"replay_{message_id}_{time.time_ns()}.jpg")
+        shutil.copy2(os.path.join(self._job_dir, 'images', image_name), file_path)
+        return file_path
+
+    def stitch_images(self, image_path1, image_path2, output_path):
+        start = time.perf_counter()
+        try:
+            return super().stitch_images(image_path1, image_path2, output_path)
+        finally:
+            self._timings.append(('image_service.stitch_images', time.perf_counter() - start))
+
+    def decode_barcodes(self, image_paths):
+        start = time.perf_counter()
+        try:
+            return super().decode_barcodes(image_paths)
+        finally:
+            self._timings.append(('image_service.decode_barcodes', time.perf_counter() - start))
+
+
+class ReplayProvider:
+    """ServiceProvider look-alike backed by one recorded job fixture."""
+    def __init__(self, job, latency, timings, config):
+        calls = job['calls']
+        by_service = {}
+        for call in calls:
+            by_service.setdefault(call['service'], []).append(call)
+        self.config = config
+        self.image_service = ReplayImageService(job['dir'], by_service.get('image_service', []), latency, timings)
+        self.ai_service = ReplayService('ai_service', by_service.get('ai_service', []), latency, timings)
+        self.sheet_service = ReplayService('sheet_service', by_service.get('sheet_service', []), latency, timings)
+        self.drive_service = ReplayService('drive_service', by_service.get('drive_service', []), latency, timings)
+
+
+class ReplayMessagingApi:
+    """Captures LINE replies/pushes instead of sending them."""
+    def __init__(self, latency, timings):
+        self._latency = latency
+        self._timings = timings
+        self.sent = []
+
+    def _send(self, kind, request):
+        start = time.perf_counter()
+        time.sleep(self._latency.delay_for('messaging_api', kind, 0))
+        self.sent.append((kind, [getattr(m, 'text', '') for m in request.messages]))
+        self._timings.append((f"messaging_api.{kind}", time.perf_counter() - start))
+
+    def reply_message(self, request):
+        self._send('reply_message', request)
+
+    def push_message(self, request):
+        self._send('push_message', request)
+
+
+def load_fixture_session(session_dir):
+    """Returns jobs [{'dir', 'calls', 'image_ids', 'user_id'}] that contain image downloads."""
+    # message_id -> user_id from the recorded webhooks (if any)
+    owners = {}
+    webhooks_path = os.path.join(session_dir, 'webhooks.jsonl')
+    if os.path.exists(webhooks_path):
+        with open(webhooks_path, 'r', encoding='utf-8') as f:
+            for line in f:
+                try:
+                    body = json.loads(json.loads(line)['body'])
+                except Exception:
+                    continue
+                for event in body.get('events', []):
+                    message = event.get('message') or {}
+                    if message.get('type') == 'image':
+                        owners[str(message.get('id'))] = (event.get('source') or {}).get('userId')
+
+    jobs = []
+    for name in sorted(os.listdir(session_dir)):
+        job_dir = os.path.join(session_dir, name)
+        calls_path = os.path.join(job_dir, 'calls.jsonl')
+        if not name.startswith('job_') or not os.path.exists(calls_path):
+            continue
+        with open(calls_path, 'r', encoding='utf-8') as f:
+            calls = [json.loads(line) for line in f if line.strip()]
+        image_ids = [str(c['args'][0]) for c in calls if c['method'] == 'download_image' and c['args']]
+        if not image_ids:
+            continue
+        jobs.append({
+            'dir': job_dir,
+            'calls': calls,
+            'image_ids': image_ids,
+            'user_id': owners.get(image_ids[0]) or f"Ureplay{len(jobs):04d}"
+        })
+    return jobs
@@ -0,0 +1,231 @@
+import heapq
+import re
+import threading
+import time
+import unicodedata
+from array import array
+
+from .order_columns import rows_to_records
+
+SEARCH_FIELDS = ('Name', 'Order ID', 'Tracking', 'Item', 'Shop')
+# Extra columns returned with each hit (enough to render a result row without another fetch)
+RESULT_FIELDS = ('Run No', 'Name', 'Order ID', 'Tracking', 'Item', 'Shop', 'Price', 'Status', 'Date')
+NGRAM = 3
+FIELD_SEP = '\x01'
+
+# Thai has no word spaces and users type names with or without them: drop all whitespace/zero-width
+_SPACE_RE = re.compile(r'[\s\u200b\u200c\u200d\ufeff]+')
+
+def normalize_search_text(text):
+    """NFKC (unifies ำ / ํา and full-width digits), lowercase, no whitespace."""
+    if text is None:
+        return ''
+    return _SPACE_RE.sub('', unicodedata.normalize('NFKC', str(text))).lower()
+
+def ngrams(text, n=NGRAM):
+    return {text[i:i + n] for i in range(len(text) - n + 1)}
+
+
+class _Doc:
+    __slots__ = ('sheet', 'row', 'text', 'fields', 'record')
+
+    def __init__(self, sheet, row, fields, record):
+        self.sheet = sheet
+        self.row = row
+        self.fields = fields  # normalized SEARCH_FIELDS values
+        self.text = FIELD_SEP.join(fields)
+        self.record = record
+
+
+class SearchIndex:
+    """
+    Character trigram index over Name / Order ID / Tracking / Item / Shop of every indexed sheet.
+    - Thai-friendly: works on characters, not words, so any 3+ character fragment is found.
+    - Postings are int arrays of doc ids; a changed row gets a new doc id and the old one is
+      tombstoned, compacted once tombstones outnumber live docs.
+    - update_sheet() diffs against the indexed rows, so re-feeding a snapshot is cheap.
+    """
+    def __init__(self):
+        self._lock = threading.RLock()
+        self._docs = []       # doc_id -> _Doc or None (tombstone)
+        self._postings = {}   # trigram -> array('i') of doc ids
+        self._rows = {}       # (sheet, row) -> doc_id
+        self._sheets = {}     # sheet -> {'updated': ts, 'rows': n, 'source': last records list}
+        self._dead = 0
+
+    # ─── Updates ────────────────────────────────────────────────────────────────
+
+    def update_sheet(self, sheet, records):
+        """
+        Indexes a sheet snapshot (records keyed by canonical column, row 2 = records[0]).
+        Only rows whose searchable text changed are re-indexed. Returns the number re-indexed.
+        """
+        with self._lock:
+            info = self._sheets.get(sheet)
+            if info is not None and info['source'] is records:
+                return 0  # Same snapshot object as last time
+            changed = 0
+            for i, record in enumerate(records):
+                if self._upsert_locked(sheet, i + 2, record):
+                    changed += 1
+            old_rows = info['rows'] if info else 0
+            for row in range(len(records) + 2, old_rows + 2):
+                self._remove_locked(sheet, row)
+            self._sheets[sheet] = {'updated': time.time(), 'rows': len(records), 'source': records}
+            self._maybe_compact_locked()
+            return changed
+
+    def update_sheet_rows(self, sheet, rows):
+        """Same as update_sheet for raw get_all_values() rows (header first)."""
+        return self.update_sheet(sheet, rows_to_records(rows))
+
+    def upsert_row(self, sheet, row, record):
+        with self._lock:
+            changed = self._upsert_locked(sheet, row, record)
+            info = self._sheets.setdefault(sheet, {'updated': 0, 'rows': 0, 'source': None})
+            info['rows'] = max(info['rows'], row - 1)
+            info['source'] = None
+            return changed
+
+    def remove_sheet(self, sheet):
+        with self._lock:
+            info = self._sheets.pop(sheet, None)
+            for row in range(2, (info['rows'] if info else 0) + 2):
+                self._remove_locked(sheet, row)
+
+    def _upsert_locked(self, sheet, row, record):
+        fields = tuple(normalize_search_text(record.get(f)) for f in SEARCH_FIELDS)
+        key = (sheet, row)
+        doc_id = self._rows.get(key)
+        if doc_id is not None:
+            doc = self._docs[doc_id]
+            if doc.fields == fields:
+                doc.record = self._result_record(record)  # e.g. Status changed: no re-index needed
+                return False
+            self._tombstone_locked(doc_id)
+
+        if not any(fields):
+            self._rows.pop(key, None)
+            return True
+
+        self._add_doc_locked(_Doc(sheet, row, fields, self._result_record(record)))
+        return True
+
+    def _add_doc_locked(self, doc):
+        doc_id = len(self._docs)
+        self._docs.append(doc)
+        self._rows[(doc.sheet, doc.row)] = doc_id
+        grams = set()
+        for value in doc.fields:
+            grams |= ngrams(value)
+        for gram in grams:
+            posting = self._postings.get(gram)
+            if posting is None:
+                posting = self._postings[gram] = array('i')
+            posting.append(doc_id)
+
+    def _remove_locked(self, sheet, row):
+        doc_id = self._rows.pop((sheet, row), None)
+        if doc_id is not None:
+            self._tombstone_locked(doc_id)
+
+    def _tombstone_locked(self, doc_id):
+        if self._docs[doc_id] is not None:
+            self._docs[doc_id] = None
+            self._dead += 1
+
+    def _maybe_compact_locked(self):
+        live = len(self._rows)
+        if self._dead < 1000 or self._dead < live:
+            return
+        docs = [d for d in self._docs if d is not None]
+        self._docs, self._postings, self._rows, self._dead = [], {}, {}, 0
+        for doc in docs:
+            self._add_doc_locked(doc)
+
+    @staticmethod
+    def _result_record(record):
+        return {f: record.get(f, '') for f in RESULT_FIELDS}
+
+    # ─── Queries ────────────────────────────────────────────────────────────────
+
+    def search(self, query, limit=20, sheets=None):
+        """
+        Top `limit` hits: [{'sheet', 'row', 'score', **RESULT_FIELDS}], best first.
+        Score: exact field match > prefix > substring; Order ID / Tracking rank above free text;
+        ties go to the newest row.
+        """
+        q = normalize_search_text(query)
+        if not q:
+            return []
+        sheets = set(sheets) if sheets else None
+
+        with self._lock:
+            if len(q) >= NGRAM:
+                postings = []
+                for gram in ngrams(q):
+                    posting = self._postings.get(gram)
+                    if posting is None:
+                        return []
+                    postings.append(posting)
+                candidates = min(postings, key=len)  # Verified by substring below
+            else:
+                candidates = range(len(self._docs))
+
+            scored = []
+            for doc_id in candidates:
+                doc = self._docs[doc_id]
+                if doc is None or (sheets and doc.sheet not in sheets):
+                    continue
+                if q not in doc.text:
+                    continue
+                scored.append((self._score(doc.fields, q), doc.row, doc_id))
+
+            top = heapq.nlargest(limit, scored)
+            return [
+                dict(self._docs[doc_id].record, sheet=self._docs[doc_id].sheet, row=row, score=score)
+                for score, row, doc_id in top
+            ]
+
+    @staticmethod
+    def _score(fields, q):
+        best = 0
+        for i, value in enumerate(fields):
+            if not value or q not in value:
+                continue
+            if value == q:
+                score = 100
+            elif value.startswith(q):
+                score = 60
+            else:
+                score = 20
+            if SEARCH_FIELDS[i] in ('Order ID', 'Tracking'):
+                score += 5
+            best = max(best, score)
+        return best
+
+    def sheet_info(self):
+        with self._lock:
+            return {name: {'rows': info['rows'], 'updated': info['updated']} for name, info in self._sheets.items()}
+
+    def stats(self):
+        with self._lock:
+            return {
+                'docs': len(self._rows),
+                'tombstones': self._dead,
+                'ngrams': len(self._postings),
+                'postings': sum(len(p) for p in self._postings.values()),
+                'sheets': len(self._sheets)
+            }
+
+
+_search_index_instance = None
+_search_index_lock = threading.Lock()
+
+def get_search_index():
+    global _search_index_instance
+    if _search_index_instance is None:
+        with _search_index_lock:
+            if _search_index_instance is None:
+                _search_index_instance = SearchIndex()
+    return _search_index_instance
@@ -0,0 +1,295 @@
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+
+from .event_log import get_event_log
+from .order_columns import canonical_column
+
+events = get_event_log()
+
+DEFAULT_REPLICA_PATH = "replica.db"
+REPLICA_TTL = 30   # A copy younger than this is served instead of reading the sheet (same window as SheetService's memory cache)
+# Indexed lookup columns: replica column -> canonical sheet column
+KEY_COLUMNS = {'order_id': 'Order ID', 'run_no': 'Run No', 'tracking': 'Tracking'}
+
+
+class ReplicaCopy:
+    """Raw rows of one worksheet as last stored (header first, like get_all_values())."""
+    __slots__ = ('rows', 'fetched_at')
+
+    def __init__(self, rows, fetched_at):
+        self.rows = rows
+        self.fetched_at = fetched_at
+
+    @property
+    def age(self):
+        return time.time() - self.fetched_at
+
+
+def _fingerprint(rows):
+    return hashlib.sha1(json.dumps(rows, ensure_ascii=False).encode('utf-8')).hexdigest()
+
+def _key_positions(header):
+    """{replica column: index in the row} for the key columns present in `header`."""
+    positions = {}
+    for i, h in enumerate(header):
+        canonical = canonical_column(str(h).strip())
+        for column, name in KEY_COLUMNS.items():
+            if canonical == name and column not in positions:
+                positions[column] = i
+    return positions
+
+def _keys(cells, positions):
+    return tuple(
+        str(cells[positions[c]]).strip() if c in positions and positions[c] < len(cells) else ''
+        for c in KEY_COLUMNS
+    )
+
+
+class SheetReplica:
+    """
+    Local SQLite mirror of the worksheets SheetService reads, shared by every worker on the host.
+    - store() is incremental: an unchanged sheet only gets its fetched_at bumped, otherwise only
+      rows whose cells changed are rewritten (and rows past the new end deleted).
+    - Order ID / Run No / Tracking are extracted into indexed columns, so find() is one index lookup.
+    - Writes made through SheetService are applied with put_row()/put_cell(), or the copy is
+      marked stale when the written row is unknown.
+    Path: SHEET_REPLICA_PATH env (default replica.db). Freshness: SHEET_REPLICA_TTL (seconds).
+    """
+    def __init__(self, db_path=None):
+        self.db_path = db_path or os.getenv('SHEET_REPLICA_PATH', DEFAULT_REPLICA_PATH)
+        directory = os.path.dirname(self.db_path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self.ttl = float(os.getenv('SHEET_REPLICA_TTL', REPLICA_TTL))
+        self._local = threading.local()
+        self._conn().executescript("""
+            CREATE TABLE IF NOT EXISTS worksheets (
+                sheet_id TEXT NOT NULL,
+                title TEXT NOT NULL,
+                fingerprint TEXT NOT NULL,
+                header TEXT NOT NULL,
+                rows INTEGER NOT NULL,
+                image_links TEXT,
+                fetched_at REAL NOT NULL,
+                PRIMARY KEY (sheet_id, title)
+            );
+            CREATE TABLE IF NOT EXISTS sheet_rows (
+                sheet_id TEXT NOT NULL,
+                title TEXT NOT NULL,
+                row INTEGER NOT NULL,
+                order_id TEXT,
+                run_no TEXT,
+                tracking TEXT,
+                cells TEXT NOT NULL,
+                PRIMARY KEY (sheet_id, title, row)
+            );
+            CREATE INDEX IF NOT EXISTS idx_sheet_rows_order_id ON sheet_rows (sheet_id, title, order_id, row);
+            CREATE INDEX IF NOT EXISTS idx_sheet_rows_run_no ON sheet_rows (sheet_id, title, run_no, row);
+            CREATE INDEX IF NOT EXISTS idx_sheet_rows_tracking ON sheet_rows (sheet_id, title, tracking, row);
+        """)
+
+    def _conn(self):
+        # One connection per thread (same pattern as JobQueue)
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.db_path, timeout=30, isolation_level=None)
+            conn.row_factory = sqlite3.Row
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    def _worksheet(self, sheet_id, title):
+        return self._conn().execute(
+            # image_links is left out: it is large and only load_image_links() needs it
+            "SELECT fingerprint, header, rows, fetched_at FROM worksheets WHERE sheet_id = ? AND title = ?",
+            (sheet_id, title)
+        ).fetchone()
+
+    def is_fresh(self, sheet_id, title, max_age=None):
+        ws = self._worksheet(sheet_id, title)
+        max_age = self.ttl if max_age is None else max_age
+        return ws is not None and time.time() - ws['fetched_at'] < max_age
+
+    # ─── Write side ─────────────────────────────────────────────────────────────
+
+    def store(self, sheet_id, title, rows):
+        """Stores a full get_all_values() read. Returns the number of rows rewritten."""
+        rows = rows or []
+        fingerprint = _fingerprint(rows)
+        header = rows[0] if rows else []
+        positions = _key_positions(header)
+        conn = self._conn()
+        now = time.time()
+
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            ws = self._worksheet(sheet_id, title)
+            if ws is not None and ws['fingerprint'] == fingerprint:
+                conn.execute("UPDATE worksheets SET fetched_at = ? WHERE sheet_id = ? AND title = ?", (now, sheet_id, title))
+                conn.execute("COMMIT")
+                return 0
+
+            # Header change re-keys every row; otherwise only changed rows are rewritten
+            same_header = ws is not None and json.loads(ws['header']) == header
+            stored = {}
+            if same_header:
+                stored = {
+                    r['row']: r['cells'] for r in conn.execute(
+                        "SELECT row, cells FROM sheet_rows WHERE sheet_id = ? AND title = ?", (sheet_id, title)
+                    )
+                }
+            else:
+                conn.execute("DELETE FROM sheet_rows WHERE sheet_id = ? AND title = ?", (sheet_id, title))
+
+            changed = []
+            for i, cells in enumerate(rows):
+                encoded = json.dumps(cells, ensure_ascii=False)
+                if stored.get(i + 1) != encoded:
+                    changed.append((sheet_id, title, i + 1) + _keys(cells, positions) + (encoded,))
+            conn.executemany(
+                "INSERT OR REPLACE INTO sheet_rows (sheet_id, title, row, order_id, run_no, tracking, cells) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?)", changed
+            )
+            conn.execute("DELETE FROM sheet_rows WHERE sheet_id = ? AND title = ? AND row > ?", (sheet_id, title, len(rows)))
+            conn.execute(
+                "INSERT INTO worksheets (sheet_id, title, fingerprint, header, rows, fetched_at) VALUES (?, ?, ?, ?, ?, ?) "
+                "ON CONFLICT (sheet_id, title) DO UPDATE SET fingerprint = excluded.fingerprint, "
+                "header = excluded.header, rows = excluded.rows, fetched_at = excluded.fetched_at, image_links = NULL",
+                (sheet_id, title, fingerprint, json.dumps(header, ensure_ascii=False), len(rows), now)
+            )
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+        events.debug('sheet_replica_stored', sheet=title, rows=len(rows), changed=len(changed))
+        return len(changed)
+
+    def store_image_links(self, sheet_id, title, links):
+        """Column A formulas (SheetService.get_image_links), kept next to the rows they belong to."""
+        self._conn().execute(
+            "UPDATE worksheets SET image_links = ? WHERE sheet_id = ? AND title = ?",
+            (json.dumps(links, ensure_ascii=False), sheet_id, title)
+        )
+
+    def put_row(self, sheet_id, title, row_idx, cells, writes_links=True):
+        """
+        Applies a row written to the sheet (1-indexed). The copy stays fresh; its fingerprint does not.
+        A write covering column A (writes_links) changes the image formula, so the stored
+        image_links are dropped and re-read from the sheet on the next load.
+        """
+        ws = self._worksheet(sheet_id, title)
+        if ws is None:
+            return
+        positions = _key_positions(json.loads(ws['header']))
+        conn = self._conn()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            existing = conn.execute(
+                "SELECT cells FROM sheet_rows WHERE sheet_id = ? AND title = ? AND row = ?", (sheet_id, title, row_idx)
+            ).fetchone()
+            merged = list(cells)
+            if existing is not None:
+                # Keep columns past the written range (the sheet has more than A-O)
+                old = json.loads(existing['cells'])
+                merged += old[len(merged):]
+            conn.execute(
+                "INSERT OR REPLACE INTO sheet_rows (sheet_id, title, row, order_id, run_no, tracking, cells) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (sheet_id, title, row_idx) + _keys(merged, positions) + (json.dumps(merged, ensure_ascii=False),)
+            )
+            conn.execute(
+                "UPDATE worksheets SET fingerprint = '', rows = MAX(rows, ?)"
+                + (", image_links = NULL" if writes_links else "")
+                + " WHERE sheet_id = ? AND title = ?",
+                (row_idx, sheet_id, title)
+            )
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+
+    def put_cell(self, sheet_id, title, row_idx, col, value):
+        """Applies a single cell write (1-indexed row and column)."""
+        row = self._conn().execute(
+            "SELECT cells FROM sheet_rows WHERE sheet_id = ? AND title = ? AND row = ?", (sheet_id, title, row_idx)
+        ).fetchone()
+        if row is None:
+            self.mark_stale(sheet_id, title)
+            return
+        cells = json.loads(row['cells'])
+        cells += [""] * (col - len(cells))
+        cells[col - 1] = value
+        self.put_row(sheet_id, title, row_idx, cells, writes_links=col == 1)
+
+    def mark_stale(self, sheet_id, title):
+        """The next reader fetches the sheet again (used when a write's row is unknown)."""
+        self._conn().execute("UPDATE worksheets SET fetched_at = 0 WHERE sheet_id = ? AND title = ?", (sheet_id, title))
+
+    # ─── Read side ──────────────────────────────────────────────────────────────
+
+    def load(self, sheet_id, title):
+        """ReplicaCopy of the stored rows (any age), or None if the sheet was never stored."""
+        ws = self._worksheet(sheet_id, title)
+        if ws is None:
+            return None
+        cursor = self._conn().execute(
+            "SELECT row, cells FROM sheet_rows WHERE sheet_id = ? AND title = ? ORDER BY row", (sheet_id, title)
+        )
+        rows = []
+        for r in cursor:
+            # Rows the sheet returned but that were never stored (gap after a put_row) come back empty
+            rows.extend([[]] * (r['row'] - 1 - len(rows)))
+            rows.append(json.loads(r['cells']))
+        return ReplicaCopy(rows, ws['fetched_at'])
+
+    def load_image_links(self, sheet_id, title):
+        row = self._conn().execute(
+            "SELECT image_links FROM worksheets WHERE sheet_id = ? AND title = ?", (sheet_id, title)
+        ).fetchone()
+        if row is None or row['image_links'] is None:
+            return None
+        return json.loads(row['image_links'])
+
+    def find(self, sheet_id, title, order_id=None, run_no=None, tracking=None):
+        """(row_index, cells) of the last row matching the given key, or (None, None)."""
+        column, value = next(
+            ((c, v) for c, v in (('order_id', order_id), ('run_no', run_no), ('tracking', tracking)) if v),
+            (None, None)
+        )
+        if column is None:
+            return None, None
+        row = self._conn().execute(
+            f"SELECT row, cells FROM sheet_rows WHERE sheet_id = ? AND title = ? AND {column} = ? AND row > 1 "
+            f"ORDER BY row DESC LIMIT 1",
+            (sheet_id, title, str(value).strip())
+        ).fetchone()
+        if row is None:
+            return None, None
+        return row['row'], json.loads(row['cells'])
+
+    def stats(self):
+        rows = self._conn().execute(
+            "SELECT sheet_id, title, rows, fetched_at FROM worksheets ORDER BY fetched_at DESC"
+        ).fetchall()
+        now = time.time()
+        return [
+            {'sheet_id': r['sheet_id'], 'title': r['title'], 'rows': r['rows'], 'age': round(now - r['fetched_at'], 1)}
+            for r in rows
+        ]
+
+
+_sheet_replica_instance = None
+_sheet_replica_lock = threading.Lock()
+
+def get_sheet_replica():
+    global _sheet_replica_instance
+    if _sheet_replica_instance is None:
+        with _sheet_replica_lock:
+            if _sheet_replica_instance is None:
+                _sheet_replica_instance = SheetReplica()
+    return _sheet_replica_instance
@@ -1,10 +1,30 @@
 import gspread
+import re
 import socket
 import time
 from functools import wraps
 
 import requests.packages.urllib3.util.connection as urllib3_cn
 
+from .auth_service import get_credential_manager
+from .event_log import get_event_log
+from .sheet_replica import get_sheet_replica
+from .write_journal import changed_segments, flush_interval, get_write_journal, journal_in_use
+
+events = get_event_log()
+
+def _displayed_row(row):
+    """A written row as get_all_values() reads it back: the HYPERLINK formula in A shows its label."""
+    cells = list(row)
+    match = re.match(r'=HYPERLINK\(".*",\s*"(.*)"\)$', str(cells[0])) if cells else None
+    if match:
+        cells[0] = match.group(1)
+    return cells
+
+def _displayed_segment(cells, col):
+    # Journal segment -> shown values (only column A holds a formula)
+    return _displayed_row(cells) if col == 1 else cells
+
 def retry_on_429(func):
     @wraps(func)
     def wrapper(*args, **kwargs):
@@ -18,7 +38,7 @@ def retry_on_429(func):
                 
                 if is_429 and i < 2:
                     wait = (i + 1) * 2
-                    print(f"DEBUG: Quota 429 hit in {func.__name__}. Retrying in {wait}s... (Attempt {i+1}/3)")
+                    events.warning('sheets_quota_429', func=func.__name__, wait=wait, attempt=i + 1)
                     time.sleep(wait)
                 else:
                     raise e
@@ -40,12 +60,99 @@ class SheetService:
         self.last_fetch_time = 0
         self.creds = credentials_source
         self.last_error = None
+        self.replica_max_age = None  # Local replica copy younger than this is read instead of the sheet (None = SHEET_REPLICA_TTL)
+        self.from_replica = False    # Current rows came from the replica, not a live read
+        self._clean_headers = []
 
     def _get_client(self):
         if self.client is None:
-            self.client = gspread.authorize(self.creds)
+            manager = get_credential_manager()
+            # Managed creds: reuse the process-wide client (one connection pool, no re-auth per request)
+            self.client = manager.gspread_client() if manager.owns(self.creds) else gspread.authorize(self.creds)
         return self.client
 
+    def _title(self):
+        return self._sheet.title if self._sheet is not None else self.sheet_name
+
+    def _replica(self, op, *args, **kwargs):
+        """Replica call for the current worksheet; a replica failure never breaks the sheet read/write."""
+        try:
+            return getattr(get_sheet_replica(), op)(self.sheet_id, self._title(), *args, **kwargs)
+        except Exception as e:
+            events.warning('sheet_replica_failed', op=op, sheet=self._title(), error=str(e))
+            return None
+
+    def _replica_lookup(self, order_id):
+        """(row_index, row) from a fresh replica copy without loading the sheet; None = cannot answer."""
+        if self.all_rows_raw is not None:
+            return None
+        if not self._replica('is_fresh', self.replica_max_age):
+            return None
+        return self._replica('find', order_id=str(order_id))
+
+    def _verified_replica_row(self, order_id, row_idx, cells):
+        """
+        The replica copy can be SHEET_REPLICA_TTL old and rows may have moved since (a row inserted
+        or deleted by hand): re-read the one Order ID cell before writing to `row_idx`. None = use find().
+        """
+        col = next((i + 1 for i, c in enumerate(cells or []) if str(c).strip() == order_id), None)
+        if col is not None:
+            try:
+                if str(self.sheet.cell(row_idx, col).value or '').strip() == order_id:
+                    return row_idx
+            except Exception as e:
+                events.warning('sheet_replica_verify_failed', row=row_idx, error=str(e))
+                return None
+            # Journaled but not flushed yet: the sheet cannot show it, the replica row is ours
+            if journal_in_use() and any(
+                order_id in (str(c).strip() for c in cells)
+                for _, _, _, cells in get_write_journal().pending(self.sheet_id, self._title())
+            ):
+                return row_idx
+        events.info('sheet_replica_row_moved', row=row_idx)
+        self._replica('mark_stale')
+        return None
+
+    def _write_behind(self):
+        """True if mutations go through the write-behind journal (WRITE_FLUSH_INTERVAL != 0)."""
+        if flush_interval() <= 0:
+            return False
+        try:
+            get_write_journal().start(self._get_client)
+            return True
+        except Exception as e:
+            events.warning('write_journal_unavailable', error=str(e))
+            return False
+
+    def _with_pending_writes(self, rows):
+        """A fresh read plus the journaled writes the sheet does not have yet (read-your-writes)."""
+        if not journal_in_use():
+            return rows
+        try:
+            return get_write_journal().overlay(self.sheet_id, self._title(), rows, display=_displayed_segment)
+        except Exception as e:
+            events.warning('write_journal_overlay_failed', sheet=self._title(), error=str(e))
+            return rows
+
+    def _apply_local(self, row_idx, cells):
+        """A journaled row goes into memory and the replica at once, as the sheet will show it."""
+        shown = _displayed_row(cells)
+        rows = self.all_rows_raw
+        if rows:
+            while len(rows) < row_idx:
+                rows.append([])
+            # Keep columns past the written range (the sheet has more than A-O)
+            shown += rows[row_idx - 1][len(shown):]
+            rows[row_idx - 1] = shown
+            record = dict(zip(self._clean_headers, shown + [""] * (len(self._clean_headers) - len(shown))))
+            while len(self.all_data_cache) < row_idx - 1:
+                self.all_data_cache.append(dict.fromkeys(self._clean_headers, ""))
+            self.all_data_cache[row_idx - 2] = record
+            order_id = str(record.get('Order ID') or record.get('order_id') or record.get('เลขออเดอร์') or "")
+            if order_id:
+                self.row_index_map[order_id] = row_idx
+        self._replica('put_row', row_idx, shown)
+
     @property
     def spreadsheet(self):
         if self._spreadsheet is None:
@@ -110,6 +217,7 @@ class SheetService:
             self.all_data_cache = None
             self.row_index_map = {}
             self.last_fetch_time = 0
+            self.from_replica = False
             
             print(f"DEBUG: Switched to Sheet: '{self._sheet.title}' and cleared cache")
             return True
@@ -126,57 +234,87 @@ class SheetService:
         if not force and self.all_rows_raw and (now - self.last_fetch_time < 30):
             return self.all_rows_raw
 
-        if not self.sheet: return []
+        # Cold instance (new request / restarted worker): a recent local replica copy needs no Sheets call
+        if not force and self.all_rows_raw is None:
+            copy = self._replica('load')
+            max_age = self.replica_max_age
+            if max_age is None:
+                max_age = get_sheet_replica().ttl
+            if copy is not None and copy.age < max_age:
+                events.debug('sheet_replica_hit', sheet=self._title(), rows=len(copy.rows), age=round(copy.age, 1))
+                return self._index_rows(copy.rows, copy.fetched_at, from_replica=True)
+
+        if not self.sheet:
+            return self._replica_fallback()
         
         try:
-            print(f"DEBUG: Fetching all values from Sheet '{self.sheet.title}' for optimization...")
-            rows = self.sheet.get_all_values()
-            if not rows:
-                self.all_rows_raw = []
-                self.all_data_cache = []
-                self.row_index_map = {}
-                return []
-
-            self.all_rows_raw = rows
-            self.last_fetch_time = now
-            
-            # Re-process cache and index map
-            headers = rows[0]
-            data_rows = rows[1:]
-            
-            clean_headers = []
-            header_counts = {}
-            for i, h in enumerate(headers):
-                h = str(h).strip()
-                if not h: h = f"unnamed_{i}"
-                if h in header_counts:
-                    header_counts[h] += 1
-                    clean_headers.append(f"{h}_{header_counts[h]}")
-                else:
-                    header_counts[h] = 0
-                    clean_headers.append(h)
-            
-            records = []
+            events.debug('sheet_fetch_all', sheet=self.sheet.title)
+            rows = self._with_pending_writes(self.sheet.get_all_values())
+            self._replica('store', rows)
+            return self._index_rows(rows, now)
+        except Exception as e:
+            events.error('sheet_load_failed', error=str(e))
+            return self._replica_fallback()
+
+    def _replica_fallback(self):
+        """Sheet unreachable: keep what is in memory, else serve the replica copy of any age."""
+        if self.all_rows_raw is None:
+            copy = self._replica('load')
+            if copy is not None:
+                events.warning('sheet_replica_fallback', sheet=self._title(), age=round(copy.age, 1))
+                return self._index_rows(copy.rows, copy.fetched_at, from_replica=True)
+        return self.all_rows_raw or []
+
+    def _index_rows(self, rows, fetched_at, from_replica=False):
+        """Raw rows -> records cache and Order ID -> row map."""
+        self.from_replica = from_replica
+        if not rows:
+            self.all_rows_raw = []
+            self.all_data_cache = []
             self.row_index_map = {}
-            for i, row in enumerate(data_rows):
-                row_extended = row + [""] * (len(clean_headers) - len(row))
-                record = dict(zip(clean_headers, row_extended))
-                records.append(record)
-                
-                # Column L (Order ID) is index 11
-                order_id = str(record.get('Order ID') or record.get('order_id') or record.get('เลขออเดอร์') or "")
-                if order_id:
-                    self.row_index_map[order_id] = i + 2
+            return []
+
+        self.all_rows_raw = rows
+        self.last_fetch_time = fetched_at
+        
+        # Re-process cache and index map
+        headers = rows[0]
+        data_rows = rows[1:]
+        
+        clean_headers = []
+        header_counts = {}
+        for i, h in enumerate(headers):
+            h = str(h).strip()
+            if not h: h = f"unnamed_{i}"
+            if h in header_counts:
+                header_counts[h] += 1
+                clean_headers.append(f"{h}_{header_counts[h]}")
+            else:
+                header_counts[h] = 0
+                clean_headers.append(h)
+        
+        records = []
+        self.row_index_map = {}
+        for i, row in enumerate(data_rows):
+            row_extended = row + [""] * (len(clean_headers) - len(row))
+            record = dict(zip(clean_headers, row_extended))
+            records.append(record)
             
-            self.all_data_cache = records
-            return self.all_rows_raw
-        except Exception as e:
-            print(f"Error in _ensure_data_loaded: {e}")
-            return self.all_rows_raw or []
+            # Column L (Order ID) is index 11
+            order_id = str(record.get('Order ID') or record.get('order_id') or record.get('เลขออเดอร์') or "")
+            if order_id:
+                self.row_index_map[order_id] = i + 2
+        
+        self.all_data_cache = records
+        self._clean_headers = clean_headers
+        return self.all_rows_raw
 
     def check_duplicate(self, order_id):
         """Checks if order_id already exists using local map."""
         if not order_id: return False
+        found = self._replica_lookup(order_id)
+        if found is not None:
+            return found[0] is not None
         self._ensure_data_loaded()
         return str(order_id) in self.row_index_map
 
@@ -187,12 +325,19 @@ class SheetService:
 
     def get_image_links(self):
         """Fetches Column A formulas to extract real links."""
+        if self.from_replica:
+            # Rows came from the replica: take the formulas stored with them
+            links = self._replica('load_image_links')
+            if links is not None:
+                return links
         if not self.sheet: return []
         try:
             # Fetch Column A (Index 1) as formulas
-            return self.sheet.col_values(1, value_render_option='FORMULA')
+            links = self.sheet.col_values(1, value_render_option='FORMULA')
+            self._replica('store_image_links', links)
+            return links
         except Exception as e:
-            print(f"Error fetching image links: {e}")
+            events.error('sheet_image_links_failed', error=str(e))
             return []
 
     def get_next_run_no(self):
@@ -277,6 +422,20 @@ class SheetService:
                 target_row_idx = i + 1
                 break
 
+        if self._write_behind():
+            # Journaled: only changed cells are sent, batched with other writes by the flusher
+            journal = get_write_journal()
+            if target_row_idx:
+                for col, cells in changed_segments(all_rows[target_row_idx - 1], row):
+                    journal.record_cells(self.sheet_id, self._title(), target_row_idx, col, cells)
+            else:
+                journal.record_append(self.sheet_id, self._title(), row)
+                # Expected row; if someone else appends first, the next read corrects the local copy
+                target_row_idx = max(len(all_rows), 1) + 1
+            self._apply_local(target_row_idx, row)
+            events.info('sheet_row_written', row=target_row_idx, mode='journal')
+            return True
+
         # IMPORTANT: Use value_input_option='USER_ENTERED' to parse formulas
         try:
             if target_row_idx:
@@ -289,15 +448,23 @@ class SheetService:
                     trimmed_row += [""] * (15 - len(trimmed_row))
                 
                 self.sheet.update(range_name=range_label, values=[trimmed_row], value_input_option='USER_ENTERED')
-                print(f"DEBUG: Data updated in gap at row {target_row_idx}")
+                events.info('sheet_row_written', row=target_row_idx, mode='gap')
+                self._replica('put_row', target_row_idx, _displayed_row(trimmed_row))
             else:
                 # Append to bottom if no gap found
                 result = self.sheet.append_row(row, value_input_option='USER_ENTERED')
-                print(f"DEBUG: Data appended to bottom: {result}")
+                updated_range = (result or {}).get('updates', {}).get('updatedRange')
+                events.info('sheet_row_written', mode='append', updated_range=updated_range)
+                # "Sheet1!A124:O124" -> row 124; unknown row -> next reader re-fetches
+                match = re.search(r'![A-Z]+(\d+)', str(updated_range or ''))
+                if match:
+                    self._replica('put_row', int(match.group(1)), _displayed_row(row))
+                else:
+                    self._replica('mark_stale')
             return True
         except Exception as e:
             self.last_error = str(e)
-            print(f"Error saving data to sheet: {e}")
+            events.error('sheet_append_failed', error=str(e))
             return False
 
     def find_row_by_order_id(self, order_id):
@@ -305,7 +472,11 @@ class SheetService:
         Returns (row_index, current_row_data) for a given order_id.
         row_index is 1-indexed for gspread.
         """
-        if not self.sheet or not order_id: return None, None
+        if not order_id: return None, None
+        found = self._replica_lookup(order_id)
+        if found is not None:
+            return found
+        if not self.sheet: return None, None
         
         order_id_str = str(order_id)
         # Ensure cache is populated
@@ -341,9 +512,11 @@ class SheetService:
 
         try:
             # If no existing_row_data provided, fetch it from cache
+            existing_known = existing_row_data is not None
             if existing_row_data is None:
                 if self.all_rows_raw and row_idx - 1 < len(self.all_rows_raw):
                     existing_row_data = self.all_rows_raw[row_idx - 1]
+                    existing_known = True
                 else:
                     existing_row_data = [""] * 15
 
@@ -381,14 +554,25 @@ class SheetService:
             # O: Reset Status to Pending for re-verification
             row[14] = "Pending"
 
+            if self._write_behind():
+                # Only the cells that differ from the current row; the whole row if it is unknown
+                segments = changed_segments(existing_row_data, row) if existing_known else [(1, row)]
+                for col, cells in segments:
+                    get_write_journal().record_cells(self.sheet_id, self._title(), row_idx, col, cells)
+                self._apply_local(row_idx, row)
+                events.info('sheet_row_written', row=row_idx, mode='journal', cells=sum(len(c) for _, c in segments),
+                            order_id=data_dict.get('order_id'))
+                return True
+
             # Update Range A-O
             range_label = f"A{row_idx}:O{row_idx}"
             self.sheet.update(range_name=range_label, values=[row], value_input_option='USER_ENTERED')
-            print(f"DEBUG: Successfully updated row {row_idx} for order {data_dict.get('order_id')}")
+            events.info('sheet_row_written', row=row_idx, mode='update', order_id=data_dict.get('order_id'))
+            self._replica('put_row', row_idx, _displayed_row(row))
             return True
         except Exception as e:
             self.last_error = str(e)
-            print(f"Error updating existing data: {e}")
+            events.error('sheet_update_failed', error=str(e))
             return False
 
     @retry_on_429
@@ -399,9 +583,17 @@ class SheetService:
             order_id_str = str(order_id)
             row_idx = self.row_index_map.get(order_id_str)
             
+            # Indexed lookup in a fresh replica copy before searching the whole sheet
+            if not row_idx:
+                found_row, cells = self._replica_lookup(order_id_str) or (None, None)
+                if found_row:
+                    row_idx = self._verified_replica_row(order_id_str, found_row, cells)
+                if row_idx:
+                    self.row_index_map[order_id_str] = row_idx
+
             # Fallback to search if map is empty/missing (e.g. newly appended)
             if not row_idx:
-                print(f"DEBUG: Row map miss for {order_id}, searching...")
+                events.debug('sheet_row_map_miss', order_id=order_id_str)
                 cell = self.sheet.find(order_id_str)
                 if not cell: return False
                 row_idx = cell.row
@@ -410,7 +602,7 @@ class SheetService:
 
             # Find/Cache Status Column
             if not self.status_col:
-                headers = self.sheet.row_values(1)
+                headers = self.all_rows_raw[0] if self.all_rows_raw else self.sheet.row_values(1)
                 if "Status" in headers:
                     self.status_col = headers.index("Status") + 1
                 elif "สถานะ" in headers:
@@ -418,9 +610,21 @@ class SheetService:
                 else:
                     return False
             
+            if self._write_behind():
+                get_write_journal().record_cells(self.sheet_id, self._title(), row_idx, self.status_col, [status])
+                if self.all_rows_raw and row_idx - 1 < len(self.all_rows_raw):
+                    cells = list(self.all_rows_raw[row_idx - 1])
+                    cells += [""] * (self.status_col - len(cells))
+                    cells[self.status_col - 1] = status
+                    self._apply_local(row_idx, cells)
+                else:
+                    self._replica('put_cell', row_idx, self.status_col, status)
+                return True
+
             # Update (Single API Call)
             self.sheet.update_cell(row_idx, self.status_col, status)
+            self._replica('put_cell', row_idx, self.status_col, status)
             return True
         except Exception as e:
-            print(f"Error updating status: {e}")
+            events.error('sheet_status_update_failed', order_id=order_id, error=str(e))
             return False
@@ -0,0 +1,245 @@
+import difflib
+import re
+import threading
+import time
+import unicodedata
+
+from .event_log import get_event_log
+
+events = get_event_log()
+
+# Thai combining vowels / tone marks ที่ OCR มักอ่านพลาด (ไม้เอก, ไม้โท, สระบน/ล่าง ฯลฯ)
+_THAI_MARKS = re.compile(r'[\u0E31\u0E34-\u0E3A\u0E47-\u0E4E]')
+# ช่องว่าง, ขีด, underscore, จุด และเครื่องหมายอื่นๆ ที่ไม่มีผลกับชื่อร้าน
+_SEPARATORS = re.compile(r'[\s_\-\.\'"’&/()\[\]]+')
+
+
+def normalize_shop_text(text):
+    """Lowercase + NFC + remove separators so 'Blue Store', 'blue_store' and 'bluestore' compare equal."""
+    text = unicodedata.normalize('NFC', str(text)).lower().strip()
+    return _SEPARATORS.sub('', text)
+
+
+def fuzzy_shop_key(text):
+    """Looser key for fuzzy matching: also strips Thai tone marks and upper/lower vowels."""
+    return _THAI_MARKS.sub('', normalize_shop_text(text))
+
+
+class ShopMatcher:
+    """
+    Compiled shop-name matcher (Aho-Corasick automaton over normalized keywords).
+    - Exact pass: scans the raw name once and picks the LONGEST keyword hit,
+      ties broken by mapping order, so 'istudio by copperwired' beats 'copperwired'
+      and 'true 5g' beats 'true'.
+    - Fuzzy pass: if nothing hits, compares the tone-stripped name against the standard
+      shop names with difflib and accepts the best ratio above `fuzzy_cutoff`. Keywords are
+      substring triggers (some generic, e.g. 'โทรศัพท์'), so they only take part in the exact pass.
+    """
+    MIN_FUZZY_LEN = 4
+    MEMO_SIZE = 4096
+
+    def __init__(self, mapping, fuzzy_cutoff=0.82):
+        self.fuzzy_cutoff = fuzzy_cutoff
+        self.mapping = {}
+        # Automaton: goto[state] = {char: state}, fail[state], out[state] = (length, priority, standard_name)
+        self._goto = [{}]
+        self._fail = [0]
+        self._out = [None]
+        self._fuzzy_keys = {}  # fuzzy key of a standard name -> (priority, standard_name)
+        self._memo = {}  # raw name -> (standard_name, how); shop names repeat a lot
+
+        priority = 0
+        for standard_name, keywords in mapping.items():
+            standard_name = str(standard_name).strip()
+            if not standard_name:
+                continue
+            kws = [standard_name] + [str(k) for k in keywords]
+            self.mapping[standard_name] = kws
+            for kw in kws:
+                key = normalize_shop_text(kw)
+                if not key:
+                    continue
+                self._add_keyword(key, priority, standard_name)
+            fkey = fuzzy_shop_key(standard_name)
+            if len(fkey) >= self.MIN_FUZZY_LEN and fkey not in self._fuzzy_keys:
+                self._fuzzy_keys[fkey] = (priority, standard_name)
+            priority += 1
+
+        self._build_failure_links()
+
+    def _add_keyword(self, key, priority, standard_name):
+        state = 0
+        for ch in key:
+            nxt = self._goto[state].get(ch)
+            if nxt is None:
+                nxt = len(self._goto)
+                self._goto.append({})
+                self._fail.append(0)
+                self._out.append(None)
+                self._goto[state][ch] = nxt
+            state = nxt
+        candidate = (len(key), -priority, standard_name)
+        # Same keyword under two shops: keep the one declared first
+        if self._out[state] is None or candidate > self._out[state]:
+            self._out[state] = candidate
+
+    def _build_failure_links(self):
+        queue = list(self._goto[0].values())
+        head = 0
+        while head < len(queue):
+            state = queue[head]
+            head += 1
+            for ch, nxt in self._goto[state].items():
+                queue.append(nxt)
+                f = self._fail[state]
+                while f and ch not in self._goto[f]:
+                    f = self._fail[f]
+                target = self._goto[f].get(ch, 0)
+                self._fail[nxt] = target if target != nxt else 0
+                # Inherit the best (longest) output reachable through the failure link
+                inherited = self._out[self._fail[nxt]]
+                if inherited is not None and (self._out[nxt] is None or inherited > self._out[nxt]):
+                    self._out[nxt] = inherited
+
+    def find_exact(self, raw_name):
+        """Returns the standard name of the longest keyword found in raw_name, or None."""
+        text = normalize_shop_text(raw_name)
+        goto, fail, out = self._goto, self._fail, self._out
+        state = 0
+        best = None
+        for ch in text:
+            while state and ch not in goto[state]:
+                state = fail[state]
+            state = goto[state].get(ch, 0)
+            hit = out[state]
+            if hit is not None and (best is None or hit > best):
+                best = hit
+        return best[2] if best else None
+
+    def find_fuzzy(self, raw_name):
+        """Best fuzzy match on tone-stripped keys, or None if below cutoff."""
+        key = fuzzy_shop_key(raw_name)
+        if len(key) < self.MIN_FUZZY_LEN:
+            return None
+        best = None
+        matcher = difflib.SequenceMatcher(autojunk=False)
+        matcher.set_seq2(key)
+        for fkey, (priority, standard_name) in self._fuzzy_keys.items():
+            matcher.set_seq1(fkey)
+            if matcher.real_quick_ratio() < self.fuzzy_cutoff or matcher.quick_ratio() < self.fuzzy_cutoff:
+                continue
+            ratio = matcher.ratio()
+            if ratio >= self.fuzzy_cutoff and (best is None or (ratio, -priority) > best[:2]):
+                best = (ratio, -priority, standard_name)
+        return best[2] if best else None
+
+    def match(self, raw_name):
+        """Returns (standard_name, how) where how is 'exact', 'fuzzy' or None."""
+        if not raw_name:
+            return None, None
+        cached = self._memo.get(raw_name)
+        if cached is not None:
+            return cached
+
+        result = (None, None)
+        name = self.find_exact(raw_name)
+        if name:
+            result = (name, 'exact')
+        else:
+            name = self.find_fuzzy(raw_name)
+            if name:
+                result = (name, 'fuzzy')
+
+        if len(self._memo) >= self.MEMO_SIZE:
+            self._memo.clear()
+        self._memo[raw_name] = result
+        return result
+
+    # ─── Google Sheets Reload ────────────────────────────────────────────────────
+    SHOP_SHEET_NAME = "_GravityShops"
+
+    @staticmethod
+    def rows_to_mapping(rows):
+        """
+        แปลง rows จาก worksheet _GravityShops เป็น mapping
+        Layout: A = ชื่อร้านมาตรฐาน, B = keywords คั่นด้วย comma (แถวแรกเป็น header)
+        """
+        mapping = {}
+        for row in rows[1:]:
+            if not row or not str(row[0]).strip():
+                continue
+            standard_name = str(row[0]).strip()
+            keywords = []
+            if len(row) >= 2:
+                keywords = [k.strip() for k in str(row[1]).split(',') if k.strip()]
+            mapping.setdefault(standard_name, [])
+            mapping[standard_name].extend(keywords)
+        return mapping
+
+
+class ShopMatcherRegistry:
+    """
+    Holds the process-wide compiled matcher. Built lazily from the built-in mapping,
+    and optionally extended from the _GravityShops worksheet (throttled by `reload_interval`).
+    """
+    def __init__(self, base_mapping, reload_interval=300):
+        self.base_mapping = base_mapping
+        self.reload_interval = reload_interval
+        self._matcher = None
+        self._lock = threading.Lock()
+        self._last_reload = 0
+        self._sheet_mapping = {}
+        self._fingerprint = None  # Sheet mapping the current matcher was built from
+
+    @property
+    def matcher(self):
+        if self._matcher is None:
+            with self._lock:
+                if self._matcher is None:
+                    self._matcher = ShopMatcher(self._merged_mapping())
+        return self._matcher
+
+    def _merged_mapping(self):
+        # Sheet rows come first so staff-defined shops win ties against built-ins
+        merged = {}
+        for standard_name, keywords in self._sheet_mapping.items():
+            merged[standard_name] = list(keywords)
+        for standard_name, keywords in self.base_mapping.items():
+            merged.setdefault(standard_name, [])
+            merged[standard_name].extend(keywords)
+        return merged
+
+    def load_rows(self, rows):
+        """
+        Rebuilds the matcher from _GravityShops rows (swaps atomically). Returns True if it was rebuilt:
+        unchanged rows keep the current matcher and its memo.
+        """
+        sheet_mapping = ShopMatcher.rows_to_mapping(rows or [])
+        fingerprint = tuple((name, tuple(keywords)) for name, keywords in sheet_mapping.items())
+        with self._lock:
+            if self._matcher is not None and fingerprint == self._fingerprint:
+                return False
+            self._sheet_mapping = sheet_mapping
+            self._fingerprint = fingerprint
+            self._matcher = ShopMatcher(self._merged_mapping())
+        return True
+
+    def sync_from_gsheets(self, gspread_client, sheet_id, force=False):
+        """โหลดรายชื่อร้านเพิ่มเติมจาก worksheet _GravityShops (ไม่ต้อง deploy ใหม่เมื่อมีร้านใหม่)"""
+        now = time.time()
+        if not force and (now - self._last_reload) < self.reload_interval:
+            return False
+        self._last_reload = now
+        try:
+            spreadsheet = gspread_client.open_by_key(sheet_id)
+            try:
+                ws = spreadsheet.worksheet(ShopMatcher.SHOP_SHEET_NAME)
+            except Exception:
+                events.debug('shop_sheet_missing', worksheet=ShopMatcher.SHOP_SHEET_NAME)
+                return False
+            rebuilt = self.load_rows(ws.get_all_values())
+            events.info('shop_matcher_reloaded', custom_shops=len(self._sheet_mapping), rebuilt=rebuilt)
+            return True
+        except Exception as e:
+            events.warning('shop_matcher_reload_failed', error=str(e))
+            return False
@@ -0,0 +1,208 @@
+import itertools
+import os
+import sys
+import threading
+import time
+from collections import OrderedDict
+
+from .event_log import get_event_log
+
+events = get_event_log()
+
+SNAPSHOT_TTL = 10        # Fresh: served without asking the sheet
+SNAPSHOT_MAX_STALE = 300 # Stale but younger than this: served at once, refreshed in the background
+EMPTY_TTL = 3            # An empty sheet (or a swallowed read error) is re-checked sooner, not on every request
+ERROR_BACKOFF = 15       # After a failed refresh, keep serving the old snapshot this long before retrying
+MEMORY_BUDGET_MB = 64    # Estimated size of all cached sheets; least recently used sheets are evicted beyond it
+PREFETCH_SHEETS = 2      # Recently used other sheets kept warm so switching back is instant (0 = off)
+SIZE_SAMPLE = 50         # Records measured to estimate a snapshot's size
+
+_versions = itertools.count(1)
+
+
+class Snapshot:
+    """One loaded sheet. `version` changes only when the records change (process-local: not an ETag)."""
+    __slots__ = ('sheet', 'records', 'version', 'size', 'fetched_at', 'expired', 'retry_at', 'last_error')
+
+    def __init__(self, sheet, records, version, size):
+        self.sheet = sheet
+        self.records = records
+        self.version = version
+        self.size = size        # Estimated bytes (estimate_records_size)
+        self.fetched_at = time.time()
+        self.expired = False    # invalidate(): next get() serves it once more and refreshes
+        self.retry_at = 0
+        self.last_error = None
+
+    @property
+    def age(self):
+        return time.time() - self.fetched_at
+
+
+def estimate_records_size(records):
+    """Rough in-memory size of a list of flat dict records, extrapolated from a sample."""
+    if not records:
+        return sys.getsizeof(records)
+    step = max(1, len(records) // SIZE_SAMPLE)
+    sample = records[::step][:SIZE_SAMPLE]
+    sampled = 0
+    for record in sample:
+        # Keys are shared between records (same header strings), values are not
+        sampled += sys.getsizeof(record) + sum(sys.getsizeof(v) for v in record.values())
+    return sys.getsizeof(records) + sampled * len(records) // len(sample)
+
+
+class _Flight:
+    def __init__(self):
+        self.done = threading.Event()
+        self.snapshot = None
+        self.error = None
+
+
+class SnapshotCache:
+    """
+    Per-sheet order snapshots with single-flight refresh and stale-while-revalidate.
+    - fresh (age < ttl): returned as is
+    - stale (age < max_stale) or invalidated: returned at once; one background refresh is started
+    - missing / older than max_stale: the caller waits, but only one load runs per sheet and
+      every concurrent caller gets its result (or its error)
+    - LRU over sheets: beyond memory_budget (estimated bytes) the least recently used sheets are
+      dropped; the `prefetch` most recent other sheets are refreshed in the background before
+      they pass max_stale, so switching back to them never waits for the sheet.
+    loader(sheet) -> records. on_change(snapshot) runs after a load that produced a new version.
+    Env: SNAPSHOT_MEMORY_MB, SNAPSHOT_PREFETCH.
+    """
+    def __init__(self, loader, ttl=SNAPSHOT_TTL, max_stale=SNAPSHOT_MAX_STALE, on_change=None,
+                 memory_budget=None, prefetch=None):
+        self._loader = loader
+        self.ttl = ttl
+        self.max_stale = max_stale
+        self._on_change = on_change
+        if memory_budget is None:
+            memory_budget = int(float(os.getenv('SNAPSHOT_MEMORY_MB', MEMORY_BUDGET_MB)) * 1024 * 1024)
+        self.memory_budget = memory_budget
+        self.prefetch = int(os.getenv('SNAPSHOT_PREFETCH', PREFETCH_SHEETS)) if prefetch is None else prefetch
+        self._lock = threading.Lock()
+        self._snapshots = OrderedDict()  # sheet -> Snapshot, least recently used first
+        self._flights = {}               # sheet -> _Flight in progress
+        self._evictions = 0
+
+    def get(self, sheet):
+        now = time.time()
+        with self._lock:
+            snapshot = self._snapshots.get(sheet)
+            if snapshot is not None:
+                self._snapshots.move_to_end(sheet)
+                self._prefetch_locked(sheet, now)
+                ttl = self.ttl if snapshot.records else min(self.ttl, EMPTY_TTL)
+                if not snapshot.expired and now - snapshot.fetched_at < ttl:
+                    return snapshot
+                if now - snapshot.fetched_at < self.max_stale or now < snapshot.retry_at:
+                    if now >= snapshot.retry_at:
+                        self._start_flight_locked(sheet, background=True)
+                    events.debug('snapshot_stale_served', sheet=sheet, age=round(now - snapshot.fetched_at, 1))
+                    return snapshot
+            flight, leader = self._start_flight_locked(sheet, background=False)
+
+        if leader:
+            self._run_flight(sheet, flight)
+        flight.done.wait()
+        if flight.error is not None:
+            raise flight.error
+        return flight.snapshot
+
+    def peek(self, sheet):
+        """Current snapshot of `sheet` (possibly stale) without loading anything, or None."""
+        return self._snapshots.get(sheet)
+
+    def put(self, sheet, records):
+        """Stores freshly loaded records; keeps the version if nothing changed."""
+        with self._lock:
+            previous = self._snapshots.get(sheet)
+            unchanged = previous is not None and previous.records == records
+        size = previous.size if unchanged else estimate_records_size(records)
+        with self._lock:
+            if unchanged:
+                snapshot = Snapshot(sheet, previous.records, previous.version, size)
+                changed = False
+            else:
+                snapshot = Snapshot(sheet, records, next(_versions), size)
+                changed = True
+            # A refresh keeps the sheet's LRU position; only get() counts as use
+            self._snapshots[sheet] = snapshot
+            self._evict_locked()
+        if changed and self._on_change:
+            try:
+                self._on_change(snapshot)
+            except Exception as e:
+                events.exception('snapshot_listener_failed', sheet=sheet, error=str(e))
+        return snapshot
+
+    def invalidate(self, sheet=None):
+        """Marks snapshots out of date; they are still served once while the refresh runs."""
+        with self._lock:
+            for name, snapshot in self._snapshots.items():
+                if sheet is None or name == sheet:
+                    snapshot.expired = True
+
+    def _evict_locked(self):
+        total = sum(s.size for s in self._snapshots.values())
+        # Never evict the most recent sheet, even if it alone exceeds the budget
+        while total > self.memory_budget and len(self._snapshots) > 1:
+            name, evicted = self._snapshots.popitem(last=False)
+            total -= evicted.size
+            self._evictions += 1
+            events.info('snapshot_evicted', sheet=name, size=evicted.size, total=total, budget=self.memory_budget)
+
+    def _prefetch_locked(self, sheet, now):
+        """Keeps the most recently used other sheets from going past max_stale."""
+        if self.prefetch <= 0:
+            return
+        recent = [name for name in reversed(self._snapshots) if name != sheet][:self.prefetch]
+        for name in recent:
+            other = self._snapshots[name]
+            if now - other.fetched_at > self.max_stale / 2 and now >= other.retry_at:
+                self._start_flight_locked(name, background=True)
+
+    def _start_flight_locked(self, sheet, background):
+        flight = self._flights.get(sheet)
+        if flight is not None:
+            return flight, False
+        flight = self._flights[sheet] = _Flight()
+        if background:
+            threading.Thread(target=self._run_flight, args=(sheet, flight), daemon=True).start()
+        return flight, True
+
+    def _run_flight(self, sheet, flight):
+        start = time.time()
+        try:
+            flight.snapshot = self.put(sheet, self._loader(sheet))
+            events.debug('snapshot_loaded', sheet=sheet, version=flight.snapshot.version,
+                         records=len(flight.snapshot.records), seconds=round(time.time() - start, 3))
+        except Exception as e:
+            flight.error = e
+            events.error('snapshot_load_failed', sheet=sheet, error=str(e))
+            with self._lock:
+                snapshot = self._snapshots.get(sheet)
+                if snapshot is not None:
+                    snapshot.retry_at = time.time() + ERROR_BACKOFF
+                    snapshot.last_error = str(e)
+        finally:
+            with self._lock:
+                self._flights.pop(sheet, None)
+            flight.done.set()
+
+    def stats(self):
+        with self._lock:
+            return {
+                'budget': self.memory_budget,
+                'size': sum(s.size for s in self._snapshots.values()),
+                'evictions': self._evictions,
+                'loading': list(self._flights),
+                # Least recently used first
+                'sheets': {
+                    name: {'version': s.version, 'records': len(s.records), 'size': s.size, 'age': round(s.age, 1),
+                           'expired': s.expired, 'last_error': s.last_error}
+                    for name, s in self._snapshots.items()
+                }
+            }
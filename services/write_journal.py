@@ -0,0 +1,357 @@
+import json
+import os
+import socket
+import sqlite3
+import threading
+import time
+
+from gspread.utils import absolute_range_name, rowcol_to_a1
+
+from .event_log import get_event_log
+
+events = get_event_log()
+
+DEFAULT_JOURNAL_PATH = "writes.db"
+# Off by default: the journal is only as durable as its disk, and Render's free plan wipes local
+# files on every deploy/restart. Set WRITE_FLUSH_INTERVAL (e.g. 2) only with WRITE_JOURNAL_PATH
+# on a persistent disk.
+FLUSH_INTERVAL = 0      # Seconds between flushes (WRITE_FLUSH_INTERVAL, 0 = write to the sheet directly)
+CLAIM_SECONDS = 120     # A flush not finished within this window (worker died) is taken over by another worker
+ALERT_ATTEMPTS = 5      # From this many failed flushes on, every failure is logged as an error (writes are never dropped)
+RETRY_BACKOFF = 10      # Seconds before a failed flush is retried (x attempts); 429s land here too
+MAX_BACKOFF = 300       # Retry at least this often, however many attempts failed
+DRAIN_INTERVAL = 5      # Flush interval while write-behind is off but an earlier run left writes behind
+
+
+def flush_interval():
+    return float(os.getenv('WRITE_FLUSH_INTERVAL', FLUSH_INTERVAL))
+
+def journal_path():
+    return os.getenv('WRITE_JOURNAL_PATH', DEFAULT_JOURNAL_PATH)
+
+def journal_in_use():
+    """Write-behind is on, or an earlier run left writes in the journal (they still have to go out)."""
+    if flush_interval() > 0:
+        return True
+    if not os.path.exists(journal_path()):
+        return False
+    try:
+        return get_write_journal().has_writes()
+    except Exception as e:
+        events.warning('write_journal_unreadable', error=str(e))
+        return False
+
+def changed_segments(old, new):
+    """
+    Minimal writes turning row `old` into `new` (both as read back from the sheet):
+    [(first column, [values])] for each run of adjacent changed cells, columns 1-indexed.
+    """
+    segments = []
+    start = None
+    for i, value in enumerate(new):
+        before = old[i] if i < len(old) else ""
+        if str(value) != str(before):
+            if start is None:
+                start = i
+            continue
+        if start is not None:
+            segments.append((start + 1, list(new[start:i])))
+            start = None
+    if start is not None:
+        segments.append((start + 1, list(new[start:])))
+    return segments
+
+
+class WriteJournal:
+    """
+    Durable write-behind journal for sheet mutations (SQLite, shared by the workers on the host).
+    - record_cells() / record_append() commit locally and return at once; SheetService applies the
+      same change to its memory cache and the replica, so reads see the write before the sheet does.
+    - The flusher sends everything due every FLUSH_INTERVAL seconds: cell writes as one
+      values.batchUpdate per spreadsheet (the last write to a cell wins, adjacent cells are merged
+      into one range), appends as one values.append per worksheet, before the cell writes.
+    - One flush at a time across workers (claim with expiry, like JobQueue leases). Every call's
+      writes are removed as soon as that call succeeds, so a failure later in the flush only
+      requeues what was not sent. Requeued writes are retried with backoff, forever: they stay in
+      overlay() and nothing newer is sent meanwhile, so writes never land out of order or vanish.
+    - overlay() lays pending writes over freshly read rows (read-your-writes until flushed). An
+      append is deleted only after values.append returns, so a read in between may already hold
+      the row: appends whose column A value is already in the read are not added again.
+    Path: WRITE_JOURNAL_PATH env (default writes.db); enabled by WRITE_FLUSH_INTERVAL > 0.
+    """
+    def __init__(self, db_path=None):
+        self.db_path = db_path or journal_path()
+        directory = os.path.dirname(self.db_path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._local = threading.local()
+        self._wakeup = threading.Event()
+        self._client_factory = None
+        self._thread = None
+        self._start_lock = threading.Lock()
+        self.worker_id = f"{socket.gethostname()}:{os.getpid()}"
+        conn = self._conn()
+        conn.execute("""
+            CREATE TABLE IF NOT EXISTS writes (
+                seq INTEGER PRIMARY KEY AUTOINCREMENT,
+                sheet_id TEXT NOT NULL,
+                title TEXT NOT NULL,
+                kind TEXT NOT NULL,
+                row INTEGER,
+                col INTEGER,
+                cells TEXT NOT NULL,
+                status TEXT NOT NULL DEFAULT 'pending',
+                attempts INTEGER NOT NULL DEFAULT 0,
+                available_at REAL NOT NULL,
+                claimed_by TEXT,
+                claim_until REAL,
+                last_error TEXT,
+                created_at REAL NOT NULL
+            )
+        """)
+        conn.execute("CREATE INDEX IF NOT EXISTS idx_writes_sheet ON writes (status, sheet_id, title)")
+
+    def _conn(self):
+        # One connection per thread (same pattern as JobQueue)
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.db_path, timeout=30, isolation_level=None)
+            conn.row_factory = sqlite3.Row
+            conn.execute("PRAGMA journal_mode=WAL")
+            # FULL: an acknowledged write must survive a crash before it reaches the sheet
+            conn.execute("PRAGMA synchronous=FULL")
+            self._local.conn = conn
+        return conn
+
+    # ─── Recording ──────────────────────────────────────────────────────────────
+
+    def _record(self, sheet_id, title, kind, row, col, cells):
+        now = time.time()
+        cur = self._conn().execute(
+            "INSERT INTO writes (sheet_id, title, kind, row, col, cells, available_at, created_at) VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+            (sheet_id, title, kind, row, col, json.dumps(cells, ensure_ascii=False), now, now)
+        )
+        events.debug('write_recorded', sheet=title, kind=kind, row=row, col=col, cells=len(cells), seq=cur.lastrowid)
+        return cur.lastrowid
+
+    def record_cells(self, sheet_id, title, row, col, cells):
+        """Adjacent cells of one row starting at (row, col), 1-indexed. Values as USER_ENTERED input."""
+        return self._record(sheet_id, title, 'cells', row, col, list(cells))
+
+    def record_append(self, sheet_id, title, cells):
+        """A row appended after the sheet's last row (values.append, like Worksheet.append_row)."""
+        return self._record(sheet_id, title, 'append', None, None, list(cells))
+
+    def pending(self, sheet_id, title):
+        """Writes of one worksheet not yet confirmed by the sheet, oldest first."""
+        rows = self._conn().execute(
+            "SELECT kind, row, col, cells FROM writes WHERE status = 'pending' AND sheet_id = ? AND title = ? ORDER BY seq",
+            (sheet_id, title)
+        ).fetchall()
+        return [(r['kind'], r['row'], r['col'], json.loads(r['cells'])) for r in rows]
+
+    def has_writes(self):
+        """True while any write (pending or backing off) has not reached the sheet."""
+        return self._conn().execute("SELECT 1 FROM writes LIMIT 1").fetchone() is not None
+
+    def overlay(self, sheet_id, title, rows, display=None):
+        """`rows` (as read from the sheet) with pending writes applied. display(cells) maps input to shown values."""
+        pending = self.pending(sheet_id, title)
+        if not pending:
+            return rows
+        # Column A (Order ID) of the rows the sheet already has
+        existing = {str(r[0]).strip() for r in rows if r and str(r[0]).strip()}
+        rows = list(rows)
+        for kind, row, col, cells in pending:
+            if display is not None:
+                cells = display(cells, col or 1)
+            if kind == 'append':
+                key = str(cells[0]).strip() if cells else ''
+                if key and key in existing:
+                    continue  # Sent, not deleted yet: the read already has it
+                rows.append(list(cells))
+                continue
+            while len(rows) < row:
+                rows.append([])
+            target = list(rows[row - 1])
+            target += [""] * (col - 1 + len(cells) - len(target))
+            target[col - 1:col - 1 + len(cells)] = cells
+            rows[row - 1] = target
+        return rows
+
+    # ─── Flushing ───────────────────────────────────────────────────────────────
+
+    def _claim(self):
+        """Claims every pending write, unless another flush is running or a failed one is backing off."""
+        now = time.time()
+        conn = self._conn()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            busy = conn.execute(
+                "SELECT COUNT(*) AS n FROM writes WHERE status = 'pending' AND "
+                "((claimed_by IS NOT NULL AND claim_until >= ?) OR available_at > ?)",
+                (now, now)
+            ).fetchone()['n']
+            if busy:
+                conn.execute("COMMIT")
+                return []
+            conn.execute(
+                "UPDATE writes SET claimed_by = ?, claim_until = ? WHERE status = 'pending'",
+                (self.worker_id, now + CLAIM_SECONDS)
+            )
+            rows = conn.execute(
+                "SELECT * FROM writes WHERE status = 'pending' AND claimed_by = ? ORDER BY seq", (self.worker_id,)
+            ).fetchall()
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+        return rows
+
+    def flush(self, client):
+        """Sends all due writes. Returns {'writes': flushed, 'calls': API calls made}."""
+        entries = self._claim()
+        if not entries:
+            return {'writes': 0, 'calls': 0}
+        by_sheet = {}
+        for entry in entries:
+            by_sheet.setdefault(entry['sheet_id'], []).append(entry)
+
+        total_writes = total_calls = 0
+        for sheet_id, group in by_sheet.items():
+            start = time.time()
+            unsent = {e['seq'] for e in group}
+            calls = 0
+            try:
+                spreadsheet = client.open_by_key(sheet_id)
+                for seqs, send in self._calls(group):
+                    send(spreadsheet)
+                    # Confirmed by the sheet: drop them now, so a later failure cannot send them twice
+                    self._delete(seqs)
+                    unsent.difference_update(seqs)
+                    calls += 1
+            except Exception as e:
+                self._release(sorted(unsent), e)
+            sent = len(group) - len(unsent)
+            total_writes += sent
+            total_calls += calls
+            if sent:
+                events.info('writes_flushed', sheet_id=sheet_id, writes=sent, calls=calls,
+                            seconds=round(time.time() - start, 3))
+        return {'writes': total_writes, 'calls': total_calls}
+
+    def _calls(self, entries):
+        """[(seqs, send(spreadsheet))] in the order they must run."""
+        appends = {}   # title -> [(seq, row)], in order
+        cells = {}     # (title, row, col) -> value; later writes overwrite earlier ones
+        cell_seqs = []
+        for entry in entries:
+            values = json.loads(entry['cells'])
+            if entry['kind'] == 'append':
+                appends.setdefault(entry['title'], []).append((entry['seq'], values))
+                continue
+            cell_seqs.append(entry['seq'])
+            for offset, value in enumerate(values):
+                cells[(entry['title'], entry['row'], entry['col'] + offset)] = value
+
+        calls = []
+        # Appends first: cell writes recorded after an append may target the appended row
+        for title, items in appends.items():
+            def send_append(spreadsheet, title=title, rows=[values for _, values in items]):
+                spreadsheet.values_append(
+                    absolute_range_name(title),
+                    params={'valueInputOption': 'USER_ENTERED'},
+                    body={'values': rows}
+                )
+            calls.append(([seq for seq, _ in items], send_append))
+
+        if cells:
+            data = []
+            # Adjacent columns of the same row become one range
+            for title, row, col in sorted(cells):
+                value = cells[(title, row, col)]
+                last = data[-1] if data else None
+                if last and last['_key'] == (title, row) and last['_next'] == col:
+                    last['values'][0].append(value)
+                    last['_next'] += 1
+                else:
+                    data.append({'_key': (title, row), '_start': col, '_next': col + 1, 'values': [[value]]})
+            body = {
+                'valueInputOption': 'USER_ENTERED',
+                'data': [
+                    {
+                        'range': absolute_range_name(
+                            d['_key'][0], f"{rowcol_to_a1(d['_key'][1], d['_start'])}:{rowcol_to_a1(d['_key'][1], d['_next'] - 1)}"
+                        ),
+                        'values': d['values']
+                    }
+                    for d in data
+                ]
+            }
+            calls.append((cell_seqs, lambda spreadsheet: spreadsheet.values_batch_update(body=body)))
+        return calls
+
+    def _delete(self, seqs):
+        self._conn().execute(f"DELETE FROM writes WHERE seq IN ({', '.join('?' * len(seqs))})", seqs)
+
+    def _release(self, seqs, error):
+        """Failed flush: the writes not sent yet are retried later with backoff (never dropped)."""
+        if not seqs:
+            return
+        now = time.time()
+        placeholders = ', '.join('?' * len(seqs))
+        self._conn().execute(
+            f"UPDATE writes SET attempts = attempts + 1, claimed_by = NULL, claim_until = NULL, last_error = ?, "
+            f"available_at = ? + MIN(? * (attempts + 1), ?) WHERE seq IN ({placeholders})",
+            [str(error)[:1000], now, RETRY_BACKOFF, MAX_BACKOFF] + list(seqs)
+        )
+        attempts = self._conn().execute(
+            f"SELECT MAX(attempts) AS n FROM writes WHERE seq IN ({placeholders})", list(seqs)
+        ).fetchone()['n'] or 0
+        if attempts >= ALERT_ATTEMPTS:
+            # Still pending (and still overlaid): the sheet is behind what users were told was saved
+            events.error('writes_stuck', writes=len(seqs), attempts=attempts, error=str(error))
+        else:
+            events.warning('writes_flush_failed', writes=len(seqs), attempts=attempts, error=str(error))
+
+    def start(self, client_factory):
+        """Starts this process's flusher (once). client_factory() -> gspread client."""
+        with self._start_lock:
+            if self._client_factory is None:
+                self._client_factory = client_factory
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._flush_loop, daemon=True)
+                self._thread.start()
+
+    def _flush_loop(self):
+        while True:
+            self._wakeup.wait(flush_interval() or DRAIN_INTERVAL)
+            self._wakeup.clear()
+            try:
+                self.flush(self._client_factory())
+            except Exception as e:
+                events.exception('writes_flush_loop_failed', error=str(e))
+
+    def stats(self):
+        rows = self._conn().execute(
+            "SELECT status, COUNT(*) AS n, MIN(created_at) AS oldest, MAX(attempts) AS attempts, "
+            "MAX(last_error) AS last_error FROM writes GROUP BY status"
+        ).fetchall()
+        now = time.time()
+        return {
+            r['status']: {'writes': r['n'], 'oldest_age': round(now - r['oldest'], 1),
+                          'attempts': r['attempts'], 'last_error': r['last_error']}
+            for r in rows
+        }
+
+
+_write_journal_instance = None
+_write_journal_lock = threading.Lock()
+
+def get_write_journal():
+    global _write_journal_instance
+    if _write_journal_instance is None:
+        with _write_journal_lock:
+            if _write_journal_instance is None:
+                _write_journal_instance = WriteJournal()
+    return _write_journal_instance
@@ -1,11 +1,31 @@
 // --- STATE ---
 let allOrders = [];
 let html5QrcodeScanner = null;
-let recoveryQueue = [];
-let isRecovering = false;
+let isRecovering = false; // Image recovery state lives on each order (order._recovery), not in the DOM
 let currentFilterStatus = 'all'; // 'all', 'pending', 'checked'
 let selectedPlatforms = []; // List of selected platforms to filter by
 
+// Search index: built once per fetchOrders, so typing never re-lowercases every order
+let searchIndex = [];   // searchIndex[i] = lowercased searchable text of allOrders[i]
+let platformIndex = []; // platformIndex[i] = lowercased platform of allOrders[i]
+let lastSearch = { query: null, status: null, platforms: '', matches: null };
+const SEARCH_DEBOUNCE_MS = 120;
+let searchTimer = null;
+
+// Virtual list: only cards near the viewport are in the DOM (see renderVirtualWindow)
+let visibleOrders = [];
+let virtualRowHeight = 360; // px, estimate until the first rows are measured
+let virtualRange = { start: -1, end: -1, cols: 0 };
+let virtualFrameRequested = false;
+let virtualForceRender = false;
+const VIRTUAL_OVERSCAN_ROWS = 4;
+
+// Live updates: /api/stream pushes row deltas (see services/change_feed.py) instead of re-fetching /api/orders
+let orderStream = null;
+let currentSheet = null;
+let streamRenderTimer = null;
+const STREAM_RENDER_DELAY_MS = 100; // Coalesce a burst of changes into one re-render
+
 // --- INIT ---
 document.addEventListener('DOMContentLoaded', async () => {
     // 1. Initial UI setup
@@ -25,10 +45,17 @@ document.addEventListener('DOMContentLoaded', async () => {
         await fetchConfig();
     }
 
-    // Search Listener
+    // Search Listener (debounced: filter once the user pauses typing)
     document.getElementById('search-input').addEventListener('input', (e) => {
-        filterOrders(e.target.value);
+        clearTimeout(searchTimer);
+        searchTimer = setTimeout(() => filterOrders(e.target.value), SEARCH_DEBOUNCE_MS);
     });
+
+    // Virtual list follows the page scroll / layout changes
+    window.addEventListener('scroll', scheduleVirtualRender, { passive: true });
+    window.addEventListener('resize', scheduleVirtualRender);
+
+    connectOrderStream();
 });
 
 // ... (fetchOrders, updateStatus, etc.) ...
@@ -51,11 +78,19 @@ async function fetchOrders() {
             throw new Error(data.detail || data.error);
         }
 
-        allOrders = data;
-        applyFilters();
+        // Keep images already recovered (and rows already searched) across reloads
+        const previous = new Map(allOrders.map(o => [o['Order ID'], o]));
+        data.forEach(o => {
+            const old = previous.get(o['Order ID']);
+            if (old && !o.DirectImage) {
+                if (old.DirectImage) o.DirectImage = old.DirectImage;
+                if (old._recovery) o._recovery = old._recovery;
+            }
+        });
 
-        // Start Auto Recovery for missing images
-        startAutoRecovery(data);
+        allOrders = data;
+        buildSearchIndex();
+        applyFilters(); // Rendering the window starts auto recovery for the rows on screen
 
     } catch (e) {
         console.error(e);
@@ -137,181 +172,291 @@ function applyFilters() {
 // --- RENDER ---
 function renderOrders(orders) {
     const listEl = document.getElementById('order-list');
-    listEl.innerHTML = '';
+    visibleOrders = orders;
+    virtualRange = { start: -1, end: -1, cols: 0 };
 
     if (orders.length === 0) {
         listEl.innerHTML = `<div class="col-12 text-center text-muted py-5">No orders found.</div>`;
         return;
     }
 
-    const html = orders.map(order => {
-        const rawStatus = ((order['Status'] !== null && order['Status'] !== undefined) ? order['Status'] : 'Pending').toString().toLowerCase().trim();
-        let statusClass = 'status-pending';
-        let statusLabel = order['Status'] || 'Pending';
-
-        // Normalize Status
-        if (rawStatus === 'checked') {
-            statusClass = 'status-checked';
-            statusLabel = 'Checked'; // Blue
-        } else if (rawStatus === 'saved' || rawStatus === 'save') {
-            statusClass = 'status-saved';
-            statusLabel = 'Saved'; // Orange
-        } else if (rawStatus.includes('cancel') || rawStatus === 'cancelled' || rawStatus === 'cancleed') {
-            statusClass = 'status-cancelled';
-            statusLabel = 'Cancelled'; // Red
-            if (rawStatus === 'cancleed') statusLabel = 'Cancelled';
-        } else {
-            statusClass = 'status-pending'; // Yellow default
-            statusLabel = 'Pending';
-        }
+    renderVirtualWindow(true);
+}
 
-        const isChecked = rawStatus === 'checked';
-        const isPending = statusLabel.toLowerCase() === 'pending';
+function orderCardHtml(order) {
+    const rawStatus = ((order['Status'] !== null && order['Status'] !== undefined) ? order['Status'] : 'Pending').toString().toLowerCase().trim();
+    let statusClass = 'status-pending';
+    let statusLabel = order['Status'] || 'Pending';
+
+    // Normalize Status
+    if (rawStatus === 'checked') {
+        statusClass = 'status-checked';
+        statusLabel = 'Checked'; // Blue
+    } else if (rawStatus === 'saved' || rawStatus === 'save') {
+        statusClass = 'status-saved';
+        statusLabel = 'Saved'; // Orange
+    } else if (rawStatus.includes('cancel') || rawStatus === 'cancelled' || rawStatus === 'cancleed') {
+        statusClass = 'status-cancelled';
+        statusLabel = 'Cancelled'; // Red
+        if (rawStatus === 'cancleed') statusLabel = 'Cancelled';
+    } else {
+        statusClass = 'status-pending'; // Yellow default
+        statusLabel = 'Pending';
+    }
 
-        let btnHtml = '';
-        if (isChecked) {
-            btnHtml = `<button class="btn btn-outline-danger w-100" onclick="updateStatus('${order['Order ID']}', 'uncheck')">❌ Uncheck</button>`;
-        } else if (isPending) {
-            btnHtml = `<button class="btn btn-info w-100 text-white" onclick="updateStatus('${order['Order ID']}', 'check')">✅ Check</button>`;
-        }
+    const isChecked = rawStatus === 'checked';
+    const isPending = statusLabel.toLowerCase() === 'pending';
 
-        const btnLogin = btnHtml;
+    let btnHtml = '';
+    if (isChecked) {
+        btnHtml = `<button class="btn btn-outline-danger w-100" onclick="updateStatus('${order['Order ID']}', 'uncheck')">❌ Uncheck</button>`;
+    } else if (isPending) {
+        btnHtml = `<button class="btn btn-info w-100 text-white" onclick="updateStatus('${order['Order ID']}', 'check')">✅ Check</button>`;
+    }
 
-        // Image Handling
-        let imgHtml = '';
-        if (order.DirectImage) {
-            imgHtml = `<img src="${order.DirectImage}" class="order-img" onclick="showImage('${order.DirectImage}')" loading="lazy">`;
-        } else {
-            // Placeholder with spinner or button
-            imgHtml = `
-                <div class="order-img d-flex flex-column justify-content-center align-items-center text-muted" id="img-box-${order['Order ID']}">
-                    <span id="status-${order['Order ID']}">Checking...</span>
-                    <!-- Button hidden by default if auto-recovery runs, but kept for backup -->
-                    <button class="btn btn-sm btn-outline-secondary mt-2 d-none" id="btn-${order['Order ID']}" onclick="recoverImage('${order['Order ID']}', '${order['Run No']}')">🔄 Find</button>
-                    ${order.RawImageLink ? `<small class="d-none">${order.RawImageLink}</small>` : ''}
-                </div>
-            `;
-        }
+    const btnLogin = btnHtml;
 
-        // Platform Logo Logic
-        const platform = (order['Platform'] || '').toLowerCase().trim();
-        let platformLogo = '';
-        if (platform.includes('lazada')) {
-            platformLogo = '<img src="/static/img/lazada.png" style="height: 24px; vertical-align: middle;" alt="Lazada">';
-        } else if (platform.includes('shopee')) {
-            platformLogo = '<img src="/static/img/shopee.png" style="height: 24px; vertical-align: middle;" alt="Shopee">';
-        } else if (platform.includes('tiktok')) {
-            platformLogo = '<img src="/static/img/tiktok.png" style="height: 24px; vertical-align: middle;" alt="TikTok">';
-        } else if (platform.includes('line')) {
-            platformLogo = '<img src="/static/img/line.png" style="height: 24px; vertical-align: middle;" alt="Line">';
-        } else if (platform.includes('amaze')) {
-            platformLogo = '<img src="/static/img/Amaze.png" style="height: 24px; vertical-align: middle;" alt="Amaze">';
-        } else {
-            platformLogo = '🛒 ' + (order['Platform'] || 'Unknown');
-        }
+    // Image Handling
+    let imgHtml = '';
+    if (order.DirectImage) {
+        imgHtml = `<img src="${order.DirectImage}" class="order-img" onclick="showImage('${order.DirectImage}')" loading="lazy">`;
+    } else {
+        // Placeholder with spinner or button (text follows order._recovery, see recoverImage)
+        const recoveryLabel = { searching: 'Searching...', missing: 'No Image', error: 'Error' }[order._recovery] || 'Checking...';
+        const showFind = order._recovery === 'missing' || order._recovery === 'error';
+        imgHtml = `
+            <div class="order-img d-flex flex-column justify-content-center align-items-center text-muted" id="img-box-${order['Order ID']}">
+                <span id="status-${order['Order ID']}">${recoveryLabel}</span>
+                <!-- Button hidden while auto-recovery has not given up on this row -->
+                <button class="btn btn-sm btn-outline-secondary mt-2 ${showFind ? '' : 'd-none'}" id="btn-${order['Order ID']}" onclick="recoverImage('${order['Order ID']}', '${order['Run No']}')">🔄 Find</button>
+                ${order.RawImageLink ? `<small class="d-none">${order.RawImageLink}</small>` : ''}
+            </div>
+        `;
+    }
 
-        const card = `
-            <div class="col-12 col-md-6 col-lg-4">
-                <div class="order-card h-100 card-${statusClass.replace('status-', '')}">
-                    <div class="card-header-custom d-flex justify-content-between align-items-center">
-                        <div class="d-flex align-items-center">
-                           <span class="run-no me-2">${order['Run No'] || '-'}</span>
-                           ${platformLogo}
-                        </div>
-                        <div class="d-flex align-items-center">
-                            ${statusLabel === 'Saved' && order['SavedDate'] ? `<span class="saved-date-label me-2">${order['SavedDate']}</span>` : ''}
-                            <span class="badge badge-status ${statusClass}">${statusLabel}</span>
-                        </div>
+    // Platform Logo Logic
+    const platform = (order['Platform'] || '').toLowerCase().trim();
+    let platformLogo = '';
+    if (platform.includes('lazada')) {
+        platformLogo = '<img src="/static/img/lazada.png" style="height: 24px; vertical-align: middle;" alt="Lazada">';
+    } else if (platform.includes('shopee')) {
+        platformLogo = '<img src="/static/img/shopee.png" style="height: 24px; vertical-align: middle;" alt="Shopee">';
+    } else if (platform.includes('tiktok')) {
+        platformLogo = '<img src="/static/img/tiktok.png" style="height: 24px; vertical-align: middle;" alt="TikTok">';
+    } else if (platform.includes('line')) {
+        platformLogo = '<img src="/static/img/line.png" style="height: 24px; vertical-align: middle;" alt="Line">';
+    } else if (platform.includes('amaze')) {
+        platformLogo = '<img src="/static/img/Amaze.png" style="height: 24px; vertical-align: middle;" alt="Amaze">';
+    } else {
+        platformLogo = '🛒 ' + (order['Platform'] || 'Unknown');
+    }
+
+    const card = `
+        <div class="col-12 col-md-6 col-lg-4">
+            <div class="order-card h-100 card-${statusClass.replace('status-', '')}">
+                <div class="card-header-custom d-flex justify-content-between align-items-center">
+                    <div class="d-flex align-items-center">
+                       <span class="run-no me-2">${order['Run No'] || '-'}</span>
+                       ${platformLogo}
                     </div>
-                    
-                    <div class="row g-2 mt-2">
-                        <div class="col-4">
-                            ${imgHtml}
-                        </div>
-                        <div class="col-8">
-                            <div class="detail-row"><b>👤 Name:</b> ${order['Name'] || '-'}</div>
-                            <div class="detail-row"><b>🏪 Shop:</b> ${order['Shop'] || '-'}</div>
-                            <div class="detail-row"><b>📍 Loc:</b> ${order['Location'] || '-'}</div>
-                            <div class="detail-row"><b>📦 Item:</b> ${order['Item'] || '-'}</div>
-                            <div class="detail-row text-truncate"><b>💰 Price:</b> <b style="color: #ff4500; font-size: 1.05em;">${order['Price']}</b> | <b style="color: #daa520;">🪙 ${order['Coins']}</b></div>
-                            <div class="detail-row"><small class="text-muted">Date: ${order['Date']}</small></div>
-                            
-                            <div class="mt-2 pt-2 border-top border-secondary">
-                                ${btnLogin}
-                            </div>
-                        </div>
+                    <div class="d-flex align-items-center">
+                        ${statusLabel === 'Saved' && order['SavedDate'] ? `<span class="saved-date-label me-2">${order['SavedDate']}</span>` : ''}
+                        <span class="badge badge-status ${statusClass}">${statusLabel}</span>
                     </div>
-                    
-                    <div class="mt-2 text-muted small text-truncate">
-                        ID: ${order['Order ID']}<br>
-                        Tracking: ${order['Tracking']}
+                </div>
+                
+                <div class="row g-2 mt-2">
+                    <div class="col-4">
+                        ${imgHtml}
+                    </div>
+                    <div class="col-8">
+                        <div class="detail-row"><b>👤 Name:</b> ${order['Name'] || '-'}</div>
+                        <div class="detail-row"><b>🏪 Shop:</b> ${order['Shop'] || '-'}</div>
+                        <div class="detail-row"><b>📍 Loc:</b> ${order['Location'] || '-'}</div>
+                        <div class="detail-row"><b>📦 Item:</b> ${order['Item'] || '-'}</div>
+                        <div class="detail-row text-truncate"><b>💰 Price:</b> <b style="color: #ff4500; font-size: 1.05em;">${order['Price']}</b> | <b style="color: #daa520;">🪙 ${order['Coins']}</b></div>
+                        <div class="detail-row"><small class="text-muted">Date: ${order['Date']}</small></div>
+                        
+                        <div class="mt-2 pt-2 border-top border-secondary">
+                            ${btnLogin}
+                        </div>
                     </div>
                 </div>
+                
+                <div class="mt-2 text-muted small text-truncate">
+                    ID: ${order['Order ID']}<br>
+                    Tracking: ${order['Tracking']}
+                </div>
             </div>
-        `;
-        return card;
-    }).join('');
+        </div>
+    `;
+    return card;
+}
+
+// --- VIRTUAL LIST ---
+function columnsPerRow() {
+    // Matches the card classes: col-12 / col-md-6 / col-lg-4
+    const width = window.innerWidth;
+    if (width >= 992) return 3;
+    if (width >= 768) return 2;
+    return 1;
+}
+
+function scheduleVirtualRender(force) {
+    // force === true re-renders the same window (order data changed); scroll/resize pass an Event
+    if (force === true) virtualForceRender = true;
+    if (virtualFrameRequested || visibleOrders.length === 0) return;
+    virtualFrameRequested = true;
+    requestAnimationFrame(() => {
+        virtualFrameRequested = false;
+        const forced = virtualForceRender;
+        virtualForceRender = false;
+        renderVirtualWindow(forced);
+    });
+}
+
+function renderVirtualWindow(force) {
+    const listEl = document.getElementById('order-list');
+    const cols = columnsPerRow();
+    const totalRows = Math.ceil(visibleOrders.length / cols);
+
+    // Visible rows relative to the top of the list (the page itself scrolls)
+    const listTop = listEl.getBoundingClientRect().top + window.scrollY;
+    const viewTop = window.scrollY - listTop;
+    const firstRow = Math.max(0, Math.floor(viewTop / virtualRowHeight) - VIRTUAL_OVERSCAN_ROWS);
+    const lastRow = Math.min(totalRows, Math.ceil((viewTop + window.innerHeight) / virtualRowHeight) + VIRTUAL_OVERSCAN_ROWS);
+    const start = Math.min(firstRow * cols, visibleOrders.length);
+    const end = Math.min(lastRow * cols, visibleOrders.length);
+
+    if (!force && start === virtualRange.start && end === virtualRange.end && cols === virtualRange.cols) return;
+    virtualRange = { start, end, cols };
+
+    // Spacers keep the full scroll height so the scrollbar and scrollToBottom still work
+    const topPad = firstRow * virtualRowHeight;
+    const bottomPad = Math.max(0, (totalRows - lastRow) * virtualRowHeight);
+    listEl.innerHTML =
+        `<div class="col-12 p-0 mt-0" style="height: ${topPad}px"></div>` +
+        visibleOrders.slice(start, end).map(orderCardHtml).join('') +
+        `<div class="col-12 p-0 mt-0" style="height: ${bottomPad}px"></div>`;
+
+    measureVirtualRowHeight(listEl, cols);
+    startAutoRecovery(); // New rows on screen may need their image found
+}
+
+function measureVirtualRowHeight(listEl, cols) {
+    // Average distance between rendered rows (cards in a row share the row height)
+    const cards = listEl.querySelectorAll(':scope > .col-12.col-md-6');
+    const rows = Math.floor(cards.length / cols);
+    if (rows < 2) return;
+    const measured = (cards[(rows - 1) * cols].offsetTop - cards[0].offsetTop) / (rows - 1);
+    if (measured > 0 && Math.abs(measured - virtualRowHeight) > 2) {
+        virtualRowHeight = measured;
+        scheduleVirtualRender();
+    }
+}
 
-    listEl.innerHTML = html;
+// --- SEARCH ---
+function buildSearchIndex() {
+    const text = v => (v === null || v === undefined ? '' : v).toString();
+    searchIndex = allOrders.map(o =>
+        // \u0001 separator: a query can never match across two fields
+        [o['Name'], o['Order ID'], o['Run No'], o['Tracking'], o['Item'], o['Shop']].map(text).join('\u0001').toLowerCase()
+    );
+    platformIndex = allOrders.map(o => text(o['Platform']).toLowerCase());
+    lastSearch = { query: null, status: null, platforms: '', matches: null };
+}
+
+function orderStatusKey(o) {
+    const rawStatus = ((o['Status'] !== null && o['Status'] !== undefined) ? o['Status'] : 'pending').toString().toLowerCase().trim();
+    if (rawStatus === 'checked') return 'checked';
+    if (rawStatus === 'saved') return 'saved';
+    if (rawStatus.includes('cancel')) return 'cancelled';
+    return 'pending';
 }
 
 function filterOrders(query) {
     if (!query && currentFilterStatus === 'all' && selectedPlatforms.length === 0) {
+        lastSearch = { query: null, status: null, platforms: '', matches: null };
         renderOrders(allOrders);
         document.getElementById('order-count').innerText = allOrders.length;
         return;
     }
 
     query = (query || '').toString().toLowerCase().trim();
+    if (searchIndex.length !== allOrders.length) buildSearchIndex();
+
+    // Typing more characters only narrows the previous text matches
+    const platformsKey = selectedPlatforms.join('|');
+    // (same query = status/data changed -> full pass, orders may need to re-enter the list)
+    const narrowing = lastSearch.matches && lastSearch.query !== null &&
+        query.length > lastSearch.query.length && query.startsWith(lastSearch.query) &&
+        lastSearch.status === currentFilterStatus && lastSearch.platforms === platformsKey;
+    const candidates = narrowing ? lastSearch.matches : null;
+
+    const matches = [];
+    const total = candidates ? candidates.length : allOrders.length;
+    for (let k = 0; k < total; k++) {
+        const i = candidates ? candidates[k] : k;
 
-    const filtered = allOrders.filter(o => {
         // 1. Text Search
-        const name = (o['Name'] || '').toString().toLowerCase();
-        const oid = (o['Order ID'] || '').toString().toLowerCase();
-        const runNo = (o['Run No'] || '').toString().toLowerCase();
-        const track = (o['Tracking'] || '').toString().toLowerCase();
-        const item = (o['Item'] || '').toString().toLowerCase();
-        const shop = (o['Shop'] || '').toString().toLowerCase();
-
-        const matchesText = name.includes(query) ||
-            oid.includes(query) ||
-            runNo.includes(query) ||
-            track.includes(query) ||
-            item.includes(query) ||
-            shop.includes(query);
-
-        if (!matchesText) return false;
+        if (query && !searchIndex[i].includes(query)) continue;
 
         // 2. Status Filter
-        if (currentFilterStatus !== 'all') {
-            const rawStatus = ((o['Status'] !== null && o['Status'] !== undefined) ? o['Status'] : 'pending').toString().toLowerCase().trim();
-            const statusLabel = rawStatus; // Simplified for check
-
-            let statusMatch = false;
-            if (currentFilterStatus === 'checked') statusMatch = (rawStatus === 'checked');
-            else if (currentFilterStatus === 'saved') statusMatch = (rawStatus === 'saved');
-            else if (currentFilterStatus === 'cancelled') statusMatch = rawStatus.includes('cancel');
-            else if (currentFilterStatus === 'pending') {
-                statusMatch = (rawStatus !== 'checked' && rawStatus !== 'saved' && !rawStatus.includes('cancel'));
-            }
-
-            if (!statusMatch) return false;
-        }
+        if (currentFilterStatus !== 'all' && orderStatusKey(allOrders[i]) !== currentFilterStatus) continue;
 
         // 3. Platform Filter
-        if (selectedPlatforms.length > 0) {
-            const orderPlatform = ((o['Platform'] !== null && o['Platform'] !== undefined) ? o['Platform'] : '').toString().toLowerCase();
-            const matchesPlatform = selectedPlatforms.some(p => orderPlatform.includes(p));
-            if (!matchesPlatform) return false;
-        }
+        if (selectedPlatforms.length > 0 && !selectedPlatforms.some(p => platformIndex[i].includes(p))) continue;
 
-        return true;
-    });
+        matches.push(i);
+    }
+    lastSearch = { query, status: currentFilterStatus, platforms: platformsKey, matches };
 
+    const filtered = matches.map(i => allOrders[i]);
     document.getElementById('order-count').innerText = filtered.length;
     renderOrders(filtered);
 }
 
+// --- LIVE STREAM ---
+function connectOrderStream() {
+    if (!window.EventSource) return; // Old browsers: data refreshes on reload / sheet switch as before
+    if (orderStream) orderStream.close();
+
+    // EventSource reconnects by itself and resumes from the last event id
+    orderStream = new EventSource('/api/stream');
+    orderStream.addEventListener('change', (e) => applyOrderChange(JSON.parse(e.data)));
+    orderStream.addEventListener('resync', () => fetchOrders()); // Missed deltas: reload once
+}
+
+function orderKey(o) {
+    // Same key as order_key() in services/change_feed.py
+    const text = v => (v === null || v === undefined ? '' : v).toString().trim();
+    if (text(o['Order ID'])) return text(o['Order ID']);
+    return text(o['Run No']) ? `run:${text(o['Run No'])}` : null;
+}
+
+function applyOrderChange(change) {
+    if (currentSheet && change.sheet !== currentSheet) return;
+
+    const i = allOrders.findIndex(o => orderKey(o) === change.key);
+    if (change.kind === 'order_added') {
+        if (i === -1) allOrders.push(change.order);
+        else allOrders[i] = change.order;
+        showToast(`New order: ${change.order['Name'] || change.key}`);
+    } else if (change.kind === 'order_removed') {
+        if (i === -1) return;
+        allOrders.splice(i, 1);
+    } else {
+        if (i === -1) return;
+        Object.assign(allOrders[i], change.changes);
+    }
+
+    clearTimeout(streamRenderTimer);
+    streamRenderTimer = setTimeout(() => {
+        buildSearchIndex();
+        applyFilters();
+    }, STREAM_RENDER_DELAY_MS);
+}
+
 function togglePlatform(platform) {
     const chip = document.querySelector(`.platform-chip[data-platform="${platform}"]`);
 
@@ -326,38 +471,39 @@ function togglePlatform(platform) {
     applyFilters();
 }
 
-function startAutoRecovery(orders) {
-    // Filter orders needing recovery
-    const needingRecovery = orders.filter(o => !o.DirectImage);
-    recoveryQueue = needingRecovery.map(o => ({ id: o['Order ID'], runNo: o['Run No'] }));
-
-    if (!isRecovering && recoveryQueue.length > 0) {
-        processRecoveryQueue();
+function nextRecoveryCandidate() {
+    // Only rows in the rendered window (viewport + overscan): off-screen rows wait until scrolled to
+    for (let i = Math.max(0, virtualRange.start); i < virtualRange.end; i++) {
+        const o = visibleOrders[i];
+        if (o && !o.DirectImage && !o._recovery) return o;
     }
+    return null;
+}
+
+function startAutoRecovery() {
+    if (!isRecovering) processRecoveryQueue();
 }
 
 async function processRecoveryQueue() {
-    if (recoveryQueue.length === 0) {
+    const order = nextRecoveryCandidate();
+    if (!order) {
         isRecovering = false;
         return;
     }
 
     isRecovering = true;
-    const task = recoveryQueue.shift(); // Get next
-
-    await recoverImage(task.id, task.runNo, true); // true = auto mode
+    await recoverImage(order['Order ID'], order['Run No'], true); // true = auto mode
 
     // Add delay to prevent rate limit (e.g., 500ms)
     setTimeout(processRecoveryQueue, 500);
 }
 
 async function recoverImage(orderId, runNo, isAuto = false) {
-    const box = document.getElementById(`img-box-${orderId}`);
-    const statusEl = document.getElementById(`status-${orderId}`);
-    const btnEl = document.getElementById(`btn-${orderId}`);
-
-    if (statusEl) statusEl.innerText = "Searching...";
-    if (btnEl) btnEl.classList.add('d-none'); // Hide button while searching
+    // State goes on the order, not the card: the card may be scrolled out of the DOM meanwhile
+    const order = allOrders.find(o => o['Order ID'] == orderId);
+    if (!order) return;
+    order._recovery = 'searching';
+    scheduleVirtualRender(true);
 
     // Use Run No for recovery if available, fallback to Order ID
     const target = runNo || orderId;
@@ -367,22 +513,15 @@ async function recoverImage(orderId, runNo, isAuto = false) {
         const data = await res.json();
 
         if (data.found && data.url) {
-            // Update Data model
-            const order = allOrders.find(o => o['Order ID'] == orderId);
-            if (order) order.DirectImage = data.url;
-
-            // Re-render box
-            if (box) {
-                box.parentElement.innerHTML = `<img src="${data.url}" class="order-img" onclick="showImage('${data.url}')">`;
-            }
+            order.DirectImage = data.url;
+            delete order._recovery;
         } else {
-            if (statusEl) statusEl.innerText = "No Image";
-            if (btnEl) btnEl.classList.remove('d-none'); // Show button to retry
+            order._recovery = 'missing'; // Shows the Find button to retry
         }
     } catch (e) {
-        if (statusEl) statusEl.innerText = "Error";
-        if (btnEl) btnEl.classList.remove('d-none');
+        order._recovery = 'error';
     }
+    scheduleVirtualRender(true);
 }
 
 function showImage(url) {
@@ -478,6 +617,7 @@ async function fetchSheets(isFirstLoad = false) {
             // Set Current
             if (data.current) {
                 currentEl.innerText = data.current;
+                currentSheet = data.current;
             }
 
             // Auto-switch if pinned and first load
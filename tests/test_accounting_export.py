@@ -0,0 +1,125 @@
+import csv
+import io
+from types import SimpleNamespace
+
+import pytest
+from openpyxl import load_workbook
+
+from services import accounting_service
+from services.accounting_service import AccountingService
+
+HEADER = ['Order ID', 'ชื่อร้าน', 'ชื่อของ', 'ราคาของ']
+RECORDS = [
+    {'Order ID': 'A3', 'ชื่อร้าน': 'Shop B', 'ชื่อของ': 'iPhone', 'ราคาของ': '1,200'},
+    {'Order ID': 'A1', 'ชื่อร้าน': 'Shop A', 'ชื่อของ': 'iPad', 'ราคาของ': '900'},
+    {'Order ID': 'A2', 'ชื่อร้าน': 'Shop A', 'ชื่อของ': 'iPad', 'ราคาของ': '80'},
+]
+
+
+class FakeSheetService:
+    def __init__(self, records):
+        self.records = records
+        self.sheet = SimpleNamespace(title='May')
+
+    def get_all_data(self):
+        return [dict(r) for r in self.records]
+
+
+class FakeDrive:
+    def __init__(self):
+        self.uploads = []
+        self.deleted = set()
+
+    def upload_stream(self, fh, file_name, mimetype, folder_id=None, overwrite=True):
+        fh.seek(0)
+        self.uploads.append((file_name, mimetype, fh.read()))
+        file_id = f"f{len(self.uploads)}"
+        return {'id': file_id, 'webViewLink': f"https://drive/{file_id}"}
+
+    def file_exists(self, file_id):
+        return file_id not in self.deleted
+
+
+@pytest.fixture(autouse=True)
+def fresh_export_cache(monkeypatch):
+    monkeypatch.setattr(accounting_service, '_export_results', {})
+    monkeypatch.setattr(accounting_service, '_export_flights', {})
+
+
+def test_xlsx_export_is_sorted_by_shop_item_price():
+    drive = FakeDrive()
+    result = AccountingService(FakeSheetService(RECORDS), drive).export_report('folder', fmt='xlsx')
+    assert result['rows'] == 3 and result['format'] == 'xlsx' and result['filename'].endswith('.xlsx')
+    assert result['bytes'] == len(drive.uploads[0][2])
+
+    rows = list(load_workbook(io.BytesIO(drive.uploads[0][2])).active.values)
+    assert list(rows[0]) == HEADER
+    assert [r[0] for r in rows[1:]] == ['A2', 'A1', 'A3']  # 80 before 900: prices compare as numbers
+
+
+def test_csv_export_has_bom_for_excel():
+    drive = FakeDrive()
+    AccountingService(FakeSheetService(RECORDS), drive).export_report('folder', fmt='csv')
+    data = drive.uploads[0][2]
+    assert data.startswith('\ufeff'.encode('utf-8'))
+    rows = list(csv.reader(io.StringIO(data.decode('utf-8-sig'))))
+    assert rows[0] == HEADER and [r[0] for r in rows[1:]] == ['A2', 'A1', 'A3']
+
+
+def test_unknown_format_and_empty_sheet():
+    service = AccountingService(FakeSheetService(RECORDS), FakeDrive())
+    with pytest.raises(ValueError):
+        service.export_report('folder', fmt='pdf')
+    assert AccountingService(FakeSheetService([]), FakeDrive()).export_report('folder') is None
+
+
+def test_unchanged_data_reuses_the_drive_file():
+    drive = FakeDrive()
+    sheet = FakeSheetService(RECORDS)
+    first = AccountingService(sheet, drive).export_report('folder')
+    again = AccountingService(sheet, drive).export_report('folder')
+    assert first['cached'] is False and again['cached'] is True
+    assert again['file_id'] == first['file_id'] and len(drive.uploads) == 1
+
+    # Another format or folder is another file
+    AccountingService(sheet, drive).export_report('folder', fmt='csv')
+    AccountingService(sheet, drive).export_report('other-folder')
+    assert len(drive.uploads) == 3
+
+    # Deleted in Drive: built again
+    drive.deleted.add(first['file_id'])
+    rebuilt = AccountingService(sheet, drive).export_report('folder')
+    assert rebuilt['cached'] is False and rebuilt['file_id'] != first['file_id']
+
+    sheet.records = RECORDS + [{'Order ID': 'A4', 'ชื่อร้าน': 'Shop C', 'ชื่อของ': 'Mac', 'ราคาของ': '5'}]
+    changed = AccountingService(sheet, drive).export_report('folder')
+    assert changed['cached'] is False and changed['rows'] == 4
+
+
+def test_concurrent_identical_exports_share_one_build():
+    import threading
+
+    class SlowDrive(FakeDrive):
+        def __init__(self):
+            super().__init__()
+            self.release = threading.Event()
+
+        def upload_stream(self, fh, *args, **kwargs):
+            self.release.wait(5)
+            return super().upload_stream(fh, *args, **kwargs)
+
+    drive = SlowDrive()
+    results = []
+    threads = [threading.Thread(target=lambda: results.append(
+        AccountingService(FakeSheetService(RECORDS), drive).export_report('folder'))) for _ in range(3)]
+    for t in threads:
+        t.start()
+    while len(accounting_service._export_flights) == 0:
+        threading.Event().wait(0.01)
+    drive.release.set()
+    for t in threads:
+        t.join(5)
+
+    assert len(drive.uploads) == 1
+    assert len({r['file_id'] for r in results}) == 1
+    assert sorted(r['cached'] for r in results) == [False, True, True]
@@ -0,0 +1,33 @@
+from services.accounting_service import UNKNOWN_GROUP, compute_summary
+
+
+def test_totals_skip_cancelled_orders():
+    summary = compute_summary([
+        {'Shop': 'A', 'Platform': 'Shopee', 'Price': '1,000', 'Coins': '50', 'Status': 'Checked'},
+        {'Shop': 'A', 'Platform': 'Lazada', 'Price': '฿200', 'Coins': '', 'Status': ''},
+        {'Shop': 'B', 'Platform': 'Shopee', 'Price': '500', 'Coins': '0', 'Status': 'Cancelled'},
+    ])
+    assert summary['orders'] == 2
+    assert summary['price'] == 1200 and summary['coins'] == 50 and summary['net'] == 1150
+    assert summary['status']['cancelled'] == {'orders': 1, 'price': 500.0, 'coins': 0.0, 'net': 500.0}
+    assert summary['status']['pending']['orders'] == 1
+    assert summary['status']['saved']['orders'] == 0
+
+
+def test_groups_sorted_by_net_with_status_counts():
+    summary = compute_summary([
+        {'Shop': 'A', 'Platform': 'Shopee', 'Price': '100', 'Coins': '0', 'Status': 'Checked'},
+        {'Shop': 'B', 'Platform': 'Shopee', 'Price': '900', 'Coins': '0', 'Status': 'Saved'},
+        {'Shop': 'B', 'Platform': '', 'Price': '100', 'Coins': '0', 'Status': 'Pending'},
+    ])
+    assert [g['shop'] for g in summary['by_shop']] == ['B', 'A']
+    assert summary['by_shop'][0] == {'shop': 'B', 'orders': 2, 'price': 1000.0, 'coins': 0.0, 'net': 1000.0,
+                                     'pending': 1, 'checked': 0, 'saved': 1}
+    assert {g['platform'] for g in summary['by_platform']} == {'Shopee', UNKNOWN_GROUP}
+
+
+def test_raw_sheet_headers_and_empty_input():
+    summary = compute_summary([{'ชื่อร้าน': 'A', 'ยอดรวม': '300', 'เหรียญ': '20', 'สถานะ': 'checked'}])
+    assert summary['by_shop'][0]['shop'] == 'A' and summary['net'] == 280
+    empty = compute_summary([])
+    assert empty['orders'] == 0 and empty['by_shop'] == []
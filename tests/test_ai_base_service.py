@@ -0,0 +1,28 @@
+from services.ai_base_service import AIBaseService
+
+
+class FlakyService(AIBaseService):
+    """Returns None / raises for the first attempts; every attempt reports token usage."""
+    def __init__(self, outcomes):
+        super().__init__(api_key='test')
+        self.model = 'fake'
+        self.outcomes = list(outcomes)
+
+    def extract_data_from_image(self, image_path):
+        self.last_usage = {'input_tokens': 100, 'output_tokens': 10}
+        outcome = self.outcomes.pop(0)
+        if isinstance(outcome, Exception):
+            raise outcome
+        return outcome
+
+
+def test_usage_adds_up_over_retries():
+    service = FlakyService([None, Exception('timeout'), {'order_id': 'A1'}])
+    assert service.extract_with_retry('slip.jpg', max_retries=2, delay=0) == {'order_id': 'A1'}
+    assert service.last_usage == {'input_tokens': 300, 'output_tokens': 30}
+
+
+def test_usage_of_failed_extraction_is_kept():
+    service = FlakyService([None, None])
+    assert service.extract_with_retry('slip.jpg', max_retries=1, delay=0) is None
+    assert service.last_usage == {'input_tokens': 200, 'output_tokens': 20}
@@ -0,0 +1,85 @@
+import pytest
+
+from services import analytics_store
+from services.analytics_store import AnalyticsStore
+
+HEADER = ['Order ID', 'ชื่อร้าน', 'Platform', 'ราคาของ', 'Coins', 'Status']
+
+
+class FakeWorksheet:
+    def __init__(self, title):
+        self.title = title
+
+
+class FakeSpreadsheet:
+    """Tabs as {title: rows}; counts values.batchGet calls."""
+    def __init__(self, tabs, modified='2026-05-01T00:00:00Z'):
+        self.tabs = tabs
+        self.modified = modified
+        self.batch_gets = []
+
+    def get_lastUpdateTime(self):
+        return self.modified
+
+    def worksheets(self):
+        return [FakeWorksheet(t) for t in self.tabs]
+
+    def values_batch_get(self, ranges):
+        self.batch_gets.append(ranges)
+        titles = [r.strip("'") for r in ranges]
+        return {'valueRanges': [{'values': self.tabs[t]} for t in titles]}
+
+
+class FakeClient:
+    def __init__(self, spreadsheet):
+        self.spreadsheet = spreadsheet
+
+    def open_by_key(self, key):
+        return self.spreadsheet
+
+
+def make_tabs():
+    return {
+        'April': [HEADER, ['A1', 'Shop A', 'Shopee', '1,000', '50', 'Checked'],
+                  ['A2', 'Shop B', 'Lazada', '300', '0', 'Cancelled']],
+        'May': [HEADER, ['B1', 'Shop A', 'Lazada', '฿200', '', 'Pending'], ['', '', '', '', '', '']],
+        '_GravityConfig': [['Key', 'Value']],
+    }
+
+
+def test_refresh_reads_tabs_in_batches_and_skips_unchanged(tmp_path, monkeypatch):
+    monkeypatch.setattr(analytics_store, 'BATCH_TABS', 1)
+    store = AnalyticsStore(str(tmp_path / 'analytics.db'))
+    spreadsheet = FakeSpreadsheet(make_tabs())
+
+    summary = store.refresh(FakeClient(spreadsheet), 'sid')
+    assert summary['sheets'] == 2 and summary['batches'] == 2 and sorted(summary['changed']) == ['April', 'May']
+    assert [s['title'] for s in store.sheets()] == ['April', 'May']
+    assert store.row_count() == 3  # Blank row skipped, _ tabs ignored
+
+    # Drive modifiedTime unchanged: nothing is read
+    assert store.refresh(FakeClient(spreadsheet), 'sid')['skipped'] == 'spreadsheet unchanged'
+    assert len(spreadsheet.batch_gets) == 2
+
+    # Changed: only the tab whose content changed is rewritten; removed tabs are dropped
+    spreadsheet.tabs['May'].append(['B2', 'Shop C', 'Shopee', '50', '0', 'Saved'])
+    del spreadsheet.tabs['April']
+    spreadsheet.modified = '2026-05-02T00:00:00Z'
+    assert store.refresh(FakeClient(spreadsheet), 'sid')['changed'] == ['May']
+    assert [s['title'] for s in store.sheets()] == ['May'] and store.row_count() == 2
+
+
+def test_totals_group_and_filter(tmp_path):
+    store = AnalyticsStore(str(tmp_path / 'analytics.db'))
+    store.refresh(FakeClient(FakeSpreadsheet(make_tabs())), 'sid')
+
+    by_shop = store.totals('shop')
+    assert by_shop == [{'shop': 'Shop A', 'orders': 2, 'price': 1200.0, 'coins': 50.0, 'net': 1150.0}]
+    assert {r['shop'] for r in store.totals('shop', include_cancelled=True)} == {'Shop A', 'Shop B'}
+    assert [r['sheet'] for r in store.totals('sheet')] == ['April', 'May']
+    assert [r['sheet'] for r in store.totals('sheet', since='May')] == ['May']
+    assert store.totals('platform', sheets=['May']) == [
+        {'platform': 'Lazada', 'orders': 1, 'price': 200.0, 'coins': 0.0, 'net': 200.0}
+    ]
+    with pytest.raises(ValueError):
+        store.totals('name')
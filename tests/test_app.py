@@ -0,0 +1,101 @@
+import gzip
+import json
+from types import SimpleNamespace
+
+import pytest
+
+from services.config_service import ConfigService
+from services.payload_cache import PayloadCache
+
+
+@pytest.fixture
+def app_module(tmp_path, monkeypatch):
+    import routes.bot as bot
+    monkeypatch.setattr(bot, 'EXTRACTION_WORKER', 'external')  # Importing app must not start a queue consumer
+    import app as app_module
+    monkeypatch.setattr(app_module, '_config_service_instance', ConfigService(str(tmp_path / 'config.json')))
+    monkeypatch.setattr(app_module, 'order_payloads', PayloadCache())
+    return app_module
+
+@pytest.fixture
+def client(app_module):
+    return app_module.app.test_client()
+
+def serve_snapshot(app_module, monkeypatch, records, version):
+    snapshot = SimpleNamespace(sheet='Sheet1', version=version, records=records)
+    monkeypatch.setattr(app_module.order_snapshots, 'get', lambda sheet: snapshot)
+
+
+def test_orders_etag_and_not_modified(app_module, client, monkeypatch):
+    records = [{'Order ID': 'A1', 'Status': 'Pending'}]
+    serve_snapshot(app_module, monkeypatch, records, version=1)
+
+    first = client.get('/api/orders')
+    assert first.status_code == 200 and first.json == records
+    etag = first.headers['ETag']
+    assert first.headers['Cache-Control'] == 'no-cache'
+
+    again = client.get('/api/orders', headers={'If-None-Match': etag})
+    assert again.status_code == 304 and again.data == b''
+
+    # Same records under another version number (restart, other worker): same ETag
+    serve_snapshot(app_module, monkeypatch, list(records), version=7)
+    assert client.get('/api/orders', headers={'If-None-Match': etag}).status_code == 304
+
+    serve_snapshot(app_module, monkeypatch, [{'Order ID': 'A1', 'Status': 'Checked'}], version=8)
+    changed = client.get('/api/orders', headers={'If-None-Match': etag})
+    assert changed.status_code == 200 and changed.headers['ETag'] != etag
+
+
+def test_orders_are_compressed_when_accepted(app_module, client, monkeypatch):
+    records = [{'Order ID': f'A{i}', 'ร้าน': 'ทดสอบ'} for i in range(50)]
+    serve_snapshot(app_module, monkeypatch, records, version=1)
+
+    resp = client.get('/api/orders', headers={'Accept-Encoding': 'gzip'})
+    assert resp.headers['Content-Encoding'] == 'gzip'
+    assert resp.headers['Vary'] == 'Accept-Encoding'
+    assert json.loads(gzip.decompress(resp.data)) == records
+
+
+def test_image_proxy_passes_range_responses_through(app_module, client, monkeypatch):
+    import services.auth_service as auth_service
+    seen = {}
+
+    class FakeDrive:
+        def __init__(self, credentials):
+            pass
+
+        def open_media_stream(self, file_id, request_headers):
+            seen['range'] = request_headers.get('Range')
+            if file_id == 'gone':
+                return None
+            return 206, {'Content-Type': 'image/jpeg', 'Content-Range': 'bytes 0-3/10'}, iter([b'ab', b'cd'])
+
+    monkeypatch.setattr(auth_service, 'get_google_credentials', lambda: object())
+    monkeypatch.setattr(app_module, 'DriveService', FakeDrive)
+
+    resp = client.get('/api/proxy_image/f1', headers={'Range': 'bytes=0-3'})
+    assert seen['range'] == 'bytes=0-3'
+    assert resp.status_code == 206 and resp.data == b'abcd'
+    assert resp.headers['Content-Range'] == 'bytes 0-3/10'
+    assert resp.headers['Accept-Ranges'] == 'bytes'
+    assert resp.headers['Cache-Control'] == 'private, max-age=86400'
+    assert client.get('/api/proxy_image/gone').status_code == 404
+
+
+def test_metrics_endpoint_renders_prometheus_text(client):
+    resp = client.get('/metrics')
+    assert resp.status_code == 200 and resp.mimetype == 'text/plain'
+    assert 'gravity_process_start_time_seconds' in resp.get_data(as_text=True)
+
+
+def test_debug_endpoints_need_the_token(client, monkeypatch):
+    monkeypatch.delenv('DEBUG_TOKEN', raising=False)
+    assert client.get('/debug/events').status_code == 403  # Unset token: always closed
+
+    monkeypatch.setenv('DEBUG_TOKEN', 'sesame')
+    assert client.get('/debug/events', headers={'X-Debug-Token': 'wrong'}).status_code == 403
+    assert client.get('/debug/snapshots').status_code == 403
+    assert client.get('/debug/events', headers={'X-Debug-Token': 'sesame'}).status_code == 200
+    assert client.get('/debug/events?token=sesame&limit=abc').status_code == 400
+    assert client.get('/debug/events?token=sesame&limit=0').status_code == 400
@@ -0,0 +1,90 @@
+"""Dashboard search / virtual list logic in static/js/app.js, run under node with a stub DOM."""
+import json
+import os
+import shutil
+import subprocess
+
+import pytest
+
+from services.change_feed import order_key
+
+APP_JS = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'static', 'js', 'app.js')
+
+HARNESS = r"""
+const vm = require('vm');
+const fs = require('fs');
+// Every element sits at the top of the page
+const element = () => ({
+    innerText: '', innerHTML: '', value: '', style: {}, classList: { add() {}, remove() {}, toggle() {} },
+    getBoundingClientRect: () => ({ top: -ctx.window.scrollY }), querySelectorAll: () => [], querySelector: () => null,
+    addEventListener() {},
+});
+const elements = {};
+const ctx = {
+    console, setTimeout, clearTimeout, requestAnimationFrame: f => f(),
+    document: { addEventListener() {}, getElementById: id => elements[id] || (elements[id] = element()), querySelectorAll: () => [] },
+    window: { innerWidth: 1200, innerHeight: 1000, scrollY: 0, addEventListener() {} },
+};
+vm.createContext(ctx);
+vm.runInContext(fs.readFileSync(process.argv[1], 'utf8'), ctx);
+vm.runInContext('processRecoveryQueue = () => {};', ctx);  // No /api/find_image calls
+process.stdout.write(JSON.stringify(vm.runInContext(process.argv[2], ctx)));
+"""
+
+ORDERS = [
+    {'Order ID': 'A1', 'Name': 'Somchai', 'Shop': 'Shop A', 'Platform': 'Shopee', 'Status': 'Checked', 'DirectImage': 'x'},
+    {'Order ID': 'A2', 'Name': 'Somsri', 'Shop': 'iStudio', 'Platform': 'Lazada', 'Status': '', 'DirectImage': ''},
+    {'Order ID': '', 'Run No': '7', 'Name': 'Nok', 'Shop': 'Shop B', 'Platform': 'Shopee', 'Status': 'Cancelled'},
+]
+
+
+def run_js(script):
+    node = shutil.which('node')
+    if node is None:
+        pytest.skip('node is not installed')
+    setup = f"allOrders = {json.dumps(ORDERS)}; buildSearchIndex();\n"
+    out = subprocess.run([node, '-e', HARNESS, APP_JS, setup + script], capture_output=True, text=True, timeout=30)
+    assert out.returncode == 0, out.stderr
+    return json.loads(out.stdout)
+
+
+def test_search_narrows_previous_matches_and_filters():
+    result = run_js("""
+        const ids = () => visibleOrders.map(o => o['Order ID'] || o['Run No']);
+        const r = {};
+        filterOrders('som'); r.som = ids();
+        filterOrders('soms'); r.narrowed = ids(); r.narrowedFrom = lastSearch.matches.length;
+        filterOrders('somchaishop'); r.acrossFields = ids();
+        currentFilterStatus = 'cancelled'; filterOrders(''); r.cancelled = ids();
+        currentFilterStatus = 'all'; selectedPlatforms = ['shopee']; filterOrders('s'); r.shopee = ids();
+        r.count = document.getElementById('order-count').innerText;
+        r;
+    """)
+    assert result['som'] == ['A1', 'A2']
+    assert result['narrowed'] == ['A2']
+    assert result['acrossFields'] == []  # A query never matches across two fields
+    assert result['cancelled'] == ['7']
+    assert result['shopee'] == ['A1', '7'] and result['count'] == 2
+
+
+def test_virtual_window_and_on_screen_recovery():
+    result = run_js("""
+        allOrders = Array.from({ length: 300 }, (_, i) => ({ 'Order ID': 'O' + i, DirectImage: i === 250 ? '' : 'x' }));
+        buildSearchIndex();
+        renderOrders(allOrders);
+        const r = { range: [virtualRange.start, virtualRange.end, virtualRange.cols], candidate: nextRecoveryCandidate() };
+        window.scrollY = 360 * 82; renderVirtualWindow();
+        r.scrolled = [virtualRange.start, virtualRange.end];
+        r.candidate2 = nextRecoveryCandidate()['Order ID'];
+        r;
+    """)
+    # 3 columns, 1000px / 360px rows + 4 overscan rows: only a window of cards is rendered
+    assert result['range'] == [0, 21, 3]
+    assert result['candidate'] is None  # The card without an image is off-screen
+    assert result['scrolled'][0] <= 250 < result['scrolled'][1]
+    assert result['candidate2'] == 'O250'
+
+
+def test_order_key_matches_the_server():
+    keys = run_js("allOrders.map(orderKey).concat([orderKey({'Order ID': ' ', 'Run No': ''})]);")
+    assert keys == [order_key(o) for o in ORDERS] + [None]
@@ -0,0 +1,96 @@
+import datetime
+import threading
+import time
+
+from services.auth_service import CredentialManager
+
+
+def utcnow():
+    return datetime.datetime.utcnow()
+
+
+class FakeCreds:
+    """Stands in for google.oauth2 Credentials: refresh() can fail or be slow."""
+    def __init__(self, expires_in, fail=False, delay=0):
+        self.refresh_token = 'refresh'
+        self.expiry = utcnow() + datetime.timedelta(seconds=expires_in)
+        self.fail = fail
+        self.delay = delay
+        self.calls = 0
+
+    @property
+    def valid(self):
+        return self.expiry > utcnow()
+
+    def refresh(self, request):
+        self.calls += 1
+        time.sleep(self.delay)
+        if self.fail:
+            raise Exception('invalid_grant: Token has been expired or revoked.')
+        self.expiry = utcnow() + datetime.timedelta(seconds=3600)
+
+
+def make_manager(creds, retry_delay=0.5):
+    manager = CredentialManager(loader=lambda: creds)
+    manager.RETRY_DELAY = retry_delay
+    manager._session = object()  # Skip building a real AuthorizedSession
+    return manager
+
+
+def wait_for(predicate, timeout=2):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        if predicate():
+            return True
+        time.sleep(0.01)
+    return False
+
+
+def test_background_refresh_inside_margin():
+    creds = FakeCreds(expires_in=60)  # Valid, but within REFRESH_MARGIN
+    manager = make_manager(creds)
+    assert manager.credentials() is creds
+    assert wait_for(lambda: manager.last_refresh is not None)
+    assert creds.calls == 1
+    assert manager.seconds_until_refresh() > 0
+    assert manager.last_error is None
+
+
+def test_failing_refresh_does_not_block_valid_callers():
+    creds = FakeCreds(expires_in=60, fail=True, delay=0.2)
+    manager = make_manager(creds, retry_delay=0.5)
+    manager.credentials()
+    assert wait_for(lambda: creds.calls >= 1)
+    # The refresher is failing and backing off: callers with a still-valid token never wait on it
+    for _ in range(20):
+        start = time.perf_counter()
+        manager.authorized_session()
+        assert time.perf_counter() - start < 0.05
+        time.sleep(0.02)
+    assert 'invalid_grant' in manager.last_error
+
+
+def test_expired_token_retries_at_most_once_per_retry_delay():
+    creds = FakeCreds(expires_in=-10, fail=True)
+    manager = make_manager(creds, retry_delay=60)
+    manager.credentials()
+    assert wait_for(lambda: creds.calls >= 1)
+    calls = creds.calls
+    start = time.perf_counter()
+    for _ in range(10):
+        manager.credentials()
+    assert time.perf_counter() - start < 0.05
+    assert creds.calls == calls
+
+
+def test_concurrent_expired_callers_share_one_refresh():
+    creds = FakeCreds(expires_in=-10, delay=0.2)
+    manager = CredentialManager(loader=lambda: creds)
+    manager._creds = creds  # Loaded, refresher not started: callers refresh themselves
+    threads = [threading.Thread(target=manager.credentials) for _ in range(8)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    assert creds.calls == 1
+    assert creds.valid
@@ -0,0 +1,52 @@
+from services.change_feed import ChangeFeed, diff_orders, order_key
+
+
+def test_order_key_falls_back_to_run_no():
+    assert order_key({'Order ID': ' A1 ', 'Run No': '5'}) == 'A1'
+    assert order_key({'Order ID': '', 'Run No': '5'}) == 'run:5'
+    assert order_key({'Order ID': '', 'Run No': ''}) is None
+
+
+def test_diff_orders_kinds():
+    old = [
+        {'Order ID': 'A1', 'Status': 'Pending', 'DirectImage': ''},
+        {'Order ID': 'A2', 'Status': 'Pending', 'DirectImage': ''},
+        {'Order ID': 'A3', 'Status': 'Pending', 'Name': 'x'},
+        {'Order ID': 'A4', 'Status': 'Pending'},
+    ]
+    new = [
+        {'Order ID': 'A1', 'Status': 'Checked', 'DirectImage': ''},
+        {'Order ID': 'A2', 'Status': 'Pending', 'DirectImage': 'https://img'},
+        {'Order ID': 'A3', 'Status': 'Pending', 'Name': 'y'},
+        {'Order ID': 'A5', 'Status': 'Pending'},
+    ]
+    changes = {key: (kind, payload) for kind, key, payload in diff_orders(old, new)}
+    assert changes['A1'] == ('status_changed', {'Status': 'Checked'})
+    assert changes['A2'] == ('image_recovered', {'DirectImage': 'https://img'})
+    assert changes['A3'] == ('order_updated', {'Name': 'y'})
+    assert changes['A4'] == ('order_removed', None)
+    assert changes['A5'][0] == 'order_added'
+
+
+def test_diff_orders_ignores_local_fields_and_untracked_rows():
+    old = [{'Order ID': 'A1', 'RawImageLink': 'a'}, {'Order ID': '', 'Run No': ''}]
+    new = [{'Order ID': 'A1', 'RawImageLink': 'b'}, {'Order ID': '', 'Run No': '', 'Name': 'z'}]
+    assert diff_orders(old, new) == []
+
+
+def test_first_snapshot_is_baseline_then_deltas_published():
+    feed = ChangeFeed()
+    feed.publish_snapshot('May', [{'Order ID': 'A1', 'Status': 'Pending'}])
+    baseline = feed.last_seq
+    feed.publish_snapshot('May', [{'Order ID': 'A1', 'Status': 'Checked'}])
+    assert feed.last_seq == baseline + 1
+    batch = feed.wait(baseline, 0)
+    assert [(e['kind'], e['key']) for e in batch] == [('status_changed', 'A1')]
+
+
+def test_since_returns_none_once_events_fell_out_of_the_buffer():
+    feed = ChangeFeed(capacity=2)
+    for i in range(3):
+        feed.publish_change('status_changed', 'May', f'A{i}', {'Status': 'Checked'}, persist=False)
+    assert feed.since(0) is None
+    assert [e['key'] for e in feed.since(1)] == ['A1', 'A2']
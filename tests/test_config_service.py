@@ -0,0 +1,90 @@
+from gspread.utils import a1_range_to_grid_range
+
+from services.config_service import ConfigService
+
+
+class FakeWorksheet:
+    """_GravityConfig as a list of rows; counts every write call."""
+    def __init__(self, rows):
+        self.rows = [list(r) for r in rows]
+        self.writes = 0
+        self.row_count = 50
+
+    def get_all_values(self):
+        return [list(r) for r in self.rows]
+
+    def get(self, range_name):
+        grid = a1_range_to_grid_range(range_name)
+        return [r[grid['startColumnIndex']:grid['endColumnIndex']]
+                for r in self.rows[grid['startRowIndex']:grid['endRowIndex']]]
+
+    def _put(self, range_name, values):
+        grid = a1_range_to_grid_range(range_name)
+        for i, row in enumerate(values):
+            idx = grid['startRowIndex'] + i
+            self.rows += [[] for _ in range(idx + 1 - len(self.rows))]
+            cells = self.rows[idx] + [''] * (grid['startColumnIndex'] + len(row) - len(self.rows[idx]))
+            cells[grid['startColumnIndex']:grid['startColumnIndex'] + len(row)] = row
+            self.rows[idx] = cells
+
+    def update(self, range_name, values):
+        self.writes += 1
+        self._put(range_name, values)
+
+    def insert_rows(self, values, row=1):
+        self.writes += 1
+        self.rows[row - 1:row - 1] = [list(v) for v in values]
+
+    def batch_update(self, data):
+        self.writes += 1
+        for entry in data:
+            self._put(entry['range'], entry['values'])
+
+    def add_rows(self, rows):
+        self.row_count += rows
+
+
+class FakeClient:
+    def __init__(self, ws):
+        self.ws = ws
+
+    def open_by_key(self, key):
+        return self
+
+    def worksheet(self, title):
+        return self.ws
+
+
+def make_config(tmp_path):
+    return ConfigService(str(tmp_path / 'config.json'))
+
+
+def test_sync_from_old_layout_does_not_write(tmp_path):
+    ws = FakeWorksheet([['Key', 'Value'], ['SHEET_FOLDER_MAP_May', 'folder-may']])
+    cfg = make_config(tmp_path)
+
+    assert cfg.sync_from_gsheets(FakeClient(ws), 'sid')
+    assert ws.writes == 0
+    assert cfg.get('SHEET_FOLDER_MAP') == {'May': 'folder-may'}
+
+
+def test_sync_to_empty_tab_puts_header_first(tmp_path):
+    ws = FakeWorksheet([])
+    cfg = make_config(tmp_path)
+    cfg.set_folder_for_sheet('May', 'folder-may')
+
+    assert cfg.sync_to_gsheets(FakeClient(ws), 'sid', 'May')
+    assert ws.rows[0] == ['Key', 'Value']
+    assert ws.rows[1][0] == ConfigService.VERSION_KEY
+    assert ws.rows[2][0] == ConfigService.UPDATED_AT_KEY
+    assert ws.rows[3] == ['SHEET_FOLDER_MAP_May', 'folder-may']
+
+
+def test_sync_to_old_layout_repairs_and_upserts(tmp_path):
+    ws = FakeWorksheet([['Key', 'Value'], ['SHEET_FOLDER_MAP_May', 'old-folder']])
+    cfg = make_config(tmp_path)
+    cfg.set_folder_for_sheet('May', 'new-folder')
+
+    assert cfg.sync_to_gsheets(FakeClient(ws), 'sid', 'May')
+    assert [r[0] for r in ws.rows] == ['Key', ConfigService.VERSION_KEY, ConfigService.UPDATED_AT_KEY, 'SHEET_FOLDER_MAP_May']
+    assert ws.rows[3][1] == 'new-folder'
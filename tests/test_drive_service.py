@@ -0,0 +1,92 @@
+import pytest
+
+from services.drive_service import DriveService
+
+
+class FakeResponse:
+    def __init__(self, status_code, body=b'', headers=None):
+        self.status_code = status_code
+        self.body = body
+        self.headers = headers or {}
+        self.text = body.decode('utf-8', errors='ignore')
+        self.closed = False
+
+    def iter_content(self, chunk_size):
+        for i in range(0, len(self.body), chunk_size):
+            yield self.body[i:i + chunk_size]
+
+    def close(self):
+        self.closed = True
+
+
+class FakeSession:
+    def __init__(self, response):
+        self.response = response
+        self.requests = []
+
+    def get(self, url, headers, stream, timeout):
+        self.requests.append((url, headers, stream))
+        return self.response
+
+
+def make_drive(monkeypatch, response):
+    session = FakeSession(response)
+    drive = DriveService.__new__(DriveService)
+    drive.credentials = object()
+    monkeypatch.setattr(drive, '_media_session', lambda: session)
+    return drive, session
+
+
+def test_range_is_forwarded_and_partial_content_streamed(monkeypatch):
+    body = bytes(range(256)) * 40
+    response = FakeResponse(206, body, {'Content-Type': 'image/jpeg', 'Content-Range': 'bytes 0-10239/20000',
+                                        'Content-Length': str(len(body)), 'Set-Cookie': 'x'})
+    drive, session = make_drive(monkeypatch, response)
+
+    status, headers, chunks = drive.open_media_stream('file/1', {'Range': 'bytes=0-10239', 'Cookie': 'c'}, chunk_size=4096)
+    url, sent, stream = session.requests[0]
+    assert '/files/file%2F1?alt=media' in url and stream
+    assert sent == {'Accept-Encoding': 'identity', 'Range': 'bytes=0-10239'}
+    assert status == 206
+    assert headers == {'Content-Type': 'image/jpeg', 'Content-Length': str(len(body)), 'Content-Range': 'bytes 0-10239/20000'}
+
+    pieces = list(chunks)
+    assert [len(p) for p in pieces] == [4096, 4096, 2048] and b''.join(pieces) == body
+    assert response.closed
+
+
+def test_missing_file_and_errors(monkeypatch):
+    drive, _ = make_drive(monkeypatch, FakeResponse(404))
+    assert drive.open_media_stream('gone') is None
+
+    drive, _ = make_drive(monkeypatch, FakeResponse(403, b'forbidden'))
+    with pytest.raises(Exception, match='403'):
+        drive.open_media_stream('private')
+
+
+def test_drive_clients_are_built_once_per_thread_and_credentials(monkeypatch):
+    import threading
+
+    from google.oauth2.credentials import Credentials
+    from googleapiclient import discovery_cache
+
+    from services import drive_service
+
+    loads = []
+    static_doc = discovery_cache.get_static_doc
+    monkeypatch.setattr(drive_service, '_discovery_doc', None)
+    monkeypatch.setattr(discovery_cache, 'get_static_doc', lambda *args: loads.append(args) or static_doc(*args))
+    monkeypatch.setattr(drive_service, '_thread_local', threading.local())
+
+    creds, other_creds = Credentials(token='t1'), Credentials(token='t2')
+    client = DriveService(creds).service
+    assert client is not None
+    assert DriveService(creds).service is client  # Reused by a later DriveService on this thread
+    assert DriveService(other_creds).service is not client
+
+    elsewhere = []
+    thread = threading.Thread(target=lambda: elsewhere.append(DriveService(creds).service))
+    thread.start()
+    thread.join()
+    assert elsewhere[0] is not client  # httplib2 connections are not shared across threads
+    assert loads == [('drive', 'v3')]  # The discovery document is parsed once per process
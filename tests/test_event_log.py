@@ -0,0 +1,69 @@
+import io
+import json
+import time
+
+from services.event_log import EventLogger
+
+
+def make_logger(**kwargs):
+    stream = io.StringIO()
+    return EventLogger(stream=stream, buffer_size=100, **kwargs), stream
+
+def wait_for_lines(stream, n):
+    deadline = time.time() + 2
+    while time.time() < deadline:
+        lines = stream.getvalue().splitlines()
+        if len(lines) >= n:
+            return [json.loads(line) for line in lines]
+        time.sleep(0.01)
+    raise AssertionError(f"expected {n} lines, got {stream.getvalue()!r}")
+
+
+def test_events_below_level_are_dropped():
+    events, _ = make_logger(level='info', stream_level='error')
+    events.debug('noisy', n=1)
+    events.info('job_started', images=2)
+    events.warning('job_retry', attempt=1)
+    assert [r['event'] for r in events.recent()] == ['job_started', 'job_retry']
+
+    events.set_level('debug')
+    events.debug('noisy', n=2)
+    assert events.recent()[-1]['n'] == 2
+    events.set_level('nonsense')  # Unknown level: unchanged
+    assert events.level_name == 'debug'
+
+
+def test_recent_filters_by_level_event_and_seq():
+    events, _ = make_logger(level='debug', stream_level='error')
+    for i in range(5):
+        events.info('orders_fetched', i=i)
+    events.warning('orders_slow')
+    events.debug('search', hits=3)
+
+    assert [r['event'] for r in events.recent(level='warning')] == ['orders_slow']
+    assert len(events.recent(event='orders')) == 6
+    since = events.recent()[3]['seq']
+    assert [r['seq'] for r in events.recent(since=since)] == [since + 1, since + 2, since + 3]
+    assert len(events.recent(limit=2)) == 2
+
+
+def test_stream_gets_json_lines_at_stream_level():
+    events, stream = make_logger(level='debug', stream_level='warning')
+    events.info('kept_in_buffer_only')
+    events.warning('sheet_write_slow', seconds=2.5)
+    try:
+        raise RuntimeError('boom')
+    except RuntimeError:
+        events.exception('job_failed', user_id='U1')
+
+    warning, error = wait_for_lines(stream, 2)
+    assert warning['event'] == 'sheet_write_slow' and warning['level'] == 'warning'
+    assert error['event'] == 'job_failed' and 'RuntimeError: boom' in error['traceback']
+    assert len(events.recent()) == 3
+
+
+def test_debug_sampling_counts_dropped_events():
+    events, _ = make_logger(level='debug', debug_sample=0)
+    for _ in range(10):
+        events.debug('barcode_decoded')
+    assert events.dropped == 10 and events.recent() == []
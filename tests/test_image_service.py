@@ -0,0 +1,38 @@
+from services import image_service
+from services.image_service import ImageService
+
+
+def test_reconcile_code_prefers_a_close_barcode():
+    codes = ['250519ABC1234']
+    # One OCR slip (0 read as O): the barcode value wins
+    assert ImageService.reconcile_code('25O519ABC1234', codes) == '250519ABC1234'
+    # Too different, or a different length: the AI value is kept
+    assert ImageService.reconcile_code('991234XYZ0000', codes) == '991234XYZ0000'
+    assert ImageService.reconcile_code('250519ABC123', codes) == '250519ABC123'
+    assert ImageService.reconcile_code(None, codes) is None
+    assert ImageService.reconcile_code('X1', []) == 'X1'
+
+
+def test_decode_barcodes_without_pyzbar_is_empty(monkeypatch):
+    monkeypatch.setattr(image_service, 'zbar_decode', None)
+    service = ImageService.__new__(ImageService)
+    assert not service.barcode_enabled
+    assert service.decode_barcodes(['missing.jpg']) == []
+
+
+def test_decode_barcodes_logs_counts_not_codes(monkeypatch, tmp_path):
+    from PIL import Image
+
+    class Symbol:
+        def __init__(self, data):
+            self.data = data
+
+    path = tmp_path / 'slip.jpg'
+    Image.new('RGB', (8, 8)).save(path)
+    monkeypatch.setattr(image_service, 'zbar_decode', lambda img: [Symbol(b'TH0123456789'), Symbol(b'TH0123456789')])
+    logged = []
+    monkeypatch.setattr(image_service.events, 'debug', lambda name, **fields: logged.append((name, fields)))
+
+    service = ImageService.__new__(ImageService)
+    assert service.decode_barcodes([str(path)]) == ['TH0123456789']
+    assert logged == [('barcode_decoded', {'images': 1, 'codes': 1})]
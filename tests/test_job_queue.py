@@ -0,0 +1,139 @@
+import time
+
+import pytest
+
+from services import job_queue as jq
+from services.job_queue import JobQueue, JobWorker, MAX_ATTEMPTS
+
+
+@pytest.fixture
+def queue(tmp_path):
+    return JobQueue(str(tmp_path / 'jobs.db'))
+
+def make_ready(queue):
+    # Skip the retry backoff
+    queue._conn().execute("UPDATE jobs SET available_at = 0")
+
+
+def test_lease_hands_each_job_to_one_consumer(queue):
+    job_id = queue.enqueue('process_images', {'user_id': 'U1'})
+    job = queue.lease('w1')
+    assert job['id'] == job_id and job['payload'] == {'user_id': 'U1'} and job['attempts'] == 1
+    assert queue.lease('w2') is None
+    queue.complete(job_id)
+    assert queue.stats() == {'done': 1}
+
+
+def test_failures_back_off_then_go_dead(queue):
+    job_id = queue.enqueue('k', {})
+    for attempt in range(1, MAX_ATTEMPTS + 1):
+        make_ready(queue)
+        job = queue.lease('w1')
+        assert job['attempts'] == attempt
+        status = queue.fail(job_id, Exception('boom'), job['attempts'])
+        assert status == ('dead' if attempt == MAX_ATTEMPTS else 'queued')
+        if status == 'queued':
+            assert queue.lease('w1') is None  # Still backing off
+    make_ready(queue)
+    assert queue.lease('w1') is None
+    assert queue.stats() == {'dead': 1}
+
+
+def test_expired_lease_is_handed_out_again_unless_renewed(queue):
+    job_id = queue.enqueue('k', {})
+    queue.lease('w1', lease_seconds=-1)
+    assert queue.lease('w2')['id'] == job_id
+    # w1 lost the job: it cannot renew it any more
+    assert queue.renew(job_id, 'w1') is False
+    assert queue.renew(job_id, 'w2') is True
+    assert queue.lease('w3') is None
+
+
+def test_worker_passes_attempt_and_retries_raising_handlers(queue):
+    seen = []
+    def handler(payload, attempt):
+        seen.append(attempt)
+        if attempt < 2:
+            raise Exception('APIError: [429]')
+    worker = JobWorker(queue, {'k': handler})
+    job_id = queue.enqueue('k', {})
+
+    worker.run_job(queue.lease('w1'), 'w1')
+    assert queue.stats() == {'queued': 1}
+    make_ready(queue)
+    worker.run_job(queue.lease('w1'), 'w1')
+    assert seen == [1, 2]
+    assert queue.stats() == {'done': 1}
+
+
+def test_worker_renews_lease_while_handler_runs(queue, monkeypatch):
+    monkeypatch.setattr(jq, 'RENEW_SECONDS', 0.05)
+    queue.enqueue('k', {})
+    job = queue.lease('w1', lease_seconds=0.2)
+    worker = JobWorker(queue, {'k': lambda payload, attempt: time.sleep(0.5)})
+    worker.run_job(job, 'w1')
+    assert queue.stats() == {'done': 1}
+
+
+def test_process_images_job_retries_transient_errors_quietly(monkeypatch):
+    import routes.bot as bot
+
+    sent = []
+    monkeypatch.setattr(bot, 'send_messages', lambda token, user_id, messages: sent.append(messages[0].text))
+    def provider():
+        raise Exception('APIError: [429]: Quota exceeded')
+    monkeypatch.setattr(bot, 'get_service_provider', provider)
+
+    with pytest.raises(Exception):
+        bot.process_images_job('U1', ['m1'], 'token', attempt=1)
+    assert sent == []
+
+    # Last attempt: the user is told, and the error still reaches the queue ('dead')
+    with pytest.raises(Exception):
+        bot.process_images_job('U1', ['m1'], 'token', attempt=MAX_ATTEMPTS)
+    assert len(sent) == 1
+
+    # Not worth retrying: reported at once, the job completes
+    def broken():
+        raise ValueError('ไม่พบเลขออเดอร์ในรูปภาพ')
+    monkeypatch.setattr(bot, 'get_service_provider', broken)
+    bot.process_images_job('U1', ['m1'], 'token', attempt=1)
+    assert len(sent) == 2
+
+
+@pytest.fixture
+def redis_queues():
+    fakeredis = pytest.importorskip('fakeredis')
+    server = fakeredis.FakeServer()
+    # Two handles on one server: the web service and the worker service
+    return [jq.RedisJobQueue('redis://', client=fakeredis.FakeRedis(server=server, decode_responses=True))
+            for _ in range(2)]
+
+
+def test_redis_queue_is_shared_between_processes(redis_queues):
+    web, worker = redis_queues
+    job_id = web.enqueue('process_images', {'user_id': 'U1'})
+    worker.wait(1)  # Woken by the other handle's enqueue, not by the timeout
+    job = worker.lease('w1')
+    assert job['id'] == job_id and job['payload'] == {'user_id': 'U1'} and job['attempts'] == 1
+    assert web.lease('w2') is None
+    worker.complete(job_id)
+    assert web.stats() == {'done': 1}
+
+
+def test_redis_queue_backs_off_expires_and_goes_dead(redis_queues):
+    queue = redis_queues[0]
+    job_id = queue.enqueue('k', {})
+    job = queue.lease('w1')
+    assert queue.fail(job_id, Exception('boom'), job['attempts']) == 'queued'
+    assert queue.lease('w1') is None  # Still backing off
+    queue.client.zadd(queue._key('queued'), {job_id: 0})
+
+    queue.lease('w1', lease_seconds=-1)
+    job = queue.lease('w2')
+    assert job['id'] == job_id and job['attempts'] == MAX_ATTEMPTS
+    assert queue.renew(job_id, 'w1') is False
+    assert queue.renew(job_id, 'w2') is True
+    assert queue.fail(job_id, Exception('boom'), job['attempts']) == 'dead'
+    assert queue.lease('w3') is None
+    assert queue.stats() == {'dead': 1}
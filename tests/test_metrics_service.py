@@ -0,0 +1,34 @@
+import pytest
+
+from services.metrics_service import MetricsRegistry
+
+
+def test_span_records_duration_outcome_and_size():
+    metrics = MetricsRegistry()
+    with metrics.span('line_download') as span:
+        span.size = 120_000
+    with metrics.span('ai_extraction') as span:
+        span.outcome = 'empty'
+    with pytest.raises(ValueError):
+        with metrics.span('ai_extraction'):
+            raise ValueError('boom')
+
+    text = metrics.render_prometheus()
+    assert 'gravity_stage_total{stage="line_download",outcome="ok"} 1' in text
+    assert 'gravity_stage_total{stage="ai_extraction",outcome="empty"} 1' in text
+    assert 'gravity_stage_total{stage="ai_extraction",outcome="error"} 1' in text
+    assert 'gravity_stage_duration_seconds_count{stage="ai_extraction"} 2' in text
+    assert 'gravity_stage_payload_bytes_bucket{stage="line_download",le="100000"} 0' in text
+    assert 'gravity_stage_payload_bytes_bucket{stage="line_download",le="250000"} 1' in text
+
+
+def test_histogram_buckets_are_cumulative():
+    metrics = MetricsRegistry()
+    for seconds in (0.005, 0.3, 7, 120):
+        metrics.observe('pipeline', seconds)
+    lines = metrics.render_prometheus().splitlines()
+    buckets = [line for line in lines if line.startswith('gravity_stage_duration_seconds_bucket{stage="pipeline"')]
+    counts = [int(line.rsplit(' ', 1)[1]) for line in buckets]
+    assert counts == sorted(counts)
+    assert buckets[0].endswith('le="0.01"} 1') and buckets[-1].endswith('le="+Inf"} 4')
+    assert 'gravity_stage_duration_seconds_sum{stage="pipeline"} 127.305000' in lines
@@ -0,0 +1,55 @@
+import json
+import time
+
+from services.phash_index import PHashIndex
+
+
+def log_lines(path):
+    with open(path, encoding='utf-8') as f:
+        return [json.loads(line) for line in f]
+
+
+def test_add_appends_one_line_and_reloads(tmp_path):
+    path = str(tmp_path / 'phash_index.jsonl')
+    index = PHashIndex(path)
+    index.add(0b1011, {'order_id': 'A1'}, run_no='1')
+    index.add(0b1011, {'order_id': 'A1-new'}, run_no='2')  # Same hash: newest wins
+    index.add(0b0100, {'order_id': 'B1'}, run_no='3')
+    assert len(log_lines(path)) == 3
+
+    reloaded = PHashIndex(path)
+    assert reloaded.stats()['entries'] == 2
+    distance, entry = reloaded.find_near(0b1010)
+    assert distance == 1 and entry['order_id'] == 'A1-new'
+
+
+def test_compaction_caps_entries(tmp_path):
+    path = str(tmp_path / 'phash_index.jsonl')
+    index = PHashIndex(path, max_entries=10)
+    for i in range(40):
+        index.add(1 << i, {'order_id': f'O{i}'})
+    assert index.stats()['entries'] <= 15
+    assert len(log_lines(path)) == index.stats()['log_lines'] <= 15
+    # Newest entries survive
+    assert index.find_near(1 << 39, max_distance=0)[1]['order_id'] == 'O39'
+    assert PHashIndex(path, max_entries=10).stats()['entries'] <= 10
+
+
+def test_expired_entries_are_ignored_and_dropped(tmp_path):
+    path = str(tmp_path / 'phash_index.jsonl')
+    old = {'key': 'f0', 'data': {}, 'order_id': 'OLD', 'run_no': None, 'sheet_name': None,
+           'saved_at': time.time() - 400 * 86400}
+    with open(path, 'w', encoding='utf-8') as f:
+        f.write(json.dumps(old) + "\n")
+    index = PHashIndex(path, max_age_days=180)
+    assert index.find_near(0xf0) == (None, None)
+    assert index.stats()['entries'] == 0
+
+
+def test_legacy_json_index_is_imported(tmp_path):
+    legacy = {'ff': {'data': {'order_id': 'L1'}, 'order_id': 'L1', 'run_no': '7', 'sheet_name': 'May',
+                     'saved_at': time.time()}}
+    (tmp_path / 'phash_index.json').write_text(json.dumps(legacy), encoding='utf-8')
+    index = PHashIndex(str(tmp_path / 'phash_index.jsonl'))
+    assert index.find_near(0xff)[1]['order_id'] == 'L1'
+    assert [r['key'] for r in log_lines(str(tmp_path / 'phash_index.jsonl'))] == ['ff']
@@ -0,0 +1,87 @@
+import json
+import os
+
+import pytest
+
+from services.replay_service import FixtureRecorder, LatencyModel, ReplayProvider, load_fixture_session
+
+
+class FakeImageService:
+    def __init__(self, tmp_path):
+        self.tmp_path = tmp_path
+
+    def download_image(self, message_id, headers):
+        path = self.tmp_path / f"{message_id}.jpg"
+        path.write_bytes(b'jpeg-bytes')
+        return str(path)
+
+
+class FakeSheetService:
+    def __init__(self):
+        self.checks = 0
+
+    def check_duplicate(self, order_id):
+        self.checks += 1
+        if self.checks > 1:
+            raise Exception('APIError: [429]')
+        return False
+
+
+class FakeProvider:
+    def __init__(self, tmp_path):
+        self.image_service = FakeImageService(tmp_path)
+        self.sheet_service = FakeSheetService()
+        self.config = {'AI_PROVIDER': 'openai'}
+
+
+def record_job(tmp_path):
+    recorder = FixtureRecorder(str(tmp_path / 'fixtures'))
+    recorder.record_webhook(json.dumps({'events': [
+        {'message': {'type': 'image', 'id': 'm1'}, 'source': {'userId': 'U1'}}
+    ]}))
+    provider = recorder.wrap_provider(FakeProvider(tmp_path))
+    provider.image_service.download_image('m1', {'Authorization': 'Bearer secret'})
+    assert provider.sheet_service.check_duplicate('A1') is False
+    with pytest.raises(Exception):
+        provider.sheet_service.check_duplicate('A1')
+    assert provider.config == {'AI_PROVIDER': 'openai'}  # Not a recorded service: passed through
+    return recorder.session_dir
+
+
+def test_recorded_job_is_loaded_without_credentials(tmp_path):
+    session_dir = record_job(tmp_path)
+    jobs = load_fixture_session(session_dir)
+    assert len(jobs) == 1
+    job = jobs[0]
+    assert job['image_ids'] == ['m1'] and job['user_id'] == 'U1'
+    assert os.path.exists(os.path.join(job['dir'], 'images', 'm1.jpg'))
+    download = job['calls'][0]
+    assert download['args'] == ['m1'] and download['result'] == 'm1.jpg'
+    assert 'secret' not in json.dumps(job['calls'])
+
+
+def test_replay_answers_in_recorded_order(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)  # ReplayImageService copies into ./temp_images
+    job = load_fixture_session(record_job(tmp_path))[0]
+    timings = []
+    provider = ReplayProvider(job, LatencyModel(scale=0), timings, config={})
+
+    path = provider.image_service.download_image('m1', {})
+    with open(path, 'rb') as f:
+        assert f.read() == b'jpeg-bytes'
+    assert provider.sheet_service.check_duplicate('A1') is False
+    with pytest.raises(Exception, match='429'):
+        provider.sheet_service.check_duplicate('A1')
+    with pytest.raises(Exception, match='429'):
+        provider.sheet_service.check_duplicate('A1')  # The last answer repeats
+    with pytest.raises(AttributeError):
+        provider.drive_service.upload_file('x')
+    assert [name for name, _ in timings][:2] == ['image_service.download_image', 'sheet_service.check_duplicate']
+
+
+def test_latency_model_prefers_method_over_service():
+    latency = LatencyModel(scale=2.0, fixed={'ai_service': 3.0, 'drive_service.upload_file': 0.8})
+    assert latency.delay_for('ai_service', 'extract_with_retry', 1.0) == 3.0
+    assert latency.delay_for('drive_service', 'upload_file', 1.0) == 0.8
+    assert latency.delay_for('drive_service', 'get_folder_name', 0.5) == 1.0
+    assert latency.delay_for('sheet_service', 'get_all_data', None) == 0
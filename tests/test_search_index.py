@@ -0,0 +1,48 @@
+from services.search_index import SearchIndex, normalize_search_text
+
+
+def records(*names):
+    return [{'Run No': str(i + 1), 'Name': n, 'Order ID': f'ORD{i + 1:04d}', 'Status': 'Pending'} for i, n in enumerate(names)]
+
+
+def test_normalize_drops_spaces_and_unifies_thai_vowels():
+    assert normalize_search_text(' สม ชาย ') == 'สมชาย'
+    assert normalize_search_text('นํา') == normalize_search_text('นำ')
+    assert normalize_search_text('ＡＢ１') == 'ab1'
+
+
+def test_search_finds_thai_fragment_without_spaces():
+    index = SearchIndex()
+    index.update_sheet('May', records('สม ชาย ใจดี', 'มานี มีนา'))
+    hits = index.search('ชายใจ')
+    assert [(h['sheet'], h['row'], h['Name']) for h in hits] == [('May', 2, 'สม ชาย ใจดี')]
+
+
+def test_exact_order_id_ranks_first():
+    index = SearchIndex()
+    index.update_sheet('May', records('a', 'b') + [{'Run No': '3', 'Name': 'ORD0001 friend', 'Order ID': 'X9'}])
+    hits = index.search('ord0001')
+    assert hits[0]['Order ID'] == 'ORD0001'
+    assert hits[0]['score'] > hits[1]['score']
+
+
+def test_update_sheet_reindexes_only_changed_rows_and_drops_removed_ones():
+    index = SearchIndex()
+    first = records('alpha', 'bravo', 'charlie')
+    assert index.update_sheet('May', first) == 3
+    assert index.update_sheet('May', first) == 0  # Same snapshot object
+
+    second = records('alpha', 'bravoX')
+    second[0]['Status'] = 'Checked'  # Not searchable: no re-index, result record updated
+    assert index.update_sheet('May', second) == 1
+    assert index.search('charlie') == []
+    assert index.search('alpha')[0]['Status'] == 'Checked'
+    assert index.stats()['docs'] == 2
+
+
+def test_sheets_filter():
+    index = SearchIndex()
+    index.update_sheet('April', records('somchai'))
+    index.update_sheet('May', records('somchai'))
+    assert {h['sheet'] for h in index.search('somchai')} == {'April', 'May'}
+    assert {h['sheet'] for h in index.search('somchai', sheets=['May'])} == {'May'}
@@ -0,0 +1,147 @@
+from services.sheet_replica import SheetReplica
+
+HEADER = ['Image', 'Name', 'Order ID', 'Tracking Number', 'Status']
+
+
+def make_replica(tmp_path):
+    return SheetReplica(str(tmp_path / 'replica.db'))
+
+def sheet_rows(n):
+    return [HEADER] + [['', f'name{i}', f'ORD{i}', f'TH{i}', 'Pending'] for i in range(1, n + 1)]
+
+
+def test_store_is_incremental_and_load_round_trips(tmp_path):
+    replica = make_replica(tmp_path)
+    rows = sheet_rows(5)
+    assert replica.store('sid', 'May', rows) == 6
+    assert replica.store('sid', 'May', rows) == 0  # Unchanged: only fetched_at is bumped
+
+    rows[3][4] = 'Checked'
+    shorter = rows[:5]
+    assert replica.store('sid', 'May', shorter) == 1
+    assert replica.load('sid', 'May').rows == shorter
+
+
+def test_header_change_rekeys_every_row(tmp_path):
+    replica = make_replica(tmp_path)
+    replica.store('sid', 'May', sheet_rows(3))
+    renamed = [['Image', 'Name', 'Tracking Number', 'Order ID', 'Status']] + [r[:2] + [r[3], r[2], r[4]] for r in sheet_rows(3)[1:]]
+    assert replica.store('sid', 'May', renamed) == 4
+    assert replica.find('sid', 'May', order_id='ORD2')[0] == 3
+
+
+def test_find_by_each_key_returns_the_last_match(tmp_path):
+    replica = make_replica(tmp_path)
+    rows = sheet_rows(3) + [['', 'again', 'ORD1', 'TH9', 'Pending']]
+    replica.store('sid', 'May', rows)
+    assert replica.find('sid', 'May', order_id=' ORD1 ') == (5, rows[4])
+    assert replica.find('sid', 'May', tracking='TH2')[0] == 3
+    assert replica.find('sid', 'May', order_id='Order ID') == (None, None)  # Header row never matches
+    assert replica.find('sid', 'May') == (None, None)
+    assert replica.find('sid', 'June', order_id='ORD1') == (None, None)
+
+
+def test_put_row_and_put_cell_apply_writes(tmp_path):
+    replica = make_replica(tmp_path)
+    replica.store('sid', 'May', sheet_rows(2))
+
+    replica.put_cell('sid', 'May', 2, 5, 'Checked')
+    assert replica.find('sid', 'May', order_id='ORD1')[1][4] == 'Checked'
+
+    replica.put_row('sid', 'May', 5, ['', 'new', 'ORD9'])  # Past the end: gap rows load empty
+    loaded = replica.load('sid', 'May').rows
+    assert loaded[3] == [] and loaded[4] == ['', 'new', 'ORD9']
+    assert replica.find('sid', 'May', order_id='ORD9')[0] == 5
+    assert replica.is_fresh('sid', 'May')
+
+    replica.put_cell('sid', 'May', 40, 5, 'Checked')  # Unknown row: the copy is marked stale
+    assert not replica.is_fresh('sid', 'May')
+
+
+def test_image_links_are_cleared_when_the_sheet_changes(tmp_path):
+    replica = make_replica(tmp_path)
+    rows = sheet_rows(2)
+    replica.store('sid', 'May', rows)
+    replica.store_image_links('sid', 'May', ['=IMAGE("a")'])
+    assert replica.load_image_links('sid', 'May') == ['=IMAGE("a")']
+    replica.store('sid', 'May', rows)
+    assert replica.load_image_links('sid', 'May') == ['=IMAGE("a")']
+    replica.store('sid', 'May', sheet_rows(3))
+    assert replica.load_image_links('sid', 'May') is None
+
+
+def test_writes_to_column_a_drop_cached_image_links(tmp_path):
+    replica = make_replica(tmp_path)
+    replica.store('sid', 'May', sheet_rows(2))
+    replica.store_image_links('sid', 'May', ['Image', '=HYPERLINK("a")', '=HYPERLINK("b")'])
+
+    replica.put_cell('sid', 'May', 2, 5, 'Checked')  # Status only: formulas unchanged
+    assert replica.load_image_links('sid', 'May') is not None
+
+    replica.put_row('sid', 'May', 4, ['Check Order 3', 'new', 'ORD3'])  # Row written from column A
+    assert replica.load_image_links('sid', 'May') is None
+
+
+class FakeCell:
+    def __init__(self, value, row=None):
+        self.value = value
+        self.row = row
+
+
+class FakeWorksheet:
+    """Live sheet whose rows moved since the replica copy was taken."""
+    def __init__(self, rows):
+        self.title = 'May'
+        self.rows = rows
+        self.updates = []
+        self.finds = 0
+
+    def cell(self, row, col):
+        cells = self.rows[row - 1] if row <= len(self.rows) else []
+        return FakeCell(cells[col - 1] if col <= len(cells) else None)
+
+    def find(self, value):
+        self.finds += 1
+        for i, row in enumerate(self.rows):
+            if value in row:
+                return FakeCell(value, i + 1)
+        return None
+
+    def row_values(self, row):
+        return self.rows[row - 1]
+
+    def update_cell(self, row, col, value):
+        self.updates.append((row, col, value))
+
+
+def make_sheet_service(tmp_path, monkeypatch, live_rows):
+    import services.sheet_service as sheet_service_module
+    from services.sheet_service import SheetService
+    replica = make_replica(tmp_path)
+    monkeypatch.setattr(sheet_service_module, 'get_sheet_replica', lambda: replica)
+    monkeypatch.setattr(sheet_service_module, 'journal_in_use', lambda: False)
+    service = SheetService(None, 'sid', 'May')
+    service._sheet = FakeWorksheet(live_rows)
+    return service, replica
+
+
+def test_status_update_checks_the_replica_row_against_the_sheet(tmp_path, monkeypatch):
+    live = sheet_rows(3)
+    service, replica = make_sheet_service(tmp_path, monkeypatch, live)
+    replica.store('sid', 'May', live)
+
+    assert service.update_order_status('ORD2', 'Checked')
+    assert service._sheet.updates == [(3, 5, 'Checked')]
+    assert service._sheet.finds == 0  # Replica row confirmed with one cell read
+
+
+def test_status_update_falls_back_to_find_when_rows_moved(tmp_path, monkeypatch):
+    live = sheet_rows(3)
+    service, replica = make_sheet_service(tmp_path, monkeypatch, live)
+    replica.store('sid', 'May', live)
+    live.insert(1, ['', 'inserted by hand', 'ORD0', 'TH0', 'Pending'])  # Everything below moves down
+
+    assert service.update_order_status('ORD2', 'Checked')
+    assert service._sheet.updates == [(4, 5, 'Checked')]
+    assert service._sheet.finds == 1
+    assert not replica.is_fresh('sid', 'May')
@@ -0,0 +1,38 @@
+from services.ai_base_service import AIBaseService
+from services.shop_matcher import ShopMatcher, ShopMatcherRegistry, normalize_shop_text
+
+
+def test_normalize_ignores_case_and_separators():
+    assert normalize_shop_text('Blue Store') == normalize_shop_text('blue_store') == 'bluestore'
+
+
+def test_longest_keyword_wins_over_mapping_order():
+    matcher = ShopMatcher(AIBaseService.SHOP_MAPPING)
+    assert matcher.match('iStudio by Copperwired') == ('iStudio by copperwired', 'exact')
+    assert matcher.match('TRUE 5G Shop') == ('True 5G', 'exact')
+    assert matcher.match('Xiaomi Mall TH') == ('Xiaomi Mall TH', 'exact')
+    assert matcher.match('ร้านไม่มีในระบบ') == (None, None)
+
+
+def test_fuzzy_fallback_only_matches_shop_names():
+    matcher = ShopMatcher({'Geniusmobile': ['geniusmobile'], 'Thorasap': ['thorasap', 'โทรศัพท์']})
+    assert matcher.match('Genuismobile') == ('Geniusmobile', 'fuzzy')
+    # A misspelled generic keyword is not a shop name
+    assert matcher.match('โทรศัพ') == (None, None)
+
+
+def test_registry_keeps_the_matcher_when_rows_are_unchanged():
+    registry = ShopMatcherRegistry({'POCO': ['poco']})
+    rows = [['Shop', 'Keywords'], ['Gravity Phone', 'gravity, กราวิตี้']]
+
+    assert registry.load_rows(rows) is True
+    matcher = registry.matcher
+    assert matcher.match('ร้าน กราวิตี้ สาขา 2') == ('Gravity Phone', 'exact')
+    assert matcher.match('poco official') == ('POCO', 'exact')
+
+    assert registry.load_rows([list(r) for r in rows]) is False
+    assert registry.matcher is matcher  # Memo kept
+
+    assert registry.load_rows(rows + [['Mobile Hub', 'mhub']]) is True
+    assert registry.matcher is not matcher
+    assert registry.matcher.match('MHUB') == ('Mobile Hub', 'exact')
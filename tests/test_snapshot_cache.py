@@ -0,0 +1,79 @@
+import threading
+import time
+
+from services.snapshot_cache import SnapshotCache
+
+
+class CountingLoader:
+    """Returns the current `records`; counts calls and can block until released."""
+    def __init__(self, records):
+        self.records = records
+        self.calls = 0
+        self.gate = threading.Event()
+        self.gate.set()
+
+    def __call__(self, sheet):
+        self.calls += 1
+        self.gate.wait(5)
+        return list(self.records)
+
+
+def test_version_changes_only_when_records_change():
+    loader = CountingLoader([{'Order ID': 'A1'}])
+    changed = []
+    cache = SnapshotCache(loader, ttl=0, on_change=changed.append, prefetch=0)
+    first = cache.put('May', loader('May'))
+    same = cache.put('May', [{'Order ID': 'A1'}])
+    other = cache.put('May', [{'Order ID': 'A2'}])
+    assert same.version == first.version
+    assert other.version != first.version
+    assert [s.version for s in changed] == [first.version, other.version]
+
+
+def test_concurrent_misses_share_one_load():
+    loader = CountingLoader([{'Order ID': 'A1'}])
+    loader.gate.clear()
+    cache = SnapshotCache(loader, prefetch=0)
+    results = []
+    threads = [threading.Thread(target=lambda: results.append(cache.get('May'))) for _ in range(8)]
+    for t in threads:
+        t.start()
+    time.sleep(0.1)
+    loader.gate.set()
+    for t in threads:
+        t.join()
+    assert loader.calls == 1
+    assert len({id(s) for s in results}) == 1
+
+
+def test_stale_snapshot_is_served_while_refreshing():
+    loader = CountingLoader([{'Order ID': 'A1'}])
+    cache = SnapshotCache(loader, ttl=10, max_stale=300, prefetch=0)
+    first = cache.get('May')
+    first.fetched_at -= 60  # Stale, not expired
+    loader.records = [{'Order ID': 'A2'}]
+    assert cache.get('May') is first  # Served at once
+    for _ in range(50):
+        if cache.peek('May') is not first:
+            break
+        time.sleep(0.02)
+    assert cache.peek('May').records == [{'Order ID': 'A2'}]
+
+
+def test_failed_load_raises_to_waiting_callers():
+    def loader(sheet):
+        raise RuntimeError('quota')
+    cache = SnapshotCache(loader, prefetch=0)
+    try:
+        cache.get('May')
+        assert False, 'expected the loader error'
+    except RuntimeError as e:
+        assert str(e) == 'quota'
+
+
+def test_least_recently_used_sheet_is_evicted_over_budget():
+    cache = SnapshotCache(CountingLoader([]), memory_budget=1, prefetch=0)
+    cache.put('April', [{'Order ID': 'A1'}])
+    cache.put('May', [{'Order ID': 'B1'}])
+    assert cache.peek('April') is None
+    assert cache.peek('May') is not None
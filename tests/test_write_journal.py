@@ -0,0 +1,155 @@
+from gspread.utils import a1_range_to_grid_range
+
+from services import write_journal as wj
+from services.write_journal import WriteJournal, changed_segments, journal_in_use
+
+
+class FakeSpreadsheet:
+    """Records values.append / values.batchUpdate calls; batch_failures makes batchUpdate raise."""
+    def __init__(self, batch_failures=0, on_append=None):
+        self.appended = []
+        self.batches = []
+        self.batch_failures = batch_failures
+        self.on_append = on_append
+
+    def values_append(self, range_name, params, body):
+        self.appended.append((range_name, body['values']))
+        if self.on_append:
+            self.on_append()
+
+    def values_batch_update(self, body):
+        if self.batch_failures:
+            self.batch_failures -= 1
+            raise Exception('APIError: [429]: Quota exceeded')
+        self.batches.append([(d['range'], d['values']) for d in body['data']])
+
+
+class FakeClient:
+    def __init__(self, spreadsheet):
+        self.spreadsheet = spreadsheet
+
+    def open_by_key(self, key):
+        return self.spreadsheet
+
+
+def make_journal(tmp_path):
+    return WriteJournal(str(tmp_path / 'writes.db'))
+
+def make_due(journal):
+    # Skip the retry backoff
+    journal._conn().execute("UPDATE writes SET available_at = 0")
+
+
+def test_changed_segments_groups_adjacent_cells():
+    assert changed_segments(['a', 'b', 'c', 'd'], ['a', 'X', 'Y', 'd', 'E']) == [(2, ['X', 'Y']), (5, ['E'])]
+    assert changed_segments(['a', 'b'], ['a', 'b']) == []
+    assert changed_segments([], ['', 'x']) == [(2, ['x'])]
+    # Values are compared as shown in the sheet
+    assert changed_segments(['1', 'b'], [1, 'b']) == []
+
+
+def test_overlay_applies_pending_writes_in_order(tmp_path):
+    journal = make_journal(tmp_path)
+    rows = [['Order ID', 'Status'], ['A1', 'Pending'], ['A2', 'Pending']]
+    journal.record_cells('sid', 'Sheet1', 2, 2, ['Checked'])
+    journal.record_cells('sid', 'Sheet1', 2, 2, ['Saved'])
+    journal.record_cells('sid', 'Sheet1', 5, 1, ['A4'])
+    journal.record_append('sid', 'Sheet1', ['A9', 'Pending'])
+    journal.record_cells('sid', 'Other', 3, 2, ['Checked'])
+
+    result = journal.overlay('sid', 'Sheet1', rows)
+    assert result[1] == ['A1', 'Saved']
+    assert result[2] == ['A2', 'Pending']
+    assert result[3] == [] and result[4] == ['A4']
+    assert result[5] == ['A9', 'Pending']
+    assert rows[1] == ['A1', 'Pending']  # The read itself is not modified
+
+    shown = journal.overlay('sid', 'Sheet1', rows, display=lambda cells, col: [str(c).lower() for c in cells])
+    assert shown[1] == ['A1', 'saved']
+
+
+def test_flush_coalesces_cell_writes(tmp_path):
+    journal = make_journal(tmp_path)
+    spreadsheet = FakeSpreadsheet()
+    for row in (2, 3):
+        journal.record_cells('sid', 'Sheet1', row, 15, ['Checked'])
+    journal.record_cells('sid', 'Sheet1', 2, 15, ['Pending'])
+    journal.record_cells('sid', 'Sheet1', 4, 8, ['shop', '10.00'])
+    journal.record_cells('sid', 'Sheet1', 4, 10, ['0.00'])
+
+    assert journal.flush(FakeClient(spreadsheet)) == {'writes': 5, 'calls': 1}
+    assert spreadsheet.batches == [[
+        ("'Sheet1'!O2:O2", [['Pending']]),
+        ("'Sheet1'!O3:O3", [['Checked']]),
+        ("'Sheet1'!H4:J4", [['shop', '10.00', '0.00']]),
+    ]]
+    assert journal.pending('sid', 'Sheet1') == []
+
+
+def test_partial_failure_does_not_resend_appends(tmp_path):
+    journal = make_journal(tmp_path)
+    spreadsheet = FakeSpreadsheet(batch_failures=1)
+    journal.record_append('sid', 'Sheet1', ['NEW1', 'Pending'])
+    journal.record_cells('sid', 'Sheet1', 2, 2, ['Checked'])
+
+    assert journal.flush(FakeClient(spreadsheet)) == {'writes': 1, 'calls': 1}
+    assert spreadsheet.appended == [("'Sheet1'", [['NEW1', 'Pending']])]
+    # Only the unsent cell write is still pending, and it is backing off
+    assert journal.pending('sid', 'Sheet1') == [('cells', 2, 2, ['Checked'])]
+    assert journal.flush(FakeClient(spreadsheet)) == {'writes': 0, 'calls': 0}
+
+    make_due(journal)
+    assert journal.flush(FakeClient(spreadsheet)) == {'writes': 1, 'calls': 1}
+    assert len(spreadsheet.appended) == 1
+    assert spreadsheet.batches == [[("'Sheet1'!B2:B2", [['Checked']])]]
+    assert journal.pending('sid', 'Sheet1') == []
+
+
+def test_failing_writes_are_never_dropped(tmp_path):
+    journal = make_journal(tmp_path)
+    spreadsheet = FakeSpreadsheet(batch_failures=20)
+    journal.record_cells('sid', 'Sheet1', 2, 2, ['Checked'])
+    for _ in range(12):
+        make_due(journal)
+        journal.flush(FakeClient(spreadsheet))
+
+    # Still pending, still visible to readers
+    assert journal.pending('sid', 'Sheet1') == [('cells', 2, 2, ['Checked'])]
+    assert journal.overlay('sid', 'Sheet1', [['h', 'Status'], ['x', 'Pending']])[1] == ['x', 'Checked']
+    assert journal.stats()['pending']['attempts'] == 12
+
+
+def test_overlay_does_not_repeat_an_append_the_sheet_already_has(tmp_path):
+    journal = make_journal(tmp_path)
+    journal.record_append('sid', 'Sheet1', ['NEW1', 'Pending'])
+    journal.record_cells('sid', 'Sheet1', 3, 2, ['Checked'])
+    reads = []
+    # A reader between values.append returning and the entry being deleted: the sheet has the row
+    sheet_rows = [['Order ID', 'Status'], ['A1', 'Pending'], ['NEW1', 'Pending']]
+    spreadsheet = FakeSpreadsheet(on_append=lambda: reads.append(journal.overlay('sid', 'Sheet1', sheet_rows)))
+
+    journal.flush(FakeClient(spreadsheet))
+    assert reads == [[['Order ID', 'Status'], ['A1', 'Pending'], ['NEW1', 'Checked']]]
+    # Before the append was sent the read does not have the row yet: it is overlaid
+    journal.record_append('sid', 'Sheet1', ['NEW2', 'Pending'])
+    assert journal.overlay('sid', 'Sheet1', sheet_rows)[-1] == ['NEW2', 'Pending']
+
+
+def test_writes_left_by_an_earlier_run_are_replayed(tmp_path, monkeypatch):
+    path = str(tmp_path / 'writes.db')
+    monkeypatch.setenv('WRITE_JOURNAL_PATH', path)
+    monkeypatch.setenv('WRITE_FLUSH_INTERVAL', '0')
+    assert not journal_in_use()  # Write-behind off and no journal file
+
+    WriteJournal(path).record_cells('sid', 'Sheet1', 2, 2, ['Checked'])
+    # Restarted with write-behind off: the journal is still in use until it is drained
+    journal = WriteJournal(path)
+    monkeypatch.setattr(wj, '_write_journal_instance', journal)
+    assert journal_in_use()
+    spreadsheet = FakeSpreadsheet()
+    assert journal.flush(FakeClient(spreadsheet)) == {'writes': 1, 'calls': 1}
+    assert spreadsheet.batches == [[("'Sheet1'!B2:B2", [['Checked']])]]
+    assert not journal_in_use()
+
+    monkeypatch.setenv('WRITE_FLUSH_INTERVAL', '2')
+    assert journal_in_use()
@@ -0,0 +1,26 @@
+# Standalone extraction worker: `python worker.py` (Procfile `worker:` process)
+# Separate service: set the same REDIS_URL on the web and worker services and EXTRACTION_WORKER=external
+# on the web service, which then only enqueues. Without REDIS_URL the queue is the local JOB_QUEUE_PATH
+# file, which only a process on the same machine and disk can reach (set JOB_QUEUE_PATH explicitly).
+import os
+import sys
+from dotenv import load_dotenv
+
+load_dotenv()
+
+current_dir = os.path.dirname(os.path.abspath(__file__))
+if current_dir not in sys.path:
+    sys.path.append(current_dir)
+
+from routes.bot import job_handlers
+from services.job_queue import get_job_queue, JobWorker
+
+if __name__ == '__main__':
+    concurrency = int(os.getenv('EXTRACTION_CONCURRENCY', '2'))
+    job_queue = get_job_queue()
+    if not job_queue.shared and not os.getenv('JOB_QUEUE_PATH'):
+        # A worker on its own host would poll a private jobs.db that no web process writes to
+        print("❌ Extraction worker needs a shared queue: set REDIS_URL (or JOB_QUEUE_PATH on the web tier's machine)")
+        sys.exit(1)
+    print(f"DEBUG: Extraction worker starting (concurrency={concurrency}, queue={job_queue.location}, pending={job_queue.stats()})")
+    JobWorker(job_queue, job_handlers(), concurrency=concurrency).run_forever()